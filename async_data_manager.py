@@ -0,0 +1,220 @@
+import os
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from data_manager import DataManager
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+# Entries handed out per step by iter_entries; also the unseal batch size
+ENTRY_BATCH_SIZE = 256
+
+class AddCancelled(Exception):
+    """Raised into a file being staged by add_file once it is cancelled.
+
+    An Exception rather than CancelledError so DataManager's cleanup runs.
+    """
+
+class AsyncDataManager:
+    """asyncio facade over a DataManager.
+
+    Blocking work runs on a thread pool: AES, Scrypt and zlib release the
+    GIL, so encryption, file transfers and reads overlap with each other and
+    with the event loop. Mutations go through one queue and are applied
+    strictly in the order they were awaited, one at a time, so concurrent
+    coroutines never interleave writes to the vault. Each mutation leaves
+    the queue as soon as it is applied; waiting for it to become durable
+    happens off the queue, so mutations arriving together share a log
+    write and fsync. Large files are encrypted before they join the queue
+    and only their commit is serialized.
+
+    Cancelling a coroutine only stops it waiting: a mutation that has been
+    queued is still applied. add_file cancelled while its file is being
+    encrypted stops the encryption and removes what was stored.
+    """
+
+    def __init__(self, data_manager: DataManager = None, data_dir=None, backend=None,
+                 executor: ThreadPoolExecutor = None):
+        self.data_manager = data_manager or DataManager(data_dir, backend)
+        self._own_executor = executor is None
+        self.executor = executor or ThreadPoolExecutor(
+            max_workers=(os.cpu_count() or 1) + 4, thread_name_prefix="vault-async"
+        )
+        # Created on first use, inside the running loop
+        self._queue = None
+        self._worker = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _run(self, func, *args, **kwargs):
+        """Run a blocking call on the executor."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(func, *args, **kwargs))
+
+    async def _mutate(self, func, *args, **kwargs):
+        """Queue a mutation, then wait until it is applied and durable.
+
+        func should not wait for durability itself (wait=False); if it
+        returns the commit's Future, that is awaited here instead.
+        """
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._apply_mutations())
+        applied = loop.create_future()
+        self._queue.put_nowait((partial(func, *args, **kwargs), applied))
+        result = await asyncio.shield(applied)
+        if isinstance(result, Future):
+            await asyncio.shield(asyncio.wrap_future(result))
+        return result
+
+    async def _apply_mutations(self):
+        """Apply queued mutations one at a time, in order."""
+        while True:
+            mutation, applied = await self._queue.get()
+            try:
+                result = await self._run(mutation)
+            except Exception as e:
+                applied.set_exception(e)
+            else:
+                applied.set_result(result)
+            finally:
+                self._queue.task_done()
+
+    async def set_master_password(self, password: str):
+        """Set the master password of a new vault."""
+        await self._run(self.data_manager.set_master_password, password)
+
+    async def unlock(self, password: str) -> bool:
+        """Verify the master password and load the vault."""
+        return await self._run(self.data_manager.verify_master_password, password)
+
+    async def change_master_password(self, old_password: str, new_password: str) -> bool:
+        """Change the master password; see DataManager.change_master_password."""
+        return await self._mutate(self.data_manager.change_master_password,
+                                  old_password, new_password)
+
+    async def rotate_data_key(self, password: str) -> bool:
+        """Re-key the vault; see DataManager.rotate_data_key.
+
+        Returns once the entries are resealed; files are re-encrypted in
+        the background afterwards.
+        """
+        return await self._mutate(self.data_manager.rotate_data_key, password) is not False
+
+    def is_first_run(self) -> bool:
+        return self.data_manager.is_first_run()
+
+    async def add_entry(self, name: str, username: str, password: str, notes: str = ""):
+        """Add a password entry; returns once it is durable."""
+        await self._mutate(self.data_manager.add_entry, name, username, password, notes,
+                           wait=False)
+
+    async def update_entry(self, name: str, **fields):
+        """Change fields of an existing entry; returns once it is durable."""
+        await self._mutate(partial(self.data_manager.update_entry, name, wait=False, **fields))
+
+    async def delete_entry(self, name: str):
+        """Delete an entry and its file data; returns once it is durable."""
+        await self._mutate(self.data_manager.delete_entry, name, wait=False)
+
+    async def add_file(self, name: str, file_path: str, notes: str = "", progress=None):
+        """Encrypt and add a file; returns once its entry is durable.
+
+        progress works as for DataManager.add_file and is called from a
+        worker thread.
+        """
+        cancelled = threading.Event()
+
+        def report(nbytes: int):
+            if cancelled.is_set():
+                raise AddCancelled()
+            if progress is not None:
+                progress(nbytes)
+
+        stage = asyncio.ensure_future(
+            self._run(self.data_manager.stage_file, name, file_path, notes, report)
+        )
+        try:
+            batch = await asyncio.shield(stage)
+        except asyncio.CancelledError:
+            # The encryption stops at its next progress report and cleans up
+            # after itself; a file that was already stored is dropped here
+            cancelled.set()
+            stage.add_done_callback(self._discard_staged)
+            raise
+        await self._mutate(self.data_manager.commit_batch, batch, wait=False)
+
+    def _discard_staged(self, stage: asyncio.Future):
+        if not stage.cancelled() and stage.exception() is None:
+            self.executor.submit(self.data_manager.discard_batch, stage.result())
+
+    async def get_file(self, name: str, output_path: str, progress=None):
+        """Decrypt a stored file to output_path."""
+        await self._run(self.data_manager.get_file, name, output_path, progress)
+
+    async def read_range(self, name: str, offset: int, length: int) -> bytes:
+        """Decrypt part of a stored file; see DataManager.read_range."""
+        return await self._run(self.data_manager.read_range, name, offset, length)
+
+    async def get_entry(self, name: str) -> dict:
+        """An entry with its secrets unsealed, or None."""
+        return await self._run(self.data_manager.get_entry, name)
+
+    async def iter_entries(self, entry_type: str = None, unseal: bool = False,
+                           batch_size: int = ENTRY_BATCH_SIZE):
+        """Yield (name, entry) pairs without holding up the event loop.
+
+        The entries are taken as they are when iteration starts, from the
+        snapshot get_all_entries copies under the vault lock, so mutations
+        applied meanwhile on other executor threads don't disturb it.
+        Metadata is handed out in batches with a yield to the loop in
+        between; with unseal set each batch's secrets are decrypted on the
+        executor.
+        """
+        entries = await self._run(self.data_manager.get_all_entries)
+        items = list(entries.items())
+        if entry_type is not None:
+            items = [(name, entry) for name, entry in items if entry['type'] == entry_type]
+        for start in range(0, len(items), batch_size):
+            batch = items[start:start + batch_size]
+            if unseal:
+                batch = await self._run(
+                    lambda batch=batch: [(name, self.data_manager.unseal_entry(entry))
+                                         for name, entry in batch]
+                )
+            else:
+                await asyncio.sleep(0)
+            for item in batch:
+                yield item
+
+    async def flush(self):
+        """Wait until every mutation queued so far is applied and durable."""
+        if self._queue is not None:
+            await self._queue.join()
+        await self._run(self.data_manager.flush)
+
+    async def compact(self):
+        """Fold the record log into a new snapshot."""
+        await self._run(self.data_manager.compact, background=False)
+
+    async def close(self):
+        """Flush pending mutations and release the executor."""
+        await self.flush()
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        if self._own_executor:
+            self.executor.shutdown(wait=True)
@@ -0,0 +1,462 @@
+"""Headless benchmarks for Digital Safe's crypto and storage layers.
+
+Run ``python benchmarks.py <command> --help`` for the options of each command:
+
+    kdf     Scrypt cost curve on this machine and the calibrated parameters
+    batch   Per-call versus batched record encryption throughput
+    compression
+            Compression ratio against throughput per codec and level, and
+            whether sampling would compress each kind of data at all
+    memory  Memory held by the unlocked vault's entries, as dicts versus
+            compact Entry records
+    suite   CryptoManager and DataManager benchmarks with JSON results and
+            regression checks against a baseline
+
+A typical regression check saves a baseline once and compares later runs:
+
+    python benchmarks.py suite --output baseline.json
+    python benchmarks.py suite --baseline baseline.json --threshold 0.15
+
+The suite exits with status 1 if any benchmark is slower than its baseline
+by more than the threshold.
+"""
+import os
+import sys
+import json
+import base64
+import time
+import random
+import logging
+import argparse
+import platform
+import tempfile
+import statistics
+import tracemalloc
+from datetime import datetime, timezone
+import cryptography
+from crypto import (CryptoManager, SCRYPT_N, SCRYPT_R, SCRYPT_P, KDF_TARGET_SECONDS,
+                    KDF_MAX_MEMORY, CODEC_NONE, CODEC_ZLIB, CODEC_LZMA, benchmark_kdf,
+                    calibrate_kdf, scrypt_memory, sample_ratio, compress_payload,
+                    decompress_payload)
+from data_manager import DataManager
+from entry_codec import pack_entries, unpack_entries
+from entry_model import entry_rows, gc_paused
+from parallel_crypto import ParallelCryptoEngine
+
+KB = 1024
+MB = 1024 * 1024
+
+# Cheap Scrypt cost for setting up benchmark vaults; the KDF itself is
+# measured separately with the default parameters
+SETUP_SCRYPT_N = 2**10
+
+# Entries per DataManager.batch() in the bulk import benchmark
+BATCH_IMPORT_ENTRIES = 1000
+
+# File re-added under new names to measure deduplicated adds
+DEDUP_FILE_SIZE = 16 * MB
+
+def unlocked_crypto(crypto: CryptoManager = None) -> CryptoManager:
+    """Unlock a CryptoManager with a throwaway password and a cheap KDF."""
+    crypto = crypto or CryptoManager()
+    crypto.salt = os.urandom(16)
+    crypto.scrypt_n = SETUP_SCRYPT_N
+    crypto.derive_key("benchmark")
+    return crypto
+
+def timed(func, *args):
+    """Run func once and return (result, seconds)."""
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+def bench_kdf(args):
+    """Print the Scrypt cost curve and the parameters calibration would pick."""
+    max_memory = args.max_memory_mb * MB
+    print(f"Scrypt cost curve (r={args.r}, p={SCRYPT_P})")
+    print(f"{'N':>10} {'memory':>10} {'seconds':>9}")
+    for log2_n in range(args.min_log2_n, args.max_log2_n + 1):
+        n = 2 ** log2_n
+        memory = scrypt_memory(n, args.r)
+        if memory > max_memory:
+            break
+        seconds = benchmark_kdf(n, args.r, SCRYPT_P)
+        print(f"{'2**' + str(log2_n):>10} {memory // MB:>7} MB {seconds:>9.3f}")
+
+    (n, r, p), _ = calibrate_kdf(args.target, max_memory, args.r)
+    print()
+    print(f"Calibrated for {args.target}s within {args.max_memory_mb} MB: "
+          f"n=2**{n.bit_length() - 1}, r={r}, p={p}")
+    return 0
+
+def bench_batch(args):
+    """Compare per-call encrypt/decrypt with encrypt_many/decrypt_many."""
+    crypto = unlocked_crypto()
+    print(f"Record encryption, {args.record_size}-byte records")
+    print(f"{'records':>10} {'mode':>9} {'encrypt/s':>12} {'decrypt/s':>12}")
+    for count in args.records:
+        records = [os.urandom(args.record_size) for _ in range(count)]
+
+        encrypted, encrypt_seconds = timed(lambda: [crypto.encrypt_bytes(r) for r in records])
+        _, decrypt_seconds = timed(lambda: [crypto.decrypt_bytes(r) for r in encrypted])
+        print(f"{count:>10} {'per-call':>9} {count / encrypt_seconds:>12,.0f} "
+              f"{count / decrypt_seconds:>12,.0f}")
+
+        encrypted, encrypt_seconds = timed(crypto.encrypt_many, records)
+        decrypted, decrypt_seconds = timed(crypto.decrypt_many, encrypted)
+        assert decrypted == records
+        print(f"{count:>10} {'batched':>9} {count / encrypt_seconds:>12,.0f} "
+              f"{count / decrypt_seconds:>12,.0f}")
+    return 0
+
+# Codec and level pairs compared by the compression benchmark
+COMPRESSION_SETTINGS = [
+    ('zlib', CODEC_ZLIB, 1), ('zlib', CODEC_ZLIB, 6), ('zlib', CODEC_ZLIB, 9),
+    ('lzma', CODEC_LZMA, 0), ('lzma', CODEC_LZMA, 6),
+]
+
+def compression_datasets(size: int) -> dict:
+    """Sample payloads of about size bytes, from very to not compressible."""
+    rng = random.Random(0)
+    rows = []
+    length = 0
+    while length < size:
+        i = len(rows)
+        rows.append(f"{i},{rng.choice(['alice', 'bob', 'carol'])},"
+                    f"{rng.randint(0, 10**6)},{rng.random():.6f},2024-01-{i % 28 + 1:02d}\n")
+        length += len(rows[-1])
+    text = "".join(rows).encode()[:size]
+    vault = json.dumps(synthetic_entries(max(size // 150, 1))).encode()[:size]
+    # Random bytes stand in for JPEG, ZIP and MP4 payloads
+    noise = os.urandom(size)
+    mixed = text[:size // 2] + noise[:size - size // 2]
+    return {'csv text': text, 'vault json': vault, 'incompressible': noise, 'half/half': mixed}
+
+def bench_compression(args):
+    """Print ratio and throughput for each codec and level over sample data."""
+    size = args.size_mb * MB
+    print(f"Compression of {args.size_mb} MB payloads (ratio = compressed / original)")
+    print(f"{'data':<16} {'sample':>7} {'codec':>8} {'ratio':>7} "
+          f"{'compress':>13} {'decompress':>13}")
+    for label, data in compression_datasets(size).items():
+        sample = sample_ratio(data)
+        for codec_name, codec, level in COMPRESSION_SETTINGS:
+            (used, _, payload), compress_seconds = timed(compress_payload, data, codec, level)
+            restored, decompress_seconds = timed(decompress_payload, used, payload)
+            assert restored == data
+            setting = f"{codec_name}-{level}" if used != CODEC_NONE else "skipped"
+            print(f"{label:<16} {sample:>7.2f} {setting:>8} {len(payload) / len(data):>7.3f} "
+                  f"{len(data) / compress_seconds / 1_000_000:>8.1f} MB/s "
+                  f"{len(data) / decompress_seconds / 1_000_000:>8.1f} MB/s")
+    return 0
+
+def sealed_entries(count: int) -> dict:
+    """synthetic_entries as stored: secrets replaced by a sealed field.
+
+    The sealed field is random base64 of the usual length rather than real
+    ciphertext, which keeps a million entries quick to build.
+    """
+    entries = synthetic_entries(count)
+    for entry in entries.values():
+        secrets = [entry.pop(field) for field in ('password', 'notes') if field in entry]
+        if secrets:
+            entry['sealed'] = base64.b64encode(os.urandom(28 + len(json.dumps(secrets)))).decode()
+    return entries
+
+def bench_memory(args):
+    """Print the memory entries take once loaded, per representation."""
+    print(f"{'entries':>10} {'model':>7} {'memory':>11} {'per entry':>10} {'unpack':>10}")
+    for count in args.sizes:
+        payload = pack_entries(sealed_entries(count))
+        for label, make_rows in (('dict', None), ('Entry', entry_rows)):
+            # Paused as DataManager.load_data pauses it
+            with gc_paused():
+                _, seconds = timed(unpack_entries, payload, make_rows)
+            tracemalloc.start()
+            entries = unpack_entries(payload, make_rows)
+            memory, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            del entries
+            print(f"{count:>10} {label:>7} {memory / MB:>8.1f} MB {memory / count:>8.0f} B "
+                  f"{seconds * 1000:>7.0f} ms")
+    return 0
+
+class Suite:
+    """Runs named benchmarks and collects their median timings."""
+
+    def __init__(self, repeat: int):
+        self.repeat = repeat
+        self.results = {}
+
+    def measure(self, name: str, func, nbytes: int = None, ops: int = None,
+                repeat: int = None, number: int = 1):
+        """Time func repeat times and record the median time per call.
+
+        Each timing runs func number times, which keeps very fast calls
+        above timer resolution. nbytes and ops, when given, are the work
+        done per call and are used to report MB/s and operations per second.
+        """
+        times = []
+        for _ in range(repeat or self.repeat):
+            start = time.perf_counter()
+            for _ in range(number):
+                func()
+            times.append((time.perf_counter() - start) / number)
+        seconds = statistics.median(times)
+        result = {'seconds': seconds}
+        line = f"{name:<40} {seconds * 1000:>12.4f} ms"
+        if nbytes is not None and seconds > 0:
+            result['mb_per_s'] = nbytes / seconds / 1_000_000
+            line += f" {result['mb_per_s']:>10.1f} MB/s"
+        if ops is not None and seconds > 0:
+            result['ops_per_s'] = ops / seconds
+            line += f" {result['ops_per_s']:>12,.0f} ops/s"
+        self.results[name] = result
+        print(line)
+        return result
+
+def write_test_file(path, size: int):
+    """Write size bytes of incompressible data without holding it in memory.
+
+    AES throughput does not depend on content, so one random megabyte is
+    repeated.
+    """
+    block = os.urandom(MB)
+    with open(path, 'wb') as f:
+        remaining = size
+        while remaining > 0:
+            f.write(block[:min(remaining, MB)])
+            remaining -= MB
+
+def synthetic_entries(count: int) -> dict:
+    """Build a vault of count entries, one in ten of them files."""
+    entries = {}
+    for i in range(count):
+        if i % 10 == 9:
+            entries[f"file-{i}"] = {
+                'type': 'file',
+                'original_name': f"document-{i}.pdf",
+                'encrypted_path': f"/nonexistent/file-{i}.enc",
+                'size': 1000 + i,
+                'notes': ""
+            }
+        else:
+            entries[f"site-{i}.example.com"] = {
+                'type': 'password',
+                'username': f"user{i}@example.com",
+                'password': f"pw-{i:08d}-Xy!9q",
+                'notes': "synthetic entry"
+            }
+    return entries
+
+def suite_crypto(suite: Suite, args, workdir: str):
+    """CryptoManager: KDF, in-memory encryption and file encryption."""
+    crypto = CryptoManager()
+    crypto.salt = os.urandom(16)
+    crypto.scrypt_n, crypto.scrypt_r, crypto.scrypt_p = SCRYPT_N, SCRYPT_R, SCRYPT_P
+    suite.measure("crypto.kdf", lambda: crypto.derive_key("benchmark"))
+
+    for size_kb in args.data_sizes_kb:
+        size = size_kb * KB
+        payload = "a" * size
+        encrypted = crypto.encrypt_data(payload)
+        # Process at least a megabyte per timing
+        number = max(1, MB // size)
+        suite.measure(f"crypto.encrypt_data[{size_kb}KB]",
+                      lambda: crypto.encrypt_data(payload), nbytes=size, number=number)
+        suite.measure(f"crypto.decrypt_data[{size_kb}KB]",
+                      lambda: crypto.decrypt_data(encrypted), nbytes=size, number=number)
+
+    engine = ParallelCryptoEngine(crypto)
+    source = os.path.join(workdir, "source.bin")
+    encrypted_path = os.path.join(workdir, "source.enc")
+    output = os.path.join(workdir, "output.bin")
+    for size_mb in args.file_sizes_mb:
+        size = size_mb * MB
+        write_test_file(source, size)
+        # Large files are slow enough that one run is representative
+        repeat = 1 if size_mb >= 1024 else None
+        suite.measure(f"crypto.encrypt_file[{size_mb}MB]",
+                      lambda: engine.encrypt_file(source, encrypted_path),
+                      nbytes=size, repeat=repeat)
+        suite.measure(f"crypto.decrypt_file[{size_mb}MB]",
+                      lambda: engine.decrypt_file(encrypted_path, output),
+                      nbytes=size, repeat=repeat)
+        for path in (source, encrypted_path, output):
+            os.remove(path)
+
+def suite_vault(suite: Suite, args, workdir: str):
+    """DataManager: load, save and mutations on synthetic vaults."""
+    attachment = os.path.join(workdir, "attachment.bin")
+    write_test_file(attachment, 64 * KB)
+    document = os.path.join(workdir, "document.bin")
+    write_test_file(document, DEDUP_FILE_SIZE)
+
+    for count in args.vault_sizes:
+        data_manager = DataManager(data_dir=os.path.join(workdir, f"vault-{count}"))
+        unlocked_crypto(data_manager.crypto)
+        data_manager.load_data()
+        data_manager.entries = {name: data_manager.seal_entry(entry)
+                                for name, entry in synthetic_entries(count).items()}
+        data_manager.save_data()
+        nbytes = sum(path.stat().st_size for path in data_manager.shards.shards_dir.iterdir())
+
+        suite.measure(f"vault.save_data[{count}]", lambda: data_manager.save_data(full=True),
+                      nbytes=nbytes)
+        suite.measure(f"vault.load_data[{count}]", data_manager.load_data, nbytes=nbytes)
+
+        # A save after one mutation only rewrites that entry's shard
+        touched = f"site-{count // 3}.example.com"
+        def save_one_change():
+            data_manager.update_entry(touched, username=f"user-{next(counter)}")
+            data_manager.save_data()
+        counter = iter(range(10**9))
+        suite.measure(f"vault.save_data_one_change[{count}]", save_one_change)
+
+        # Serialization alone, next to the JSON it replaced
+        snapshot = {name: dict(entry) for name, entry in data_manager.entries.items()}
+        packed = pack_entries(snapshot)
+        dumped = json.dumps(snapshot).encode()
+        suite.measure(f"vault.pack_entries[{count}]", lambda: pack_entries(snapshot), ops=count)
+        suite.measure(f"vault.unpack_entries[{count}]", lambda: unpack_entries(packed), ops=count)
+        suite.measure(f"vault.json_dumps[{count}]", lambda: json.dumps(snapshot).encode(), ops=count)
+        suite.measure(f"vault.json_loads[{count}]", lambda: json.loads(dumped), ops=count)
+
+        suite.measure(f"vault.add_entry[{count}]", lambda: data_manager.add_entry(
+            f"new-{next(counter)}", "user", "password", "notes"
+        ))
+        suite.measure(f"vault.add_file[{count}]", lambda: data_manager.add_file(
+            f"new-file-{next(counter)}", attachment
+        ))
+
+        # Every chunk of the document is already stored after the first add
+        data_manager.add_file("document", document)
+        suite.measure(f"vault.readd_file[{count}]", lambda: data_manager.add_file(
+            f"document-{next(counter)}", document
+        ), nbytes=DEDUP_FILE_SIZE)
+
+        def batch_import():
+            with data_manager.batch():
+                for _ in range(BATCH_IMPORT_ENTRIES):
+                    data_manager.add_entry(f"import-{next(counter)}", "user", "password", "notes")
+        suite.measure(f"vault.batch_add_entry[{count}]", batch_import, ops=BATCH_IMPORT_ENTRIES)
+
+        sqlite_manager = DataManager(data_dir=os.path.join(workdir, f"vault-sqlite-{count}"),
+                                     backend='sqlite')
+        unlocked_crypto(sqlite_manager.crypto)
+        sqlite_manager.load_data()
+        sqlite_manager.store.apply([(name, sqlite_manager.seal_entry(entry))
+                                    for name, entry in synthetic_entries(count).items()])
+        lookup = f"site-{count // 2}.example.com"
+        suite.measure(f"vault.get_entry[{count}]", lambda: data_manager.get_entry(lookup))
+        suite.measure(f"vault.sqlite.get_entry[{count}]", lambda: sqlite_manager.get_entry(lookup))
+        suite.measure(f"vault.sqlite.get_all_entries[{count}]", sqlite_manager.get_all_entries,
+                      ops=count)
+        suite.measure(f"vault.sqlite.add_entry[{count}]", lambda: sqlite_manager.add_entry(
+            f"new-{next(counter)}", "user", "password", "notes"
+        ))
+        sqlite_manager.store.close()
+
+def compare_results(results: dict, baseline: dict, threshold: float) -> list:
+    """Print current timings against a baseline and return the regressions."""
+    regressions = []
+    print()
+    print(f"{'benchmark':<40} {'current ms':>12} {'baseline ms':>12} {'change':>8}")
+    for name, result in results.items():
+        if name not in baseline:
+            print(f"{name:<40} {result['seconds'] * 1000:>12.4f} {'-':>12} {'new':>8}")
+            continue
+        before = baseline[name]['seconds']
+        change = (result['seconds'] - before) / before if before > 0 else 0.0
+        status = ""
+        if change > threshold:
+            status = "  REGRESSION"
+            regressions.append(name)
+        print(f"{name:<40} {result['seconds'] * 1000:>12.4f} {before * 1000:>12.4f} {change:>+8.1%}{status}")
+    return regressions
+
+def bench_suite(args):
+    """Run the benchmark suite, save JSON results and check for regressions."""
+    suite = Suite(args.repeat)
+    with tempfile.TemporaryDirectory(prefix="digital-safe-bench-") as workdir:
+        if args.only in (None, 'crypto'):
+            suite_crypto(suite, args, workdir)
+        if args.only in (None, 'vault'):
+            suite_vault(suite, args, workdir)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'cryptography': cryptography.__version__,
+        },
+        'results': suite.results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare_results(suite.results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} benchmark(s) regressed by more than {args.threshold:.0%}")
+            return 1
+    return 0
+
+def main(argv=None):
+    # The crypto modules log every call at DEBUG, which would drown the results
+    logging.disable(logging.DEBUG)
+
+    parser = argparse.ArgumentParser(description="Digital Safe benchmarks")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    kdf = commands.add_parser('kdf', help="Scrypt cost curve and calibration")
+    kdf.add_argument('--target', type=float, default=KDF_TARGET_SECONDS,
+                     help="target unlock time in seconds")
+    kdf.add_argument('--max-memory-mb', type=int, default=KDF_MAX_MEMORY // MB,
+                     help="memory budget for one KDF run")
+    kdf.add_argument('--r', type=int, default=SCRYPT_R, help="Scrypt block size")
+    kdf.add_argument('--min-log2-n', type=int, default=10)
+    kdf.add_argument('--max-log2-n', type=int, default=20)
+    kdf.set_defaults(func=bench_kdf)
+
+    batch = commands.add_parser('batch', help="per-call vs batched record encryption")
+    batch.add_argument('--records', type=int, nargs='+', default=[10_000, 1_000_000],
+                       help="batch sizes to measure")
+    batch.add_argument('--record-size', type=int, default=64, help="bytes per record")
+    batch.set_defaults(func=bench_batch)
+
+    compression = commands.add_parser('compression', help="codec ratio vs throughput")
+    compression.add_argument('--size-mb', type=int, default=16, help="payload size per dataset")
+    compression.set_defaults(func=bench_compression)
+
+    memory = commands.add_parser('memory', help="memory held by loaded entries")
+    memory.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000],
+                        help="entry counts to measure")
+    memory.set_defaults(func=bench_memory)
+
+    suite = commands.add_parser('suite', help="crypto and vault benchmarks with JSON output")
+    suite.add_argument('--only', choices=['crypto', 'vault'], help="run one half of the suite")
+    suite.add_argument('--repeat', type=int, default=3, help="runs per benchmark (median is kept)")
+    suite.add_argument('--data-sizes-kb', type=int, nargs='+', default=[1, 64, 1024, 16384],
+                       help="payload sizes for encrypt_data/decrypt_data")
+    suite.add_argument('--file-sizes-mb', type=int, nargs='+', default=[1, 64, 256],
+                       help="file sizes for file encryption (up to 4096 for 4 GB)")
+    suite.add_argument('--vault-sizes', type=int, nargs='+', default=[100, 10_000, 100_000],
+                       help="entry counts of the synthetic vaults (up to 1000000)")
+    suite.add_argument('--output', help="write results to this JSON file")
+    suite.add_argument('--baseline', help="compare against results from this JSON file")
+    suite.add_argument('--threshold', type=float, default=0.15,
+                       help="allowed slowdown before a benchmark counts as a regression")
+    suite.set_defaults(func=bench_suite)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
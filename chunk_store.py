@@ -0,0 +1,413 @@
+import io
+import os
+import hmac
+import struct
+import bisect
+import hashlib
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from cryptography.exceptions import InvalidTag
+from crypto import CryptoManager, CODEC_ZLIB, compress_payload, decompress_payload
+from durable_io import write_durable, fsync_directory
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+# Content-defined chunk sizes. A boundary is the end of the first run of
+# CHUNK_RUN consecutive "selected" bytes after CHUNK_MIN_SIZE; half of all
+# byte values are selected (keyed per vault), so on random data a run turns
+# up about every 2**(CHUNK_RUN + 1) bytes. CHUNK_MAX_SIZE cuts data that
+# never produces one, such as long runs of an unselected byte.
+CHUNK_MIN_SIZE = 256 * 1024
+CHUNK_MAX_SIZE = 4 * 1024 * 1024
+CHUNK_RUN = 19
+READ_SIZE = 8 * 1024 * 1024
+
+# Subkeys: one selects the boundary bytes, one keys the chunk ids
+CHUNK_BOUNDARY_LABEL = b"chunk-boundaries"
+CHUNK_ID_LABEL = b"chunk-id"
+
+# Chunk files start with a plaintext header recording how the chunk was
+# compressed before sealing; the header is authenticated as associated
+# data. Chunks written before compression have no header.
+CHUNK_MAGIC = b"DSCK"
+CHUNK_VERSION = 1
+CHUNK_HEADER = struct.Struct(">4sBBB")  # magic, version, codec, level
+# Files can be large, so chunks favour throughput over ratio
+CHUNK_COMPRESSION_LEVEL = 1
+
+def boundary_table(key: bytes) -> bytes:
+    """bytes.translate table mapping the selected half of byte values to 1.
+
+    The selection is keyed so chunk boundaries, and hence chunk sizes, do
+    not reveal which well-known content a vault holds.
+    """
+    ranked = sorted(range(256), key=lambda b: hmac.new(key, bytes([b]), hashlib.sha256).digest())
+    selected = set(ranked[:128])
+    return bytes(1 if b in selected else 0 for b in range(256))
+
+def iter_chunks(stream, table: bytes, min_size: int = CHUNK_MIN_SIZE,
+                max_size: int = CHUNK_MAX_SIZE, run: int = CHUNK_RUN):
+    """Split a binary stream into content-defined chunks.
+
+    The boundary test runs entirely in C: each block is translated to a 0/1
+    mark per byte and the next boundary is a bytearray.find for a run of
+    marks. Boundaries depend only on nearby content, so an insertion early
+    in a file only changes the chunks around it.
+    """
+    pattern = b"\x01" * run
+    buffer = bytearray()
+    marks = bytearray()
+    eof = False
+    while True:
+        while len(buffer) < max_size and not eof:
+            block = stream.read(READ_SIZE)
+            if not block:
+                eof = True
+                break
+            buffer += block
+            marks += block.translate(table)
+        if not buffer:
+            return
+        if len(buffer) <= min_size and eof:
+            yield bytes(buffer)
+            return
+        found = marks.find(pattern, min_size - run, max_size)
+        cut = found + run if found >= 0 else min(max_size, len(buffer))
+        # Copy the chunk out once, through a view, before shrinking the buffer
+        with memoryview(buffer) as view:
+            chunk = bytes(view[:cut])
+        del buffer[:cut]
+        del marks[:cut]
+        yield chunk
+
+class ChunkStore:
+    """Content-addressed store of encrypted, reference-counted file chunks.
+
+    Chunks are named by an HMAC of their plaintext, compressed when a
+    sample says it pays off, sealed with AES-GCM using the header and id as
+    associated data, and written once: a chunk that is
+    already stored costs a hash and nothing else. Reference counts are
+    derived from the file manifests (rebuild) and adjusted as entries come
+    and go; a chunk file is deleted when its last reference is released.
+    """
+
+    def __init__(self, chunks_dir, crypto: CryptoManager, workers: int = None):
+        self.chunks_dir = Path(chunks_dir)
+        self.crypto = crypto
+        self.workers = workers or os.cpu_count() or 1
+        self.compression_codec = CODEC_ZLIB
+        self.compression_level = CHUNK_COMPRESSION_LEVEL
+        self.refcounts = {}
+        # Chunks being written; acquirers of the same id wait for them
+        self._writing = {}
+        self._lock = threading.Lock()
+        # BlobMigration re-encrypting chunks under a new key, if any; chunks
+        # it has not rewritten yet are read with its source key
+        self.migration = None
+        self._keys_source = None
+        self._table = None
+        self._id_key = None
+
+    def _keys(self):
+        """Boundary table and id key for the current encryption key."""
+        if self._keys_source is not self.crypto.key:
+            self._table = boundary_table(self.crypto.derive_subkey(CHUNK_BOUNDARY_LABEL))
+            self._id_key = self.crypto.derive_subkey(CHUNK_ID_LABEL)
+            self._keys_source = self.crypto.key
+        return self._table, self._id_key
+
+    def path(self, chunk_id: str) -> Path:
+        """On-disk location of a chunk, fanned out over 256 directories."""
+        return self.chunks_dir / chunk_id[:2] / chunk_id
+
+    def rebuild(self, manifests):
+        """Recount references from every file manifest in the vault."""
+        refcounts = {}
+        for chunks in manifests:
+            for chunk_id, _ in chunks:
+                refcounts[chunk_id] = refcounts.get(chunk_id, 0) + 1
+        with self._lock:
+            self.refcounts = refcounts
+        logger.debug(f"Chunk references rebuilt: {len(refcounts)} chunks")
+
+    def collect_garbage(self) -> int:
+        """Delete chunk files nothing refers to, e.g. after a crash mid-add."""
+        removed = 0
+        if not self.chunks_dir.exists():
+            return removed
+        with self._lock:
+            for directory in self.chunks_dir.iterdir():
+                if not directory.is_dir():
+                    continue
+                for path in directory.iterdir():
+                    if path.name not in self.refcounts and path.name not in self._writing:
+                        os.remove(path)
+                        removed += 1
+        if removed:
+            logger.debug(f"Removed {removed} unreferenced chunks")
+        return removed
+
+    def put_file(self, file_path, progress=None, digest=None) -> list:
+        """Chunk, deduplicate and store a file; return its manifest.
+
+        The manifest is a list of [chunk_id, length] pairs. A reference to
+        every listed chunk is held on return; release them if the manifest
+        is not committed after all. progress, if given, is called with the
+        length of each chunk as it is stored; an exception it raises aborts
+        the call and releases the chunks stored so far. digest, a hashlib
+        object, is fed the file's content in the same pass.
+        """
+        table, id_key = self._keys()
+        manifest = []
+        pending = deque()
+        window = max(2 * self.workers, 1)
+        try:
+            with open(file_path, 'rb') as src, ThreadPoolExecutor(max_workers=self.workers) as pool:
+                for chunk in iter_chunks(src, table):
+                    if digest is not None:
+                        digest.update(chunk)
+                    pending.append(pool.submit(self._put_chunk, chunk, id_key))
+                    if len(pending) >= window:
+                        manifest.append(pending.popleft().result())
+                        if progress is not None:
+                            progress(manifest[-1][1])
+                while pending:
+                    manifest.append(pending.popleft().result())
+                    if progress is not None:
+                        progress(manifest[-1][1])
+        except Exception:
+            for future in pending:
+                if future.exception() is None:
+                    manifest.append(future.result())
+            self.release([chunk_id for chunk_id, _ in manifest])
+            raise
+        directories = {self.path(chunk_id).parent for chunk_id, _ in manifest}
+        for directory in directories:
+            fsync_directory(directory)
+        logger.debug(f"Stored file as {len(manifest)} chunks")
+        return manifest
+
+    def _put_chunk(self, chunk: bytes, id_key: bytes) -> list:
+        """Take a reference to a chunk, encrypting and writing it if new.
+
+        A thread storing a chunk another thread is writing waits for that
+        write, and writes the chunk itself if the other one failed.
+        """
+        chunk_id = hmac.new(id_key, chunk, hashlib.sha256).hexdigest()
+        with self._lock:
+            self.refcounts[chunk_id] = self.refcounts.get(chunk_id, 0) + 1
+        path = self.path(chunk_id)
+        try:
+            while True:
+                with self._lock:
+                    writing = self._writing.get(chunk_id)
+                if writing is not None:
+                    writing.wait()
+                    continue
+                # Our reference keeps a chunk on disk from being removed
+                if path.exists():
+                    return [chunk_id, len(chunk)]
+                with self._lock:
+                    if chunk_id in self._writing:
+                        continue
+                    writing = self._writing[chunk_id] = threading.Event()
+                break
+            try:
+                if not path.exists():
+                    path.parent.mkdir(parents=True, exist_ok=True)
+                    temp_path = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+                    write_durable(temp_path, self._seal(chunk, chunk_id))
+                    os.replace(temp_path, path)
+            finally:
+                with self._lock:
+                    self._writing.pop(chunk_id, None)
+                writing.set()
+        except BaseException:
+            self.release([chunk_id])
+            raise
+        return [chunk_id, len(chunk)]
+
+    def _seal(self, chunk: bytes, chunk_id: str) -> bytes:
+        """Compress and encrypt a chunk into the content of its file."""
+        codec, level, payload = compress_payload(
+            chunk, self.compression_codec, self.compression_level
+        )
+        header = CHUNK_HEADER.pack(CHUNK_MAGIC, CHUNK_VERSION, codec, level)
+        return header + self.crypto.encrypt_many([payload], header + chunk_id.encode())[0]
+
+    @staticmethod
+    def _unseal(sealed: bytes, chunk_id: str, crypto: CryptoManager) -> bytes:
+        """Decrypt the content of a chunk file and check it against its id."""
+        if not sealed.startswith(CHUNK_MAGIC):
+            return crypto.decrypt_many([sealed], chunk_id.encode())[0]
+        _, version, codec, _ = CHUNK_HEADER.unpack_from(sealed)
+        if version != CHUNK_VERSION:
+            raise ValueError(f"Unsupported chunk version: {version}")
+        header = sealed[:CHUNK_HEADER.size]
+        payload = crypto.decrypt_many(
+            [sealed[CHUNK_HEADER.size:]], header + chunk_id.encode()
+        )[0]
+        return decompress_payload(codec, payload)
+
+    def release(self, chunk_ids):
+        """Drop references, deleting chunks that are no longer used."""
+        with self._lock:
+            for chunk_id in chunk_ids:
+                count = self.refcounts.get(chunk_id, 0) - 1
+                if count > 0:
+                    self.refcounts[chunk_id] = count
+                    continue
+                self.refcounts.pop(chunk_id, None)
+                path = self.path(chunk_id)
+                if self.migration is not None:
+                    self.migration.discard(path)
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def chunk_paths(self) -> list:
+        """Paths of every chunk an entry refers to."""
+        with self._lock:
+            return [str(self.path(chunk_id)) for chunk_id in self.refcounts]
+
+    def read_chunk(self, chunk_id: str) -> bytes:
+        """Decrypt one chunk and check it against its id.
+
+        While a key rotation is under way a chunk is read with the old key
+        until the migration has rewritten it; a reader that loses the race
+        with the rewrite falls back to the vault key.
+        """
+        path = self.path(chunk_id)
+        source = self.migration.source_crypto(path) if self.migration is not None else None
+        if source is not None:
+            try:
+                return self._unseal(path.read_bytes(), chunk_id, source)
+            except (InvalidTag, ValueError) as e:
+                logger.debug(f"Chunk not readable with the migration source key: {str(e) or type(e).__name__}")
+        return self._unseal(path.read_bytes(), chunk_id, self.crypto)
+
+    def needs_rewrite(self, path, source: CryptoManager = None) -> bool:
+        """Whether a chunk file is still sealed with the source key."""
+        if source is None:
+            return False
+        path = Path(path)
+        try:
+            self._unseal(path.read_bytes(), path.name, source)
+        except (InvalidTag, ValueError):
+            # Already rewritten, but not journaled before a crash
+            return False
+        return True
+
+    def rewrite(self, path, source: CryptoManager, dst):
+        """Write a chunk sealed with source to dst, sealed with the vault key.
+
+        The chunk keeps its id, and so its file name, although ids of new
+        chunks are derived from the vault key.
+        """
+        path = Path(path)
+        dst.write(self._seal(self._unseal(path.read_bytes(), path.name, source), path.name))
+
+    def write_file(self, manifest: list, dst, progress=None):
+        """Decrypt a manifest's chunks in order into a binary stream.
+
+        At most a window of chunks is decrypted ahead of the writes.
+        progress works as for put_file.
+        """
+        pending = deque()
+        window = max(2 * self.workers, 1)
+
+        def write(future):
+            chunk = future.result()
+            dst.write(chunk)
+            if progress is not None:
+                progress(len(chunk))
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            try:
+                for chunk_id, _ in manifest:
+                    pending.append(pool.submit(self.read_chunk, chunk_id))
+                    if len(pending) >= window:
+                        write(pending.popleft())
+                while pending:
+                    write(pending.popleft())
+            finally:
+                # Don't decrypt the rest of the file after a failure
+                for future in pending:
+                    future.cancel()
+
+    def open_file(self, manifest: list) -> "ChunkedFileReader":
+        """Seekable, read-only stream over a manifest's plaintext."""
+        return ChunkedFileReader(self, manifest)
+
+class ChunkedFileReader(io.RawIOBase):
+    """Seekable, read-only view of a chunked file.
+
+    Chunk offsets come from the manifest, so a read only decrypts the
+    chunks covering the requested range. The most recently used chunk is
+    cached.
+    """
+
+    def __init__(self, store: ChunkStore, manifest: list):
+        super().__init__()
+        self._store = store
+        self._ids = [chunk_id for chunk_id, _ in manifest]
+        self._offsets = []
+        offset = 0
+        for _, length in manifest:
+            self._offsets.append(offset)
+            offset += length
+        self._size = offset
+        self._position = 0
+        self._cached_index = None
+        self._cached_chunk = b""
+
+    @property
+    def size(self) -> int:
+        """Plaintext size of the file."""
+        return self._size
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._position + offset
+        elif whence == io.SEEK_END:
+            position = self._size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        if position < 0:
+            raise ValueError("Negative seek position")
+        self._position = position
+        return position
+
+    def readinto(self, buffer) -> int:
+        if self._position >= self._size:
+            return 0
+        index = bisect.bisect_right(self._offsets, self._position) - 1
+        if index != self._cached_index:
+            self._cached_chunk = self._store.read_chunk(self._ids[index])
+            self._cached_index = index
+        start = self._position - self._offsets[index]
+        count = min(len(buffer), len(self._cached_chunk) - start)
+        buffer[:count] = self._cached_chunk[start:start + count]
+        self._position += count
+        return count
+
+    def close(self):
+        self._cached_chunk = b""
+        super().close()
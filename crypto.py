@@ -1,109 +1,618 @@
 import os
+import io
+import hmac
+import mmap
 import base64
+import binascii
+import lzma
+import time
+import zlib
 import logging
-from cryptography.fernet import Fernet
+from contextlib import contextmanager
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-import secrets
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.exceptions import InvalidTag
+import struct
+from password_generator import generate_password
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+# Key schedule versions recorded in config.enc
+KDF_VERSION_LEGACY = 1  # Scrypt hash plus a separate PBKDF2 key (48-byte config)
+KDF_VERSION_HKDF = 2    # One Scrypt run expanded with HKDF into all keys
+KDF_VERSION_ENVELOPE = 3  # Random data key, wrapped by the Scrypt-derived key
+
+# Default Scrypt cost parameters, also the floor for calibration
+SCRYPT_N = 2**14
+SCRYPT_R = 8
+SCRYPT_P = 1
+
+# KDF calibration targets and bounds
+KDF_TARGET_SECONDS = 0.5
+KDF_MAX_MEMORY = 256 * 1024 * 1024
+SCRYPT_MAX_LOG2_N = 24
+SCRYPT_MAX_P = 16
+
+# HKDF labels for the keys expanded from the Scrypt output
+HKDF_INFO_PREFIX = b"digital-safe/v2/"
+VERIFIER_LABEL = b"verifier"
+ENCRYPTION_LABEL = b"encryption"
+
+# Envelope key schedule: a random data key is the HKDF root for every vault
+# key and is stored wrapped with AES-GCM, once by a key expanded from the
+# password's Scrypt output and optionally once by a recovery key. Changing
+# the password only rewraps the data key.
+DATA_KEY_SIZE = 32
+WRAPPED_KEY_SIZE = 12 + 16 + DATA_KEY_SIZE  # iv + tag + data key
+WRAP_LABEL = b"key-wrapping"
+RECOVERY_LABEL = b"recovery"
+PASSWORD_WRAP_AAD = b"digital-safe/data-key/password"
+RECOVERY_WRAP_AAD = b"digital-safe/data-key/recovery"
+# Recovery keys are shown to the user as base32 in groups of six characters
+RECOVERY_KEY_SIZE = 30
+RECOVERY_KEY_GROUP = 6
+
+# Streaming segmented file format. A blob is the header followed by segments
+# of segment_size plaintext bytes (the last one may be shorter), each stored
+# as ciphertext plus its 16-byte GCM tag.
+STREAM_MAGIC = b"DSFS"
+STREAM_VERSION = 1
+STREAM_HEADER = struct.Struct(">4sBI7s")  # magic, version, segment size, nonce prefix
+SEGMENT_SIZE = 1024 * 1024
+TAG_SIZE = 16
+
+# Compression ahead of encryption. A compressed plaintext starts with a frame
+# recording the codec and level. The plaintexts compressed here (JSON,
+# base64, packed entries) never start with a NUL byte, so the frame can
+# travel in-band with them.
+COMPRESSION_MAGIC = b"\x00DZ"
+COMPRESSION_FRAME = struct.Struct(">3sBB")  # magic, codec, level
+CODEC_NONE = 0
+CODEC_ZLIB = 1
+CODEC_LZMA = 2
+DEFAULT_CODEC = CODEC_ZLIB
+# Level 1 compresses vault payloads within a few percent of level 6 at
+# several times the speed
+DEFAULT_COMPRESSION_LEVEL = 1
+# Inputs are sampled at their start, middle and end with fast zlib; unless
+# the sample shrinks by COMPRESSION_MIN_SAVING the input is stored as is,
+# which skips already compressed data (JPEG, ZIP, MP4) almost for free
+COMPRESSION_SAMPLE_SIZE = 64 * 1024
+COMPRESSION_MIN_SAVING = 0.10
+COMPRESSION_MIN_INPUT = 1024
+
+# Extra room update_into needs past the plaintext length on older
+# cryptography releases (one AES block minus one byte)
+UPDATE_INTO_SLACK = 15
+
+
+@contextmanager
+def mapped_file(path):
+    """Memory-map a file read-only and yield a memoryview over its contents.
+
+    Empty files cannot be mapped and yield an empty view instead.
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield memoryview(b"")
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            view = memoryview(mm)
+            try:
+                yield view
+            finally:
+                view.release()
+
+def _segment_nonce(header: bytes, index: int, last: bool) -> bytes:
+    """Build the 96-bit nonce of a segment: prefix, index and final flag."""
+    prefix = STREAM_HEADER.unpack_from(header)[3]
+    return prefix + index.to_bytes(4, "big") + (b"\x01" if last else b"\x00")
+
+def scrypt_memory(n: int, r: int) -> int:
+    """Approximate memory used by one Scrypt run, in bytes."""
+    return 128 * n * r
+
+def benchmark_kdf(n: int, r: int = SCRYPT_R, p: int = SCRYPT_P) -> float:
+    """Time one Scrypt derivation with the given parameters, in seconds."""
+    kdf = Scrypt(
+        salt=os.urandom(16),
+        length=32,
+        n=n,
+        r=r,
+        p=p,
+        backend=default_backend()
+    )
+    start = time.perf_counter()
+    kdf.derive(b"calibration")
+    return time.perf_counter() - start
+
+def calibrate_kdf(target_seconds: float = KDF_TARGET_SECONDS,
+                  max_memory: int = KDF_MAX_MEMORY, r: int = SCRYPT_R):
+    """Pick Scrypt parameters that take about target_seconds on this machine.
+
+    N is doubled while the memory budget allows and the projected time stays
+    within the target; once memory is exhausted, p is raised instead, which
+    adds time but no memory. The result is never weaker than the defaults.
+    Returns (n, r, p) and the measured cost curve as a list of
+    (n, r, p, seconds, memory) tuples.
+    """
+    logger.debug(f"Calibrating KDF: target={target_seconds}s, max_memory={max_memory}")
+    n = SCRYPT_N
+    p = SCRYPT_P
+    seconds = benchmark_kdf(n, r, p)
+    curve = [(n, r, p, seconds, scrypt_memory(n, r))]
+
+    while (n.bit_length() - 1 < SCRYPT_MAX_LOG2_N
+           and scrypt_memory(n * 2, r) <= max_memory
+           and seconds * 2 <= target_seconds):
+        n *= 2
+        seconds = benchmark_kdf(n, r, p)
+        curve.append((n, r, p, seconds, scrypt_memory(n, r)))
+
+    # Time per lane is known now, so p can be projected without measuring
+    lane_seconds = seconds
+    while p < SCRYPT_MAX_P and lane_seconds * (p + 1) <= target_seconds:
+        p += 1
+    if p > SCRYPT_P:
+        seconds = benchmark_kdf(n, r, p)
+        curve.append((n, r, p, seconds, scrypt_memory(n, r)))
+
+    logger.debug(f"KDF calibrated: n=2**{n.bit_length() - 1}, r={r}, p={p}, {seconds:.3f}s")
+    return (n, r, p), curve
+
+def sample_ratio(data) -> float:
+    """Compressed to original size of a sample of data, using zlib level 1."""
+    size = len(data)
+    if size <= COMPRESSION_SAMPLE_SIZE:
+        sample = bytes(data)
+    else:
+        part = COMPRESSION_SAMPLE_SIZE // 3
+        middle = size // 2 - part // 2
+        sample = b"".join((data[:part], data[middle:middle + part], data[size - part:]))
+    return len(zlib.compress(sample, 1)) / max(len(sample), 1)
+
+def compress_payload(data, codec: int = DEFAULT_CODEC,
+                     level: int = DEFAULT_COMPRESSION_LEVEL) -> tuple:
+    """Compress data if a sample suggests it pays off.
+
+    Returns (codec, level, payload); codec is CODEC_NONE and payload is data
+    itself when the input is small, looks incompressible or didn't shrink.
+    """
+    if (codec == CODEC_NONE or len(data) < COMPRESSION_MIN_INPUT
+            or sample_ratio(data) > 1 - COMPRESSION_MIN_SAVING):
+        return CODEC_NONE, 0, data
+    if codec == CODEC_ZLIB:
+        payload = zlib.compress(data, level)
+    elif codec == CODEC_LZMA:
+        payload = lzma.compress(data, preset=level)
+    else:
+        raise ValueError(f"Unknown compression codec: {codec}")
+    if len(payload) >= len(data):
+        return CODEC_NONE, 0, data
+    return codec, level, payload
+
+def decompress_payload(codec: int, payload) -> bytes:
+    """Undo compress_payload for the recorded codec."""
+    if codec == CODEC_NONE:
+        return bytes(payload)
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(payload)
+    if codec == CODEC_LZMA:
+        return lzma.decompress(payload)
+    raise ValueError(f"Unknown compression codec: {codec}")
+
+def format_recovery_key(secret: bytes) -> str:
+    """Render a recovery key for the user to write down."""
+    text = base64.b32encode(secret).decode()
+    return '-'.join(text[i:i + RECOVERY_KEY_GROUP] for i in range(0, len(text), RECOVERY_KEY_GROUP))
+
+def parse_recovery_key(text: str) -> bytes:
+    """Inverse of format_recovery_key, forgiving case, spaces and dashes."""
+    cleaned = ''.join(text.split()).replace('-', '').upper()
+    try:
+        secret = base64.b32decode(cleaned)
+    except (binascii.Error, ValueError):
+        raise ValueError("Malformed recovery key")
+    if len(secret) != RECOVERY_KEY_SIZE:
+        raise ValueError("Malformed recovery key")
+    return secret
+
+def read_fully(stream, length: int) -> bytes:
+    """Read up to length bytes, looping over short reads until EOF."""
+    chunks = []
+    remaining = length
+    while remaining > 0:
+        chunk = stream.read(remaining)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+class SegmentedBlobReader(io.RawIOBase):
+    """Seekable, read-only view of the plaintext of a segmented blob.
+
+    Segments are located arithmetically from the header, so a read only
+    decrypts and authenticates the segments covering the requested range.
+    The most recently used segment is cached.
+    """
+
+    def __init__(self, crypto: "CryptoManager", encrypted_path):
+        super().__init__()
+        if not crypto.key:
+            logger.error("No key available for blob reading")
+            raise ValueError("Master password not set")
+        self._file = open(encrypted_path, 'rb')
+        try:
+            self._header = self._file.read(STREAM_HEADER.size)
+            if not crypto.is_stream_blob(self._header):
+                raise ValueError("Not a segmented blob")
+            self._segment_size = STREAM_HEADER.unpack_from(self._header)[2]
+            self._record_size = self._segment_size + TAG_SIZE
+            body_size = os.fstat(self._file.fileno()).st_size - STREAM_HEADER.size
+            remainder = body_size % self._record_size
+            if body_size < TAG_SIZE or (remainder and remainder < TAG_SIZE):
+                raise ValueError("Truncated segmented blob")
+            self._segments = -(-body_size // self._record_size)
+            self._size = body_size - self._segments * TAG_SIZE
+        except Exception:
+            self._file.close()
+            raise
+        self._aead = AESGCM(crypto.key)
+        self._position = 0
+        self._cached_index = None
+        self._cached_segment = b""
+
+    @property
+    def size(self) -> int:
+        """Plaintext size of the blob."""
+        return self._size
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._position + offset
+        elif whence == io.SEEK_END:
+            position = self._size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        if position < 0:
+            raise ValueError("Negative seek position")
+        self._position = position
+        return position
+
+    def readinto(self, buffer) -> int:
+        if self._position >= self._size:
+            return 0
+        index = self._position // self._segment_size
+        segment = self._segment(index)
+        start = self._position - index * self._segment_size
+        count = min(len(buffer), len(segment) - start)
+        buffer[:count] = segment[start:start + count]
+        self._position += count
+        return count
+
+    def _segment(self, index: int) -> bytes:
+        """Decrypt and authenticate one segment, reusing the cached one."""
+        if index != self._cached_index:
+            self._file.seek(STREAM_HEADER.size + index * self._record_size)
+            record = self._file.read(self._record_size)
+            last = index == self._segments - 1
+            self._cached_segment = self._aead.decrypt(
+                _segment_nonce(self._header, index, last), record, self._header
+            )
+            self._cached_index = index
+        return self._cached_segment
+
+    def close(self):
+        if not self.closed:
+            self._file.close()
+            self._cached_segment = b""
+        super().close()
+
 class CryptoManager:
     def __init__(self):
         self.salt = None
         self.master_password_hash = None
         self.key = None
-        self.fernet = None
+        self.kdf_version = KDF_VERSION_HKDF
+        self.scrypt_n = SCRYPT_N
+        self.scrypt_r = SCRYPT_R
+        self.scrypt_p = SCRYPT_P
+        self._root_key = None
+        # Data key wrapped by the password and by the recovery key (envelope
+        # key schedule only)
+        self.wrapped_key = None
+        self.recovery_wrapped_key = None
+        self._aead = None
+        self._aead_key = None
+        # Codec and level for plaintexts encrypted with compress set
+        self.compression_codec = DEFAULT_CODEC
+        self.compression_level = DEFAULT_COMPRESSION_LEVEL
         logger.debug("CryptoManager initialized")
 
     def set_master_password(self, password: str):
-        """Set the master password and generate its hash using Scrypt."""
+        """Set the master password over a fresh random data key."""
         logger.debug("Setting master password")
-        self.salt = os.urandom(16)
-        kdf = Scrypt(
-            salt=self.salt,
-            length=32,
-            n=2**14,
-            r=8,
-            p=1,
-            backend=default_backend()
+        self.recovery_wrapped_key = None
+        self._use_data_key(os.urandom(DATA_KEY_SIZE))
+        self.wrap_data_key(password)
+        logger.debug("Key schedule derived after setting master password")
+
+    def wrap_data_key(self, password: str):
+        """Wrap the unlocked data key under password, with a fresh salt.
+
+        Nothing encrypted under the data key changes, so this costs one
+        Scrypt run whatever the size of the vault. On the HKDF key schedule
+        the existing root key becomes the data key, which moves the vault
+        to the envelope schedule without re-encrypting anything.
+        """
+        if not self._root_key:
+            logger.error("No data key available for wrapping")
+            raise ValueError("Master password not set")
+        salt = os.urandom(16)
+        password_key = self._run_kdf(password, salt)
+        wrapped_key = self._wrap(self._expand(password_key, WRAP_LABEL), self._root_key,
+                                 PASSWORD_WRAP_AAD)
+        self.salt = salt
+        self.master_password_hash = self._expand(password_key, VERIFIER_LABEL)
+        self.wrapped_key = wrapped_key
+        self.kdf_version = KDF_VERSION_ENVELOPE
+        logger.debug("Data key wrapped under the master password")
+
+    def change_master_password(self, old_password: str, new_password: str) -> bool:
+        """Rewrap the data key under new_password if old_password is correct."""
+        logger.debug("Changing master password")
+        if self.kdf_version == KDF_VERSION_LEGACY:
+            raise ValueError("Legacy key schedule must be migrated before a password change")
+        data_key = self._unwrap_with_password(old_password)
+        if data_key is None:
+            return False
+        if self._root_key != data_key:
+            self._use_data_key(data_key)
+        self.wrap_data_key(new_password)
+        logger.debug("Master password changed")
+        return True
+
+    def add_recovery_key(self) -> str:
+        """Wrap the data key under a new random recovery key and return it.
+
+        The returned key is all the user gets to see; it replaces any
+        previous recovery key.
+        """
+        if not self._root_key or self.kdf_version != KDF_VERSION_ENVELOPE:
+            logger.error("Recovery keys need an unlocked envelope key schedule")
+            raise ValueError("Master password not set")
+        secret = os.urandom(RECOVERY_KEY_SIZE)
+        self.recovery_wrapped_key = self._wrap(self._expand(secret, RECOVERY_LABEL),
+                                               self._root_key, RECOVERY_WRAP_AAD)
+        logger.debug("Recovery key added")
+        return format_recovery_key(secret)
+
+    def verify_recovery_key(self, recovery_key: str) -> bool:
+        """Unlock with the recovery key instead of the master password."""
+        logger.debug("Verifying recovery key")
+        if not self.recovery_wrapped_key:
+            logger.debug("No recovery key set")
+            return False
+        try:
+            secret = parse_recovery_key(recovery_key)
+            data_key = self._unwrap(self._expand(secret, RECOVERY_LABEL),
+                                    self.recovery_wrapped_key, RECOVERY_WRAP_AAD)
+        except (ValueError, InvalidTag) as e:
+            logger.debug(f"Recovery key verification failed: {str(e) or type(e).__name__}")
+            return False
+        self._use_data_key(data_key)
+        logger.debug("Recovery key verified and key derived")
+        return True
+
+    def calibrate_kdf(self, target_seconds: float = KDF_TARGET_SECONDS,
+                      max_memory: int = KDF_MAX_MEMORY):
+        """Tune the Scrypt parameters for this machine before setting a password."""
+        (self.scrypt_n, self.scrypt_r, self.scrypt_p), curve = calibrate_kdf(
+            target_seconds, max_memory
         )
-        self.master_password_hash = kdf.derive(password.encode())
-        logger.debug("Master password hash generated")
-        # Derive the encryption key immediately
-        self.derive_key(password)
-        logger.debug("Key derived after setting master password")
+        return curve
 
     def verify_master_password(self, password: str) -> bool:
-        """Verify if the provided password matches the stored hash."""
+        """Verify if the provided password matches the stored verifier.
+
+        A successful verification also leaves the encryption key in place, so
+        only one KDF run is needed per unlock.
+        """
         logger.debug("Verifying master password")
         if not self.salt or not self.master_password_hash:
             logger.debug("No salt or hash found")
             return False
-        
+
+        if self.kdf_version == KDF_VERSION_LEGACY:
+            return self._verify_legacy_password(password)
+
+        data_key = self._unwrap_with_password(password)
+        if data_key is None:
+            return False
+        self._use_data_key(data_key)
+        logger.debug("Password verified and key derived")
+        return True
+
+    def _unwrap_with_password(self, password: str):
+        """The data key (HKDF root key) if password is correct, else None."""
+        if not self.salt or not self.master_password_hash:
+            logger.debug("No salt or hash found")
+            return None
+        try:
+            password_key = self._run_kdf(password)
+        except Exception as e:
+            logger.debug(f"Password verification failed: {str(e)}")
+            return None
+
+        verifier = self._expand(password_key, VERIFIER_LABEL)
+        if not hmac.compare_digest(verifier, self.master_password_hash):
+            logger.debug("Password verification failed: verifier mismatch")
+            return None
+        if self.kdf_version == KDF_VERSION_HKDF:
+            return password_key
+
+        try:
+            return self._unwrap(self._expand(password_key, WRAP_LABEL), self.wrapped_key,
+                                PASSWORD_WRAP_AAD)
+        except (InvalidTag, TypeError, ValueError):
+            logger.debug("Password verification failed: data key did not unwrap")
+            return None
+
+    def _use_data_key(self, data_key: bytes):
+        """Make data_key the root of the unlocked key schedule."""
+        self._root_key = data_key
+        self.key = self._expand(data_key, ENCRYPTION_LABEL)
+
+    def derive_key(self, password: str) -> None:
+        """Derive the verifier and encryption key from one Scrypt run."""
+        logger.debug("Deriving key")
+        if not self.salt:
+            logger.debug("No salt found, generating new salt")
+            self.salt = os.urandom(16)
+
+        self._root_key = self._run_kdf(password)
+        self.master_password_hash = self._expand(self._root_key, VERIFIER_LABEL)
+        self.key = self._expand(self._root_key, ENCRYPTION_LABEL)
+        logger.debug("Verifier and encryption key derived")
+
+    def derive_subkey(self, label: bytes, length: int = 32) -> bytes:
+        """Derive an additional purpose-bound key from the unlocked key schedule."""
+        if not self._root_key:
+            logger.error("No key schedule available for subkey derivation")
+            raise ValueError("Master password not set")
+        if label in (VERIFIER_LABEL, ENCRYPTION_LABEL, WRAP_LABEL):
+            raise ValueError(f"Reserved subkey label: {label!r}")
+        return self._expand(self._root_key, label, length)
+
+    def _run_kdf(self, password: str, salt: bytes = None) -> bytes:
+        """Run the memory-hard KDF once with the vault's cost parameters."""
+        kdf = Scrypt(
+            salt=salt or self.salt,
+            length=32,
+            n=self.scrypt_n,
+            r=self.scrypt_r,
+            p=self.scrypt_p,
+            backend=default_backend()
+        )
+        return kdf.derive(password.encode())
+
+    @staticmethod
+    def _expand(root_key: bytes, label: bytes, length: int = 32) -> bytes:
+        """Expand the KDF output into an independent key for one purpose."""
+        hkdf = HKDF(
+            algorithm=hashes.SHA256(),
+            length=length,
+            salt=None,
+            info=HKDF_INFO_PREFIX + label,
+            backend=default_backend()
+        )
+        return hkdf.derive(root_key)
+
+    @staticmethod
+    def _wrap(wrapping_key: bytes, data_key: bytes, associated_data: bytes) -> bytes:
+        """Seal data_key as iv + tag + ciphertext."""
+        nonce = os.urandom(12)
+        sealed = AESGCM(wrapping_key).encrypt(nonce, data_key, associated_data)
+        return nonce + sealed[-TAG_SIZE:] + sealed[:-TAG_SIZE]
+
+    @staticmethod
+    def _unwrap(wrapping_key: bytes, wrapped_key: bytes, associated_data: bytes) -> bytes:
+        """Inverse of _wrap; raises InvalidTag for a wrong wrapping key."""
+        if len(wrapped_key) != WRAPPED_KEY_SIZE:
+            raise ValueError("Invalid wrapped key")
+        nonce, tag, ciphertext = wrapped_key[:12], wrapped_key[12:12 + TAG_SIZE], wrapped_key[12 + TAG_SIZE:]
+        return AESGCM(wrapping_key).decrypt(nonce, ciphertext + tag, associated_data)
+
+    def _verify_legacy_password(self, password: str) -> bool:
+        """Verify a password against the pre-HKDF key schedule.
+
+        Legacy vaults store a Scrypt hash and encrypt with a separate PBKDF2
+        key, so both KDFs have to run. Callers are expected to migrate the
+        vault to the current schedule once this succeeds.
+        """
         kdf = Scrypt(
             salt=self.salt,
             length=32,
-            n=2**14,
-            r=8,
-            p=1,
+            n=SCRYPT_N,
+            r=SCRYPT_R,
+            p=SCRYPT_P,
             backend=default_backend()
         )
         try:
             kdf.verify(password.encode(), self.master_password_hash)
-            logger.debug("Password verified successfully")
-            
-            # Derive the key using PBKDF2
-            key_kdf = PBKDF2HMAC(
-                algorithm=hashes.SHA256(),
-                length=32,
-                salt=self.salt,
-                iterations=100000,
-                backend=default_backend()
-            )
-            self.key = key_kdf.derive(password.encode())
-            self.fernet = Fernet(base64.urlsafe_b64encode(self.key))
-            
-            # Verify the key was derived successfully
-            if not self.key or not self.fernet:
-                logger.error("Key derivation failed after verification")
-                return False
-                
-            logger.debug("Key derived after verification")
-            return True
         except Exception as e:
-            logger.debug(f"Password verification failed: {str(e)}")
+            logger.debug(f"Legacy password verification failed: {str(e)}")
             return False
 
-    def derive_key(self, password: str) -> None:
-        """Derive an encryption key from the master password using PBKDF2."""
-        logger.debug("Deriving key")
-        if not self.salt:
-            logger.debug("No salt found, generating new salt")
-            self.salt = os.urandom(16)
-        
-        kdf = PBKDF2HMAC(
+        key_kdf = PBKDF2HMAC(
             algorithm=hashes.SHA256(),
             length=32,
             salt=self.salt,
             iterations=100000,
             backend=default_backend()
         )
-        self.key = kdf.derive(password.encode())
-        self.fernet = Fernet(base64.urlsafe_b64encode(self.key))
-        logger.debug("Key derived and Fernet instance created")
+        self.key = key_kdf.derive(password.encode())
+        self._root_key = None
+        logger.debug("Legacy password verified and key derived")
+        return True
 
-    def encrypt_data(self, data: str) -> bytes:
+    def encrypt_data(self, data: str, compress: bool = False) -> bytes:
         """Encrypt data using AES-256-GCM."""
+        return self.encrypt_bytes(data.encode(), compress)
+
+    def decrypt_data(self, encrypted_data: bytes, decompress: bool = False) -> str:
+        """Decrypt data using AES-256-GCM."""
+        return self.decrypt_bytes(encrypted_data, decompress).decode()
+
+    def compress(self, data: bytes) -> bytes:
+        """Compress a text plaintext ahead of encryption, if it pays off.
+
+        The result carries a frame recording codec and level; data that is
+        not worth compressing is returned unchanged, without a frame.
+        """
+        codec, level, payload = compress_payload(data, self.compression_codec,
+                                                 self.compression_level)
+        if codec == CODEC_NONE:
+            return data
+        return COMPRESSION_FRAME.pack(COMPRESSION_MAGIC, codec, level) + payload
+
+    def decompress(self, data) -> bytearray:
+        """Undo compress; unframed data is returned as is."""
+        if bytes(data[:len(COMPRESSION_MAGIC)]) != COMPRESSION_MAGIC:
+            return data
+        _, codec, _ = COMPRESSION_FRAME.unpack_from(data)
+        return bytearray(decompress_payload(codec, data[COMPRESSION_FRAME.size:]))
+
+    def encrypt_bytes(self, data: bytes, compress: bool = False) -> bytes:
+        """Encrypt raw bytes using AES-256-GCM (iv + tag + ciphertext).
+
+        With compress set, text plaintexts go through compress first.
+        """
         logger.debug("Encrypting data")
         if not self.key:
             logger.error("No key available for encryption")
             raise ValueError("Master password not set")
+        if compress:
+            data = self.compress(data)
         
         iv = os.urandom(12)
         cipher = Cipher(
@@ -113,81 +622,259 @@ class CryptoManager:
         )
         encryptor = cipher.encryptor()
         
-        ciphertext = encryptor.update(data.encode()) + encryptor.finalize()
+        ciphertext = encryptor.update(data) + encryptor.finalize()
         logger.debug("Data encrypted successfully")
         return iv + encryptor.tag + ciphertext
 
-    def decrypt_data(self, encrypted_data: bytes) -> str:
-        """Decrypt data using AES-256-GCM."""
+    def decrypt_bytes(self, encrypted_data, decompress: bool = False,
+                      associated_data: bytes = None) -> bytearray:
+        """Decrypt raw bytes encrypted with encrypt_bytes or encrypt_data.
+
+        encrypted_data may be any bytes-like object, such as a memoryview over
+        a memory-mapped file. The ciphertext is sliced without copying and
+        decrypted into a single preallocated buffer, which is returned.
+        Pass decompress for data encrypted with compress set, and the
+        associated_data of records sealed by encrypt_many with one.
+        """
         logger.debug("Decrypting data")
         if not self.key:
             logger.error("No key available for decryption")
             raise ValueError("Master password not set")
         
-        iv = encrypted_data[:12]
-        tag = encrypted_data[12:28]
-        ciphertext = encrypted_data[28:]
-        
-        cipher = Cipher(
-            algorithms.AES(self.key),
-            modes.GCM(iv, tag),
-            backend=default_backend()
-        )
-        decryptor = cipher.decryptor()
-        
-        result = (decryptor.update(ciphertext) + decryptor.finalize()).decode()
+        view = memoryview(encrypted_data)
+        ciphertext = view[28:]
+        try:
+            cipher = Cipher(
+                algorithms.AES(self.key),
+                modes.GCM(bytes(view[:12]), bytes(view[12:28])),
+                backend=default_backend()
+            )
+            decryptor = cipher.decryptor()
+            if associated_data:
+                decryptor.authenticate_additional_data(associated_data)
+            result = bytearray(len(ciphertext) + UPDATE_INTO_SLACK)
+            written = decryptor.update_into(ciphertext, result)
+            decryptor.finalize()
+        finally:
+            # Release the views eagerly so a backing mmap can be closed,
+            # even while an exception traceback is still alive
+            ciphertext.release()
+            view.release()
+        del result[written:]
+        if decompress:
+            result = self.decompress(result)
         logger.debug("Data decrypted successfully")
         return result
 
-    def encrypt_file(self, file_path: str) -> bytes:
-        """Encrypt a file using AES-256-GCM."""
-        logger.debug(f"Encrypting file: {file_path}")
+    def encrypt_many(self, records: list, associated_data: bytes = None) -> list:
+        """Encrypt a batch of byte strings, returning results in input order.
+
+        One AES-GCM context is reused for the whole batch and the nonces are
+        drawn from the OS in a single call. Each result has the same
+        iv + tag + ciphertext layout as encrypt_bytes, so records can also be
+        decrypted one at a time with decrypt_bytes. Records sealed with
+        associated_data only decrypt with the same associated_data.
+        """
         if not self.key:
-            logger.error("No key available for file encryption")
+            logger.error("No key available for encryption")
             raise ValueError("Master password not set")
-        
-        with open(file_path, 'rb') as f:
-            file_data = f.read()
-        
-        iv = os.urandom(12)
-        cipher = Cipher(
-            algorithms.AES(self.key),
-            modes.GCM(iv),
-            backend=default_backend()
-        )
-        encryptor = cipher.encryptor()
-        
-        ciphertext = encryptor.update(file_data) + encryptor.finalize()
+
+        aead = self._batch_aead()
+        nonces = os.urandom(12 * len(records))
+        results = []
+        for i, record in enumerate(records):
+            nonce = nonces[12 * i:12 * i + 12]
+            sealed = aead.encrypt(nonce, record, associated_data)
+            results.append(nonce + sealed[-TAG_SIZE:] + sealed[:-TAG_SIZE])
+        logger.debug(f"Encrypted batch of {len(records)} records")
+        return results
+
+    def decrypt_many(self, records: list, associated_data: bytes = None) -> list:
+        """Decrypt a batch of records from encrypt_many or encrypt_bytes.
+
+        Results are returned in input order. Any record failing
+        authentication fails the whole call.
+        """
+        if not self.key:
+            logger.error("No key available for decryption")
+            raise ValueError("Master password not set")
+
+        aead = self._batch_aead()
+        results = []
+        for record in records:
+            # AESGCM expects ciphertext followed by the tag
+            results.append(aead.decrypt(record[:12], record[28:] + record[12:28], associated_data))
+        logger.debug(f"Decrypted batch of {len(records)} records")
+        return results
+
+    def _batch_aead(self) -> AESGCM:
+        """Return the AES-GCM context for the current key, creating it once."""
+        if self._aead_key is not self.key:
+            self._aead = AESGCM(self.key)
+            self._aead_key = self.key
+        return self._aead
+
+    def encrypt_file(self, file_path: str, output_path: str):
+        """Encrypt a file into the streaming segmented format."""
+        logger.debug(f"Encrypting file: {file_path}")
+        with open(file_path, 'rb') as src, open(output_path, 'wb') as dst:
+            self.encrypt_stream(src, dst)
         logger.debug("File encrypted successfully")
-        return iv + encryptor.tag + ciphertext
 
-    def decrypt_file(self, encrypted_data: bytes, output_path: str):
-        """Decrypt a file using AES-256-GCM."""
+    def decrypt_file(self, encrypted_path: str, output_path: str):
+        """Decrypt a file blob written by encrypt_file.
+
+        Blobs from before the streaming format (a single AES-256-GCM message)
+        are still accepted, but have to be decrypted in memory.
+        """
         logger.debug(f"Decrypting file to: {output_path}")
         if not self.key:
             logger.error("No key available for file decryption")
             raise ValueError("Master password not set")
-        
-        iv = encrypted_data[:12]
-        tag = encrypted_data[12:28]
-        ciphertext = encrypted_data[28:]
-        
-        cipher = Cipher(
-            algorithms.AES(self.key),
-            modes.GCM(iv, tag),
-            backend=default_backend()
-        )
-        decryptor = cipher.decryptor()
-        
-        decrypted_data = decryptor.update(ciphertext) + decryptor.finalize()
+
+        with open(encrypted_path, 'rb') as src:
+            if self.is_stream_blob(src.read(STREAM_HEADER.size)):
+                src.seek(0)
+                with open(output_path, 'wb') as dst:
+                    self.decrypt_stream(src, dst)
+                logger.debug("File decrypted successfully")
+                return
+
+        with mapped_file(encrypted_path) as encrypted_data:
+            decrypted_data = self.decrypt_bytes(encrypted_data)
         
         with open(output_path, 'wb') as f:
             f.write(decrypted_data)
         logger.debug("File decrypted successfully")
 
+    @staticmethod
+    def is_stream_blob(header: bytes) -> bool:
+        """Check whether a blob starts with a streaming format header."""
+        if len(header) < STREAM_HEADER.size:
+            return False
+        magic, version, segment_size, _ = STREAM_HEADER.unpack_from(header)
+        return magic == STREAM_MAGIC and version == STREAM_VERSION and segment_size > 0
+
+    def new_stream_header(self, segment_size: int = SEGMENT_SIZE) -> bytes:
+        """Create the header for a new segmented blob with a fresh nonce prefix."""
+        return STREAM_HEADER.pack(STREAM_MAGIC, STREAM_VERSION, segment_size, os.urandom(7))
+
+    def open_stream_blob(self, encrypted_path) -> SegmentedBlobReader:
+        """Open a segmented blob for random-access reads of its plaintext."""
+        return SegmentedBlobReader(self, encrypted_path)
+
+    def decrypt_range(self, encrypted_path, offset: int, length: int) -> bytes:
+        """Decrypt length bytes at offset from a segmented blob.
+
+        Only the segments covering the range are read and authenticated.
+        The result is shorter than length if the range runs past the end.
+        """
+        with self.open_stream_blob(encrypted_path) as reader:
+            reader.seek(offset)
+            return read_fully(reader, length)
+
+    def encrypt_segment(self, header: bytes, index: int, last: bool, data: bytes) -> bytes:
+        """Encrypt one segment of a segmented blob.
+
+        The nonce is the header's random prefix, the segment index and a
+        final-segment flag, and the header is authenticated with every
+        segment, so segments cannot be reordered, truncated or moved between
+        blobs without failing authentication.
+        """
+        return AESGCM(self.key).encrypt(_segment_nonce(header, index, last), data, header)
+
+    def decrypt_segment(self, header: bytes, index: int, last: bool, data: bytes) -> bytes:
+        """Decrypt and authenticate one segment of a segmented blob."""
+        return AESGCM(self.key).decrypt(_segment_nonce(header, index, last), data, header)
+
+    def encrypt_stream(self, src, dst, segment_size: int = SEGMENT_SIZE) -> int:
+        """Encrypt a binary stream segment by segment in constant memory.
+
+        Returns the number of plaintext bytes consumed.
+        """
+        if not self.key:
+            logger.error("No key available for stream encryption")
+            raise ValueError("Master password not set")
+
+        header = self.new_stream_header(segment_size)
+        aead = AESGCM(self.key)
+        dst.write(header)
+
+        total = 0
+        index = 0
+        segment = src.read(segment_size)
+        while True:
+            # Read one segment ahead so the final segment can be flagged
+            next_segment = src.read(segment_size)
+            last = not next_segment
+            dst.write(aead.encrypt(_segment_nonce(header, index, last), segment, header))
+            total += len(segment)
+            if last:
+                break
+            segment = next_segment
+            index += 1
+        logger.debug(f"Stream encrypted: {total} bytes in {index + 1} segments")
+        return total
+
+    def decrypt_stream(self, src, dst) -> int:
+        """Decrypt a segmented blob from src into dst in constant memory.
+
+        Only authenticated plaintext is ever written to dst. Returns the
+        number of plaintext bytes written.
+        """
+        if not self.key:
+            logger.error("No key available for stream decryption")
+            raise ValueError("Master password not set")
+
+        header = src.read(STREAM_HEADER.size)
+        if not self.is_stream_blob(header):
+            raise ValueError("Not a segmented blob")
+        segment_size = STREAM_HEADER.unpack_from(header)[2]
+        record_size = segment_size + TAG_SIZE
+
+        # Two input buffers (current and read-ahead) and one output buffer
+        # are reused for every segment
+        record = bytearray(record_size)
+        next_record = bytearray(record_size)
+        plaintext = bytearray(segment_size + UPDATE_INTO_SLACK)
+        total = 0
+        index = 0
+        record_len = src.readinto(record)
+        while True:
+            if record_len < TAG_SIZE:
+                raise ValueError("Truncated segmented blob")
+            next_len = src.readinto(next_record)
+            last = next_len == 0
+            written = self._decrypt_segment_into(
+                header, index, last, memoryview(record)[:record_len], plaintext
+            )
+            dst.write(memoryview(plaintext)[:written])
+            total += written
+            if last:
+                break
+            record, next_record = next_record, record
+            record_len = next_len
+            index += 1
+        logger.debug(f"Stream decrypted: {total} bytes in {index + 1} segments")
+        return total
+
+    def _decrypt_segment_into(self, header: bytes, index: int, last: bool,
+                              record: memoryview, out: bytearray) -> int:
+        """Decrypt and authenticate one segment record into out.
+
+        Returns the number of plaintext bytes written. out must not be used
+        if this raises, as it may hold unauthenticated plaintext.
+        """
+        decryptor = Cipher(
+            algorithms.AES(self.key),
+            modes.GCM(_segment_nonce(header, index, last), bytes(record[-TAG_SIZE:])),
+            backend=default_backend()
+        ).decryptor()
+        decryptor.authenticate_additional_data(header)
+        written = decryptor.update_into(record[:-TAG_SIZE], out)
+        decryptor.finalize()
+        return written
+
     def generate_password(self, length: int = 16, include_symbols: bool = True) -> str:
         """Generate a secure random password."""
-        chars = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
-        if include_symbols:
-            chars += "!@#$%^&*()_+-=[]{}|;:,.<>?"
-        return ''.join(secrets.choice(chars) for _ in range(length)) 
\ No newline at end of file
+        return generate_password(length, include_symbols)
\ No newline at end of file
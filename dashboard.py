@@ -1,14 +1,15 @@
 from PyQt6.QtWidgets import QWidget, QVBoxLayout, QLabel, QPushButton, QHBoxLayout, QFrame, QDialog, QGridLayout, QLineEdit, QTextEdit, QFileDialog, QMessageBox
 from PyQt6.QtGui import QFont, QColor, QIcon
 from PyQt6.QtCore import Qt
+from password_generator import generate_password
+from jobs import JobManager, add_file_job
 import os
-import string
-import random
 
 class DashboardWidget(QWidget):
-    def __init__(self, data_manager, parent=None):
+    def __init__(self, data_manager, parent=None, jobs=None):
         super().__init__(parent)
         self.data_manager = data_manager
+        self.jobs = jobs or JobManager(parent=self)
         self.setup_ui()
         self.refresh_summary()
 
@@ -183,17 +184,14 @@ class DashboardWidget(QWidget):
                 # Get file name from path
                 file_name = os.path.basename(file_path)
                 
-                # Add file to DataManager
-                self.data_manager.add_file(file_name, file_path)
-                
-                # Refresh summary
-                self.refresh_summary()
-                
-                QMessageBox.information(
+                # Encrypt in the background; refresh once the file is in
+                job = add_file_job(self.jobs, self.data_manager, file_name, file_path)
+                job.signals.finished.connect(lambda _: self.refresh_summary())
+                job.signals.failed.connect(lambda error: QMessageBox.warning(
                     self,
-                    "Success",
-                    f"File '{file_name}' added successfully!"
-                )
+                    "Error",
+                    f"Failed to add file '{file_name}': {error}"
+                ))
             except Exception as e:
                 QMessageBox.warning(
                     self,
@@ -226,9 +224,7 @@ class DashboardWidget(QWidget):
 
     def generate_password(self):
         """Generate a secure random password"""
-        length = 16
-        chars = string.ascii_letters + string.digits + "!@#$%^&*"
-        return ''.join(random.choice(chars) for _ in range(length))
+        return generate_password(16)
 
     def lock_safe(self):
         """Lock the safe and return to login screen"""
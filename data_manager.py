@@ -1,27 +1,128 @@
 import os
+import io
 import json
+import threading
 import logging
+from collections import Counter
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Dict, Optional
-from crypto import CryptoManager
+from typing import Optional
+from crypto import (CryptoManager, KDF_VERSION_LEGACY, KDF_VERSION_HKDF, KDF_VERSION_ENVELOPE,
+                    WRAPPED_KEY_SIZE, STREAM_HEADER, SEGMENT_SIZE, SCRYPT_MAX_LOG2_N, SCRYPT_MAX_P,
+                    SCRYPT_R, KDF_MAX_MEMORY, scrypt_memory,
+                    mapped_file, read_fully)
+from parallel_crypto import ParallelCryptoEngine
+from record_log import RecordLog, GroupCommitter
+from sqlite_store import SQLiteStore, SQLiteEntries
+from chunk_store import ChunkStore
+from migration import BlobMigration
+from entry_codec import pack_entries, unpack_entries
+from shard_store import ShardedSnapshot
+from entry_model import make_entry, compact_entries, entry_rows, gc_paused
+from concurrent.futures import Future
+from cryptography.exceptions import InvalidTag
+from durable_io import atomic_write, write_durable, replace_durable, fsync_file, fsync_directory
 import base64
+import struct
+import secrets
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+# Versioned config.enc header: magic, key schedule version, log2(Scrypt N), r, p.
+# The Scrypt parameters are the ones calibrated for this vault. The salt
+# (16 bytes) and password verifier (32 bytes) follow the header; on the
+# envelope key schedule they are followed by the data key wrapped under the
+# password and, if one was added, under the recovery key.
+CONFIG_MAGIC = b'DSCF'
+CONFIG_HEADER = struct.Struct('>4sBBHH')
+
+# File blob formats found in files_dir
+BLOB_FORMAT_STREAM = 'stream'                # Segmented binary format (crypto.STREAM_HEADER)
+BLOB_FORMAT_LEGACY_BASE64 = 'legacy-base64'  # One AES-GCM message over base64 text
+
+# Vault storage backends
+BACKEND_LOG = 'log'        # Sharded snapshot (or data.enc) plus data.log, all entries in memory
+BACKEND_SQLITE = 'sqlite'  # vault.db, one encrypted row per entry
+
+# Entry fields kept sealed in their own AES-GCM message inside the entry.
+# Everything else is metadata, readable once the vault is unlocked.
+SECRET_FIELDS = ('password', 'notes')
+SEALED_FIELD = 'sealed'
+SECRET_FIELD_SET = frozenset(SECRET_FIELDS)
+
+# Fold the record log into a fresh snapshot once it grows past this
+LOG_COMPACT_BYTES = 1024 * 1024
+
+class VaultBatch:
+    """Mutations buffered by DataManager.batch() until it commits."""
+
+    def __init__(self, changes: dict = None, new_blobs: list = None, new_chunks: list = None,
+                 crypto: CryptoManager = None):
+        # name -> new entry, or None for a deletion; last change per name wins
+        self.changes = changes if changes is not None else {}
+        # Blobs written by add_file in this batch, removed again on rollback
+        self.new_blobs = new_blobs if new_blobs is not None else []
+        # Chunk references taken by add_file in this batch, released on rollback
+        self.new_chunks = new_chunks if new_chunks is not None else []
+        # Key the batch's secrets, blobs and chunks are sealed with; a batch
+        # prepared before rotate_data_key is refused once the key changed
+        self.crypto = crypto
+
 class DataManager:
-    def __init__(self):
+    def __init__(self, data_dir=None, backend=None):
         logger.debug("Initializing DataManager")
         self.crypto = CryptoManager()
-        self.data_dir = Path.home() / '.digital_safe'
+        # Worker count and in-flight memory can be tuned on this engine
+        self.file_engine = ParallelCryptoEngine(self.crypto)
+        self.data_dir = Path(data_dir) if data_dir else Path.home() / '.digital_safe'
         self.data_file = self.data_dir / 'data.enc'
         self.files_dir = self.data_dir / 'files'
         self.config_file = self.data_dir / 'config.enc'
+        self.db_file = self.data_dir / 'vault.db'
+        # An existing vault.db selects SQLite; asking for SQLite on a vault
+        # that has a snapshot migrates it on the next load
+        self.backend = backend or (BACKEND_SQLITE if self.db_file.exists() else BACKEND_LOG)
+        self.store = None
+        # Snapshot of the entries, split over shard files by name. Vaults on
+        # the legacy key schedule keep the single data.enc until migrated.
+        self.shards = ShardedSnapshot(self.data_dir / 'shards', self.crypto,
+                                      make_rows=entry_rows)
+        # Names changed since the last snapshot; only their shards are rewritten
+        self._dirty_names = set()
+        # Mutations since the last snapshot, replayed over it on load
+        self.record_log = RecordLog(self.data_dir / 'data.log', self.crypto)
+        self.log_compact_bytes = LOG_COMPACT_BYTES
+        # Mutations within a few milliseconds share one log write and fsync
+        self.committer = GroupCommitter(self.record_log)
+        # Entry name -> compact, read-only Entry record
         self.entries = {}
+        # Set once load_data has read the whole vault; until then nothing
+        # may be written, so a failed load can't overwrite what is on disk
+        self._loaded = False
+        # Guards entries and the record log; compaction holds it only while
+        # rotating the log and copying entries
+        self._lock = threading.RLock()
+        self._compaction_lock = threading.Lock()
+        # Set while rotate_data_key runs; writes are refused meanwhile
+        self._rotating = False
+        self._compaction_thread = None
+        # The batch() open on the current thread, if any
+        self._local = threading.local()
+        # Rewrite base64-era file blobs in the background after unlock
+        self.auto_upgrade_files = False
+        # Store new files as deduplicated chunks rather than one blob each
+        self.chunk_files = True
+        self.chunk_store = ChunkStore(self.files_dir / 'chunks', self.crypto)
+        # Rewrites blobs to the current format and key in the background;
+        # workers and throttle can be tuned on it
+        self.migration = BlobMigration(self.data_dir / 'migration.log', self.crypto,
+                                       self._rewrite_blob, self._blob_needs_rewrite)
+        self.chunk_store.migration = self.migration
         
         # Create necessary directories
-        self.data_dir.mkdir(exist_ok=True)
+        self.data_dir.mkdir(parents=True, exist_ok=True)
         self.files_dir.mkdir(exist_ok=True)
         logger.debug("Directories created/verified")
         
@@ -33,33 +134,88 @@ class DataManager:
             self.load_data()
 
     def load_config(self):
-        """Load the configuration file (always plaintext: 16 bytes salt + 32 bytes hash)."""
+        """Load the configuration file (plaintext key schedule header).
+
+        Two layouts are understood: the legacy 48-byte layout (16 bytes salt +
+        32 bytes Scrypt hash) and the versioned header written by save_config.
+        """
         logger.debug("Loading configuration (plaintext)")
         if self.config_file.exists():
             with open(self.config_file, 'rb') as f:
                 config_data = f.read()
-                if config_data and len(config_data) == 48:
-                    self.crypto.salt = config_data[:16]
-                    self.crypto.master_password_hash = config_data[16:]
-                    logger.debug("Configuration loaded successfully (plaintext)")
+            if config_data.startswith(CONFIG_MAGIC) and len(config_data) >= CONFIG_HEADER.size + 48:
+                _, version, log2_n, r, p = CONFIG_HEADER.unpack_from(config_data)
+                if version == KDF_VERSION_HKDF:
+                    wrapped_sizes = (0,)
+                elif version == KDF_VERSION_ENVELOPE:
+                    wrapped_sizes = (WRAPPED_KEY_SIZE, 2 * WRAPPED_KEY_SIZE)
                 else:
-                    logger.error("Invalid config file format or empty config file.")
+                    wrapped_sizes = ()
+                if len(config_data) - CONFIG_HEADER.size - 48 not in wrapped_sizes:
+                    logger.error(f"Unsupported config version: {version}")
+                    self.crypto.salt = None
+                    self.crypto.master_password_hash = None
+                    return
+                # Reject parameters no calibration would produce, so a
+                # tampered header cannot make unlock arbitrarily expensive:
+                # calibration keeps r fixed and the memory of one Scrypt
+                # run within KDF_MAX_MEMORY, and p bounds the run count
+                if not (1 <= log2_n <= SCRYPT_MAX_LOG2_N and r == SCRYPT_R
+                        and scrypt_memory(2 ** log2_n, r) <= KDF_MAX_MEMORY
+                        and 1 <= p <= SCRYPT_MAX_P):
+                    logger.error(f"Invalid KDF parameters in config: n=2**{log2_n}, r={r}, p={p}")
                     self.crypto.salt = None
                     self.crypto.master_password_hash = None
+                    return
+                body = config_data[CONFIG_HEADER.size:]
+                self.crypto.kdf_version = version
+                self.crypto.scrypt_n = 2 ** log2_n
+                self.crypto.scrypt_r = r
+                self.crypto.scrypt_p = p
+                self.crypto.salt = body[:16]
+                self.crypto.master_password_hash = body[16:48]
+                wrapped = body[48:]
+                self.crypto.wrapped_key = wrapped[:WRAPPED_KEY_SIZE] or None
+                self.crypto.recovery_wrapped_key = wrapped[WRAPPED_KEY_SIZE:] or None
+                logger.debug(f"Configuration loaded successfully (version {version})")
+            elif len(config_data) == 48:
+                self.crypto.kdf_version = KDF_VERSION_LEGACY
+                self.crypto.salt = config_data[:16]
+                self.crypto.master_password_hash = config_data[16:]
+                logger.debug("Legacy configuration loaded successfully")
+            else:
+                logger.error("Invalid config file format or empty config file.")
+                self.crypto.salt = None
+                self.crypto.master_password_hash = None
         else:
             logger.debug("No configuration file found")
 
     def save_config(self):
-        """Save the salt and master password hash to the configuration file (always plaintext)."""
+        """Save the key schedule header to the configuration file (always plaintext)."""
         logger.debug("Saving configuration (plaintext)")
         if not self.crypto.salt or not self.crypto.master_password_hash:
             logger.error("Cannot save config: Master password not set")
             raise ValueError("Master password not set")
-        config_data = self.crypto.salt + self.crypto.master_password_hash
-        with open(self.config_file, 'wb') as f:
-            f.write(config_data)
+        atomic_write(self.config_file, self._config_bytes())
         logger.debug("Configuration saved successfully (plaintext)")
 
+    def _config_bytes(self, crypto: CryptoManager = None) -> bytes:
+        """Serialize the key schedule in the layout matching its version."""
+        crypto = crypto or self.crypto
+        if crypto.kdf_version == KDF_VERSION_LEGACY:
+            return crypto.salt + crypto.master_password_hash
+        header = CONFIG_HEADER.pack(
+            CONFIG_MAGIC,
+            crypto.kdf_version,
+            crypto.scrypt_n.bit_length() - 1,
+            crypto.scrypt_r,
+            crypto.scrypt_p
+        )
+        config = header + crypto.salt + crypto.master_password_hash
+        if crypto.kdf_version == KDF_VERSION_ENVELOPE:
+            config += crypto.wrapped_key + (crypto.recovery_wrapped_key or b'')
+        return config
+
     def is_first_run(self) -> bool:
         """Check if this is the first time running the application."""
         is_first = not self.config_file.exists()
@@ -67,10 +223,16 @@ class DataManager:
         return is_first
 
     def set_master_password(self, password: str):
-        """Set the master password and save configuration."""
+        """Set the master password and save configuration.
+
+        The KDF is calibrated for this machine first; the chosen parameters
+        are stored in the config header and reused on every unlock.
+        """
         logger.debug("Setting master password")
+        self.crypto.calibrate_kdf()
         self.crypto.set_master_password(password)
         self.save_config()
+        self.load_data()
         logger.debug("Master password set and configuration saved")
 
     def verify_master_password(self, password: str) -> bool:
@@ -87,98 +249,866 @@ class DataManager:
             except Exception as e:
                 logger.error(f"Failed to load data after verification: {str(e)}")
                 return False
+
+            if self.crypto.kdf_version == KDF_VERSION_LEGACY:
+                try:
+                    self.migrate_key_schedule(password)
+                except Exception as e:
+                    # The vault is still readable with the legacy key, so
+                    # keep it unlocked and retry on the next login.
+                    logger.error(f"Failed to migrate key schedule: {str(e)}")
+            elif self.crypto.kdf_version == KDF_VERSION_HKDF:
+                try:
+                    self.wrap_key_schedule(password)
+                except Exception as e:
+                    logger.error(f"Failed to move key schedule to a wrapped data key: {str(e)}")
+
+            if self.backend == BACKEND_SQLITE and self.store is None:
+                try:
+                    self.migrate_to_sqlite()
+                except Exception as e:
+                    logger.error(f"Failed to migrate vault to SQLite: {str(e)}")
+
+            if self.auto_upgrade_files:
+                self.upgrade_legacy_files()
+            else:
+                self._resume_migration()
                 
         return result
 
+    def change_master_password(self, old_password: str, new_password: str) -> bool:
+        """Change the master password of the unlocked vault.
+
+        Only the wrapped data key in config.enc is rewritten, so this takes
+        one Scrypt run to check old_password and one for new_password,
+        whatever the size of the vault. Returns False if old_password is
+        wrong. A vault still on the legacy key schedule is migrated under
+        the new password instead, which re-encrypts it once.
+        """
+        logger.debug("Changing master password")
+        if not self.crypto.key:
+            logger.error("Cannot change password: Master password not set")
+            raise ValueError("Master password not set")
+
+        if self.crypto.kdf_version == KDF_VERSION_LEGACY:
+            if not self.crypto.verify_master_password(old_password):
+                return False
+            self.migrate_key_schedule(new_password)
+            return True
+
+        with self._config_update():
+            if not self.crypto.change_master_password(old_password, new_password):
+                logger.debug("Password change rejected: wrong master password")
+                return False
+        logger.debug("Master password changed")
+        return True
+
+    def add_recovery_key(self) -> str:
+        """Add a recovery key to the unlocked vault and return it.
+
+        The key can reset the master password (reset_master_password) and
+        is not stored anywhere else, so the caller must show it to the user.
+        Adding a key replaces the previous one.
+        """
+        logger.debug("Adding recovery key")
+        with self._config_update():
+            return self.crypto.add_recovery_key()
+
+    def remove_recovery_key(self):
+        """Remove the recovery key; it stops working immediately."""
+        logger.debug("Removing recovery key")
+        with self._config_update():
+            self.crypto.recovery_wrapped_key = None
+
+    def has_recovery_key(self) -> bool:
+        """Whether a recovery key has been added to the vault."""
+        return bool(self.crypto.recovery_wrapped_key)
+
+    def reset_master_password(self, recovery_key: str, new_password: str) -> bool:
+        """Unlock with the recovery key and set a new master password.
+
+        Like change_master_password this only rewraps the data key. The
+        recovery key keeps working afterwards. Returns False if the
+        recovery key is wrong.
+        """
+        logger.debug("Resetting master password with recovery key")
+        with self._config_update():
+            if not self.crypto.verify_recovery_key(recovery_key):
+                logger.debug("Password reset rejected: wrong recovery key")
+                return False
+            self.crypto.wrap_data_key(new_password)
+        self.load_data()
+        self._resume_migration()
+        logger.debug("Master password reset and data loaded")
+        return True
+
+    def wrap_key_schedule(self, password: str):
+        """Move an unlocked HKDF vault to the envelope key schedule.
+
+        Its root key becomes the data key and is wrapped under the same
+        password with a fresh salt; no entry or file is re-encrypted.
+        """
+        logger.debug("Wrapping HKDF root key as the data key")
+        with self._config_update():
+            self.crypto.wrap_data_key(password)
+
+    @contextmanager
+    def _config_update(self):
+        """Save the key schedule changed in the block, or reload it on failure.
+
+        config.enc is replaced atomically, so if the block or the save fails
+        the file still holds the previous key schedule.
+        """
+        try:
+            yield
+            self.save_config()
+        except BaseException:
+            self.load_config()
+            raise
+
+    def migrate_key_schedule(self, password: str):
+        """Re-key a legacy vault to the current key schedule.
+
+        The legacy PBKDF2 key must already be loaded. The entries are
+        resealed at once, but file blobs are left to the background
+        migration: the legacy key goes into its journal, sealed with the new
+        key, and blobs are read with it until they have been rewritten.
+
+        The resealed entries are written as a sharded snapshot, which only
+        a config on the new key schedule reads; until config.enc is
+        replaced the vault keeps loading data.enc with the legacy key. That
+        one atomic replace is the commit point, so a crash at any moment
+        leaves either the whole legacy vault or the whole migrated one.
+        """
+        logger.debug("Migrating legacy key schedule")
+        self.migration.stop()
+        # Fold the log into data.enc first: replay would reject records
+        # sealed with the legacy key once config.enc holds the new one
+        self.save_data()
+        legacy_crypto = self.crypto
+        new_crypto = CryptoManager()
+        new_crypto.calibrate_kdf()
+        new_crypto.set_master_password(password)
+
+        # Secrets sealed under the legacy key are resealed under the new one
+        resealed = {
+            name: self.seal_entry(self.unseal_entry(entry, legacy_crypto), new_crypto)
+            for name, entry in self.entries.items()
+        }
+
+        config_temp = self.config_file.with_name(self.config_file.name + '.migrating')
+        try:
+            # Chunked files need the HKDF key schedule, so a legacy vault
+            # only has blobs
+            self.migration.crypto = new_crypto
+            self.migration.plan(self._blob_paths(), source_key=legacy_crypto.key)
+
+            # Shards left by an earlier, interrupted attempt are replaced
+            self.shards.remove()
+            self.shards.crypto = new_crypto
+            self.shards.save(resealed, resealed, full=True)
+
+            self.crypto = new_crypto
+            write_durable(config_temp, self._config_bytes())
+            # The new snapshot and config are on disk; this switches the
+            # vault over
+            replace_durable(config_temp, self.config_file)
+        except Exception:
+            if self.crypto is new_crypto and not config_temp.exists():
+                # Only syncing the directory after the rename failed; the
+                # new config is in place, so the migration stands
+                logger.error("Config replaced but not synced during key migration")
+            else:
+                self.crypto = legacy_crypto
+                self.shards.crypto = legacy_crypto
+                self.migration.crypto = legacy_crypto
+                self.migration.journal.reset()
+                self.migration.load()
+                for cleanup in (self.shards.remove, lambda: os.remove(config_temp)):
+                    try:
+                        cleanup()
+                    except OSError:
+                        pass
+                raise
+
+        self.entries = compact_entries(resealed)
+        self._use_crypto(self.crypto)
+        # data.enc was sealed with the legacy key and the new snapshot
+        # already contains it; a crash before it is gone leaves it ignored
+        try:
+            self.record_log.reset()
+            if self.data_file.exists():
+                os.remove(self.data_file)
+                fsync_directory(self.data_dir)
+        except OSError as e:
+            logger.error(f"Failed to remove legacy vault data: {str(e)}")
+        logger.debug(f"Key schedule migrated ({self.migration.remaining()} blobs left to re-encrypt)")
+
+    def rotate_data_key(self, password: str, background: bool = True):
+        """Re-encrypt the vault under a fresh random data key.
+
+        Changing the password only rewraps the data key, so this is the way
+        to retire a key that may have leaked, e.g. with an old copy of
+        config.enc and its password. Entries are resealed into a new
+        snapshot at once; file blobs and chunks are left to the background
+        migration, which reads them with the old key until they have been
+        rewritten, as migrate_key_schedule does. Chunks keep their names,
+        which came from the old key, so later files are not deduplicated
+        against them. A recovery key stops working and has to be added again.
+
+        Writes are refused while this runs, and a batch prepared under the
+        old key is refused when it is committed. Returns False if password
+        is wrong; otherwise, with background set, the migration's thread,
+        else the number of blobs and chunks it rewrote.
+        """
+        logger.debug("Rotating data key")
+        if not self.crypto.key:
+            logger.error("Cannot rotate key: Master password not set")
+            raise ValueError("Master password not set")
+        self._require_loaded()
+        if self.store is not None or self.crypto.kdf_version != KDF_VERSION_ENVELOPE:
+            logger.error("Key rotation needs the log backend and the envelope key schedule")
+            raise ValueError("Key rotation is not supported for this vault")
+        if not self.crypto.verify_master_password(password):
+            logger.debug("Key rotation rejected: wrong master password")
+            return False
+
+        # The journal holds one source key, so an earlier migration has to
+        # finish before blobs are sealed with a third
+        if self.migration.active() or self.migration.load():
+            self.migration.stop()
+            self.migration.run()
+            if self.migration.active():
+                logger.error("Cannot rotate key: file migration did not finish")
+                raise ValueError("File migration did not finish")
+
+        with self._lock:
+            self._rotating = True
+        try:
+            # Everything written so far goes into a snapshot under the old
+            # key, which leaves no log record for replay to reject later
+            self.flush()
+            self.save_data()
+            with self._compaction_lock:
+                self._rotate_data_key(password)
+        finally:
+            with self._lock:
+                self._rotating = False
+        logger.debug(f"Data key rotated ({self.migration.remaining()} blobs and chunks "
+                     f"left to re-encrypt)")
+        if background:
+            return self.migration.start()
+        return self.migration.run()
+
+    def _rotate_data_key(self, password: str):
+        """Write the vault under a new data key and switch config.enc to it.
+
+        The new snapshot is written next to the current one and swapped in
+        after config.enc has been replaced, which is the commit point; a
+        load finishes or drops a swap a crash interrupted.
+        """
+        old_crypto = self.crypto
+        new_crypto = CryptoManager()
+        # The KDF was calibrated for this machine when the vault was set up
+        new_crypto.scrypt_n = old_crypto.scrypt_n
+        new_crypto.scrypt_r = old_crypto.scrypt_r
+        new_crypto.scrypt_p = old_crypto.scrypt_p
+        new_crypto.compression_codec = old_crypto.compression_codec
+        new_crypto.compression_level = old_crypto.compression_level
+        new_crypto.set_master_password(password)
+
+        resealed = {
+            name: self.seal_entry(self.unseal_entry(entry, old_crypto), new_crypto)
+            for name, entry in self.entries.items()
+        }
+
+        rotated = self._rotated_shards(new_crypto)
+        config_temp = self.config_file.with_name(self.config_file.name + '.rotating')
+        written = False
+        try:
+            self.migration.crypto = new_crypto
+            self.migration.plan(self._blob_paths() + self.chunk_store.chunk_paths(),
+                                source_key=old_crypto.key)
+
+            # Left by an earlier, interrupted attempt
+            rotated.remove()
+            rotated.save(resealed, resealed, full=True)
+
+            write_durable(config_temp, self._config_bytes(new_crypto))
+            written = True
+            replace_durable(config_temp, self.config_file)
+        except Exception:
+            if written and not config_temp.exists():
+                # Only syncing the directory after the rename failed; the
+                # new config is in place, so the rotation stands
+                logger.error("Config replaced but not synced during key rotation")
+            else:
+                self.migration.crypto = old_crypto
+                self.migration.journal.reset()
+                self.migration.load()
+                for cleanup in (rotated.remove, lambda: os.remove(config_temp)):
+                    try:
+                        cleanup()
+                    except OSError:
+                        pass
+                raise
+
+        with self._lock:
+            self.crypto = new_crypto
+            self.entries = compact_entries(resealed)
+            self._dirty_names = set()
+        self._use_crypto(new_crypto)
+        try:
+            self.shards.replace_with(rotated)
+        except OSError as e:
+            # The old snapshot can't be read with the new key; writes wait
+            # for the next load to finish the swap
+            logger.error(f"Failed to swap in the rotated snapshot: {str(e)}")
+            self._loaded = False
+
+    def _rotated_shards(self, crypto: CryptoManager) -> ShardedSnapshot:
+        """Snapshot written by rotate_data_key before it is swapped in."""
+        return ShardedSnapshot(self.data_dir / 'shards.rotating', crypto,
+                               make_rows=entry_rows)
+
+    def _finish_key_rotation(self):
+        """Swap in or drop a snapshot left by an interrupted key rotation.
+
+        If config.enc was replaced the rotated snapshot's manifest opens
+        with the current key and the swap is finished; otherwise it is left
+        from before the commit point and removed, as long as the current
+        snapshot does open.
+        """
+        rotated = self._rotated_shards(self.crypto)
+        if not rotated.shards_dir.exists():
+            return
+        for snapshot in (rotated, self.shards):
+            try:
+                self.crypto.decrypt_data(snapshot.manifest_path.read_bytes())
+            except (OSError, InvalidTag, ValueError):
+                continue
+            if snapshot is rotated:
+                logger.debug("Finishing interrupted key rotation")
+                self.shards.replace_with(rotated)
+            else:
+                logger.debug("Removing snapshot of an unfinished key rotation")
+                rotated.remove()
+            return
+        logger.error("Neither snapshot of an interrupted key rotation can be read")
+        raise ValueError("Vault snapshot can't be read")
+
+    def _use_crypto(self, crypto: CryptoManager):
+        """Point every component that seals data at crypto."""
+        self.shards.crypto = crypto
+        self.file_engine.crypto = crypto
+        self.record_log.crypto = crypto
+        self.chunk_store.crypto = crypto
+        self.migration.crypto = crypto
+
     def load_data(self):
         """Load encrypted data from file."""
         logger.debug("Loading data")
         if not self.crypto.key:
             logger.error("Cannot load data: Master password not set")
             raise ValueError("Master password not set")
-            
-        if self.data_file.exists():
+        self._loaded = False
+
+        if self.backend == BACKEND_SQLITE and self._open_sqlite():
+            self._load_chunk_references()
+            self._loaded = True
+            return
+
+        with gc_paused():
+            self._load_entries()
+
+        # Vaults written before secrets were sealed per entry; the plaintext
+        # leaves the snapshot at the next compaction
+        unsealed = [name for name, entry in self.entries.items()
+                    if not SECRET_FIELD_SET.isdisjoint(entry)]
+        for name in unsealed:
+            self.entries[name] = make_entry(self.seal_entry(self.entries[name]))
+            self._dirty_names.add(name)
+        if unsealed:
+            logger.debug(f"Sealed secrets of {len(unsealed)} entries")
+        self._load_chunk_references()
+        self._loaded = True
+
+    def _load_entries(self):
+        """Read the snapshot and replay the log over it into entries."""
+        # A snapshot that can't be read is an error, never an empty vault:
+        # carrying on would let the next save replace it. Legacy vaults
+        # only read data.enc; shards next to one were written by a key
+        # migration that did not get as far as replacing config.enc.
+        if self.crypto.kdf_version != KDF_VERSION_LEGACY:
+            self._finish_key_rotation()
+        if self.crypto.kdf_version != KDF_VERSION_LEGACY and self.shards.exists():
+            try:
+                self.entries = self.shards.load()
+                logger.debug("Data loaded successfully")
+            except Exception as e:
+                logger.error(f"Failed to load data shards: {str(e)}")
+                raise
+        elif self.data_file.exists():
             try:
-                with open(self.data_file, 'rb') as f:
-                    encrypted_data = f.read()
+                # Decrypt straight from the mapped file into one buffer,
+                # which unpack_entries reads without further copies (legacy
+                # JSON vaults are parsed from the bytearray directly)
+                with mapped_file(self.data_file) as encrypted_data:
                     if encrypted_data:
-                        try:
-                            decrypted_data = self.crypto.decrypt_data(encrypted_data)
-                            self.entries = json.loads(decrypted_data)
-                            logger.debug("Data loaded successfully")
-                        except Exception as e:
-                            logger.error(f"Failed to decrypt data: {str(e)}")
-                            self.entries = {}
+                        decrypted_data = self.crypto.decrypt_bytes(encrypted_data, decompress=True)
+                        self.entries = unpack_entries(decrypted_data, entry_rows)
+                        logger.debug("Data loaded successfully")
                     else:
                         logger.debug("Data file is empty")
                         self.entries = {}
             except Exception as e:
-                logger.error(f"Failed to read data file: {str(e)}")
-                self.entries = {}
+                logger.error(f"Failed to load data file: {str(e)}")
+                raise
         else:
             logger.debug("No data file found")
             self.entries = {}
 
-    def save_data(self):
-        """Save encrypted data to file."""
+        self._dirty_names = set()
+        self.record_log.replay(self.entries, self._dirty_names)
+        # Legacy JSON snapshots and log records come in as dicts
+        self.entries = compact_entries(self.entries)
+
+    def _load_chunk_references(self):
+        """Count chunk references from the file manifests."""
+        self.chunk_store.rebuild(
+            entry['chunks'] for entry in self.entries.values() if 'chunks' in entry
+        )
+
+    def _require_loaded(self):
+        """Refuse writes to a vault whose data did not load completely."""
+        if not self._loaded:
+            logger.error("Vault data is not loaded")
+            raise ValueError("Vault data is not loaded")
+
+    def collect_garbage(self) -> int:
+        """Delete chunks no entry refers to, e.g. left by a crash mid-add.
+
+        A maintenance step, never run on unlock: the reference counts come
+        from the loaded entries, so it is refused unless the whole vault
+        loaded. Returns the number of chunks removed.
+        """
+        self._require_loaded()
+        return self.chunk_store.collect_garbage()
+
+    def seal_entry(self, entry: dict, crypto: CryptoManager = None) -> dict:
+        """Return a copy of entry with its secret fields sealed.
+
+        The password and notes are encrypted together into one base64 field,
+        so listing and searching entries never decrypts them.
+        """
+        crypto = crypto or self.crypto
+        sealed = dict(entry)
+        secrets = {field: sealed.pop(field) for field in SECRET_FIELDS if field in sealed}
+        if secrets:
+            # encrypt_many reuses the cached AEAD context; long notes compress
+            ciphertext = crypto.encrypt_many([crypto.compress(json.dumps(secrets).encode())])[0]
+            sealed[SEALED_FIELD] = base64.b64encode(ciphertext).decode()
+        return sealed
+
+    def unseal_entry(self, entry: dict, crypto: CryptoManager = None) -> dict:
+        """Return a copy of entry with its secret fields decrypted."""
+        crypto = crypto or self.crypto
+        unsealed = dict(entry)
+        ciphertext = unsealed.pop(SEALED_FIELD, None)
+        if ciphertext is not None:
+            decrypted = crypto.decrypt_bytes(base64.b64decode(ciphertext))
+            plaintext = crypto.decompress(decrypted)
+            unsealed.update(json.loads(plaintext))
+            # Don't leave the decrypted payload lying around in the buffers
+            for buffer in (decrypted, plaintext):
+                buffer[:] = bytes(len(buffer))
+        return unsealed
+
+    def _open_sqlite(self) -> bool:
+        """Open vault.db as the entry store.
+
+        Returns False if the vault still lives in its snapshot and record
+        log and has to be loaded from there; verify_master_password then migrates it, once
+        the key schedule is current.
+        """
+        log_files = (self.data_file, self.shards.manifest_path,
+                     self.record_log.path, self.record_log.rotated_path)
+        if not self.db_file.exists() and any(path.exists() for path in log_files):
+            return False
+        if self.store is None:
+            self.store = SQLiteStore(self.db_file, self.crypto)
+        self.entries = SQLiteEntries(self.store)
+        # Leftovers of a migration interrupted after vault.db was in place
+        self._remove_log_storage()
+        logger.debug("SQLite vault opened")
+        return True
+
+    def migrate_to_sqlite(self):
+        """Move the vault from its snapshot and record log into vault.db.
+
+        The database is built under a temporary name and renamed into place
+        once complete, so vault.db existing means the import finished.
+        """
+        logger.debug("Migrating vault to SQLite")
+        if self.store is not None:
+            return
+        self._require_loaded()
+        self.flush()
+        with self._compaction_lock, self._lock:
+            temp_path = self.db_file.with_name(self.db_file.name + '.migrating')
+            if temp_path.exists():
+                os.remove(temp_path)
+            store = SQLiteStore(temp_path, self.crypto)
+            try:
+                store.apply(list(self.entries.items()))
+            finally:
+                store.close()
+            fsync_file(temp_path)
+            replace_durable(temp_path, self.db_file)
+            self.backend = BACKEND_SQLITE
+            self._open_sqlite()
+        logger.debug(f"Vault migrated to SQLite ({len(self.entries)} entries)")
+
+    def _remove_log_storage(self):
+        """Delete the snapshot and the record log after a move to SQLite."""
+        self.record_log.reset()
+        self.shards.remove()
+        if self.data_file.exists():
+            os.remove(self.data_file)
+            fsync_directory(self.data_dir)
+
+    def save_data(self, full: bool = False):
+        """Write the entries' encrypted snapshot and clear the record log.
+
+        Only the shards holding entries changed since the last snapshot are
+        rewritten, unless full is set or the vault needs resharding. Vaults
+        still on the legacy key schedule write all of data.enc.
+        """
         logger.debug("Saving data")
         if not self.crypto.key:
             logger.error("Cannot save data: Master password not set")
             raise ValueError("Master password not set")
-        encrypted_data = self.crypto.encrypt_data(json.dumps(self.entries))
-        with open(self.data_file, 'wb') as f:
-            f.write(encrypted_data)
+        self._require_loaded()
+        if self.store is not None:
+            # Every SQLite commit is already durable
+            return
+        with self._compaction_lock:
+            with self._lock:
+                self.record_log.rotate()
+                # Entries are replaced, never mutated in place, so a shallow
+                # copy is a consistent snapshot
+                snapshot = dict(self.entries)
+                changed, self._dirty_names = self._dirty_names, set()
+            try:
+                if self.crypto.kdf_version != KDF_VERSION_LEGACY:
+                    self.shards.save(snapshot, changed, full)
+                    # A data.enc left from before sharding is superseded now
+                    if self.data_file.exists():
+                        os.remove(self.data_file)
+                        fsync_directory(self.data_dir)
+                else:
+                    encrypted_data = self.crypto.encrypt_bytes(pack_entries(snapshot), compress=True)
+                    atomic_write(self.data_file, encrypted_data)
+            except Exception:
+                with self._lock:
+                    self._dirty_names |= changed
+                raise
+            self.record_log.discard_rotated()
         logger.debug("Data saved successfully")
 
-    def add_entry(self, name: str, username: str, password: str, notes: str = ""):
-        """Add a new password entry."""
+    def compact(self, background: bool = True):
+        """Fold the record log into a new snapshot.
+
+        With background set this runs on a daemon thread, which is returned;
+        mutations keep appending to a fresh log meanwhile. A compaction that
+        is already running is not started twice.
+        """
+        if not background:
+            self.save_data()
+            return None
+        with self._lock:
+            if self._compaction_thread and self._compaction_thread.is_alive():
+                return self._compaction_thread
+            self._compaction_thread = threading.Thread(
+                target=self._compact_quietly,
+                name="vault-compaction",
+                daemon=True
+            )
+            self._compaction_thread.start()
+            return self._compaction_thread
+
+    def _compact_quietly(self):
+        """Background compaction body; the log stays authoritative on failure."""
+        try:
+            self.save_data()
+        except Exception as e:
+            logger.error(f"Compaction failed: {str(e)}")
+
+    @contextmanager
+    def batch(self, wait: bool = True):
+        """Group mutations into one transaction.
+
+        Inside the with block add_entry, add_file, update_entry and
+        delete_entry on this thread are buffered instead of persisted. On a
+        clean exit they are applied to entries and committed as one log
+        write; if the block raises, nothing is applied and blobs written by
+        add_file are removed. Reads see the batch only after it commits.
+        Nested batches join the outermost one.
+        """
+        if self._current_batch() is not None:
+            yield self._current_batch()
+            return
+        batch = VaultBatch(crypto=self.crypto)
+        self._local.batch = batch
+        try:
+            yield batch
+        except BaseException:
+            self._local.batch = None
+            self.discard_batch(batch)
+            raise
+        self._local.batch = None
+        self._apply_batch(batch, wait)
+
+    def stage_file(self, name: str, file_path: str, notes: str = "", progress=None,
+                   fields: dict = None, digest=None) -> VaultBatch:
+        """Store a file's chunks or blob without committing its entry.
+
+        Returns a batch for commit_batch, or for discard_batch to drop the
+        stored data again. This lets a caller encrypt several files at once
+        and still commit them in an order of its choosing. fields are extra
+        metadata kept in the entry, such as the source file's mtime. digest,
+        a hashlib object, is fed the file as it is stored and its hex
+        digest kept in the entry's 'digest' field.
+        """
+        previous = self._current_batch()
+        batch = VaultBatch(crypto=self.crypto)
+        self._local.batch = batch
+        try:
+            self.add_file(name, file_path, notes, progress=progress, digest=digest)
+            if digest is not None:
+                fields = {**(fields or {}), 'digest': digest.hexdigest()}
+            if fields:
+                batch.changes[name] = {**batch.changes[name], **fields}
+        except BaseException:
+            self.discard_batch(batch)
+            raise
+        finally:
+            self._local.batch = previous
+        return batch
+
+    def commit_batch(self, batch: VaultBatch, wait: bool = True):
+        """Commit a batch from stage_file; returns the commit's Future."""
+        return self._apply_batch(batch, wait)
+
+    def discard_batch(self, batch: VaultBatch):
+        """Drop an uncommitted batch, removing the blobs and chunks it wrote."""
+        logger.debug(f"Rolling back batch of {len(batch.changes)} changes")
+        for encrypted_path in batch.new_blobs:
+            self._remove_blob(encrypted_path)
+        self.chunk_store.release(batch.new_chunks)
+
+    def _current_batch(self) -> Optional[VaultBatch]:
+        """The batch open on this thread, or None."""
+        return getattr(self._local, 'batch', None)
+
+    def _mutate(self, changes: dict, wait: bool, new_blobs: list = None,
+                new_chunks: list = None, crypto: CryptoManager = None):
+        """Buffer changes in the open batch, or commit them on their own.
+
+        crypto is the key the changes were sealed with, taken before any of
+        them was.
+        """
+        batch = self._current_batch()
+        if batch is not None:
+            batch.changes.update(changes)
+            batch.new_blobs.extend(new_blobs or [])
+            batch.new_chunks.extend(new_chunks or [])
+            return None
+        return self._apply_batch(VaultBatch(changes, new_blobs, new_chunks, crypto), wait)
+
+    def _apply_batch(self, batch: VaultBatch, wait: bool):
+        """Apply a batch to entries and persist it as one group commit.
+
+        Each change becomes one encrypted log record; the snapshot is only
+        rewritten by compaction. Blobs no entry refers to any more are
+        removed once the commit is durable; if it fails, entries are rolled
+        back and the batch's new blobs removed. Returns the commit's Future.
+        """
+        if not batch.changes:
+            return None
+        if not self._loaded:
+            self.discard_batch(batch)
+            self._require_loaded()
+        if self.store is not None:
+            return self._apply_batch_sqlite(batch)
+        # The same Entry objects go into entries and the batch, which
+        # _finish_batch relies on to tell them from later changes
+        batch.changes = {name: None if entry is None else make_entry(entry)
+                         for name, entry in batch.changes.items()}
+        with self._lock:
+            # Checked under the lock, so nothing gets past a rotation's
+            # snapshot or commits secrets sealed with the key it replaced
+            if self._rotating:
+                self.discard_batch(batch)
+                logger.error("Cannot write while the vault key is rotated")
+                raise ValueError("Vault key rotation in progress")
+            if batch.crypto is not None and batch.crypto is not self.crypto:
+                self.discard_batch(batch)
+                logger.error("Vault key changed while the batch was prepared")
+                raise ValueError("Vault key changed while the batch was prepared")
+            previous = {name: self.entries.get(name) for name in batch.changes}
+            self._dirty_names.update(batch.changes)
+            for name, entry in batch.changes.items():
+                if entry is None:
+                    self.entries.pop(name, None)
+                else:
+                    self.entries[name] = entry
+            # Queued under the lock, so concurrent batches reach the log in
+            # the order they were applied to entries
+            future = self.committer.submit(list(batch.changes.items()))
+        if wait:
+            try:
+                future.result()
+            except Exception:
+                self._finish_batch(batch, previous, failed=True)
+                raise
+            self._finish_batch(batch, previous, failed=False)
+        else:
+            future.add_done_callback(lambda done: self._finish_batch(
+                batch, previous, failed=done.exception() is not None
+            ))
+        if self.record_log.size() >= self.log_compact_bytes:
+            self.compact()
+        return future
+
+    def _apply_batch_sqlite(self, batch: VaultBatch) -> Future:
+        """Apply a batch as one SQLite transaction; durable on return."""
+        with self._lock:
+            previous = {name: self.store.get(name) for name in batch.changes}
+            try:
+                self.store.apply(list(batch.changes.items()))
+            except Exception:
+                self._finish_batch(batch, previous, failed=True)
+                raise
+        self._finish_batch(batch, previous, failed=False)
+        future = Future()
+        future.set_result(None)
+        return future
+
+    def _finish_batch(self, batch: VaultBatch, previous: dict, failed: bool):
+        """Roll a failed batch back, or drop the blobs a durable one orphaned."""
+        if failed:
+            # A failed SQLite transaction has already rolled itself back
+            if self.store is None:
+                with self._lock:
+                    for name, entry in previous.items():
+                        # Leave names a later mutation has changed since
+                        if self.entries.get(name) is not batch.changes[name]:
+                            continue
+                        if entry is None:
+                            self.entries.pop(name, None)
+                        else:
+                            self.entries[name] = entry
+            kept = {entry['encrypted_path'] for entry in previous.values()
+                    if entry and 'encrypted_path' in entry}
+            orphaned = [path for path in batch.new_blobs if path not in kept]
+            released = batch.new_chunks
+        else:
+            kept = {entry['encrypted_path'] for entry in batch.changes.values()
+                    if entry and 'encrypted_path' in entry}
+            replaced = [entry['encrypted_path'] for entry in previous.values()
+                        if entry and 'encrypted_path' in entry]
+            orphaned = [path for path in replaced + batch.new_blobs if path not in kept]
+            # The batch holds a reference for each chunk of a replaced entry
+            # and each one it stored; keep those its final entries use, e.g.
+            # after a notes-only update, and drop the rest, including chunks
+            # of a file added and then replaced within the same batch
+            held = Counter(chunk_id for entry in previous.values()
+                           if entry and 'chunks' in entry
+                           for chunk_id, _ in entry['chunks'])
+            held.update(batch.new_chunks)
+            held.subtract(chunk_id for entry in batch.changes.values()
+                          if entry and 'chunks' in entry
+                          for chunk_id, _ in entry['chunks'])
+            released = list(held.elements())
+        for encrypted_path in dict.fromkeys(orphaned):
+            self._remove_blob(encrypted_path)
+        self.chunk_store.release(released)
+
+    def flush(self):
+        """Block until every mutation made so far is durable."""
+        self.committer.flush()
+
+    def add_entry(self, name: str, username: str, password: str, notes: str = "",
+                  wait: bool = True):
+        """Add a new password entry.
+
+        With wait unset this returns before the entry is durable; use the
+        returned Future or flush() to wait for it.
+        """
         logger.debug(f"Adding password entry: {name}")
         if not self.crypto.key:
             logger.error("Cannot add entry: Master password not set")
             raise ValueError("Master password not set")
-        self.entries[name] = {
+        entry = {
             'type': 'password',
             'username': username,
             'password': password,
             'notes': notes
         }
-        self.save_data()
+        crypto = self.crypto
+        future = self._mutate({name: self.seal_entry(entry, crypto)}, wait, crypto=crypto)
         logger.debug("Password entry added successfully")
+        return future
+
+    def add_file(self, name: str, file_path: str, notes: str = "", wait: bool = True,
+                 progress=None, digest=None):
+        """Add a new file entry.
 
-    def add_file(self, name: str, file_path: str, notes: str = ""):
-        """Add a new file entry."""
+        The file's chunks (or blob) are always on disk before the entry is
+        committed; wait only controls whether the entry's log record is
+        waited for. progress, if given, is called with each number of bytes
+        stored; an exception raised from it cancels the add and removes
+        whatever was written for it. digest, a hashlib object, is fed the
+        file's content as it is read.
+        """
         logger.debug(f"Adding file entry: {name}")
         if not self.crypto.key:
             logger.error("Cannot add file: Master password not set")
             raise ValueError("Master password not set")
 
+        # Taken before anything is written, see VaultBatch.crypto
+        crypto = self.crypto
+        if self.chunk_files and crypto.kdf_version != KDF_VERSION_LEGACY:
+            return self._add_chunked_file(name, file_path, notes, wait, progress, digest, crypto)
+
         # Get file size
         file_size = os.path.getsize(file_path)
         
-        # Create a unique filename for the encrypted file
-        encrypted_filename = f"{name}_{os.path.basename(file_path)}.enc"
-        encrypted_path = self.files_dir / encrypted_filename
+        # A random name, so no two entries ever share a blob; creating it
+        # exclusively guarantees the cleanup below only removes our own file
+        encrypted_path = self.files_dir / f"{secrets.token_hex(16)}.enc"
+        with open(encrypted_path, 'xb'):
+            pass
         
-        # Encrypt and save the file
-        try:
-            with open(file_path, 'rb') as f:
-                file_data = f.read()
-            # Convert binary data to base64 string for encryption
-            file_data_b64 = base64.b64encode(file_data).decode('utf-8')
-            encrypted_data = self.crypto.encrypt_data(file_data_b64)
-            with open(encrypted_path, 'wb') as f:
-                f.write(encrypted_data)
+        # Encrypt and save the file, segments in parallel
+        try:
+            self.file_engine.encrypt_file(file_path, encrypted_path, progress, digest)
+            fsync_file(encrypted_path)
+            fsync_directory(self.files_dir)
             
             # Add entry to database
-            self.entries[name] = {
+            entry = {
                 'type': 'file',
                 'original_name': os.path.basename(file_path),
                 'encrypted_path': str(encrypted_path),
                 'size': file_size,
                 'notes': notes
             }
-            self.save_data()
+            future = self._mutate({name: self.seal_entry(entry, crypto)}, wait,
+                                  [str(encrypted_path)], crypto=crypto)
             logger.debug(f"File entry added successfully: {name}")
+            return future
         except Exception as e:
             logger.error(f"Failed to add file: {str(e)}")
             # Clean up if encryption failed
@@ -189,13 +1119,50 @@ class DataManager:
                     pass
             raise
 
+    def _add_chunked_file(self, name: str, file_path: str, notes: str, wait: bool,
+                          progress=None, digest=None, crypto: CryptoManager = None):
+        """Add a file as a manifest of deduplicated chunks.
+
+        Chunks already in the store are only hashed, so re-adding an
+        unchanged or slightly edited file writes next to nothing.
+        """
+        manifest = self.chunk_store.put_file(file_path, progress, digest)
+        entry = {
+            'type': 'file',
+            'original_name': os.path.basename(file_path),
+            'chunks': manifest,
+            'size': sum(length for _, length in manifest),
+            'notes': notes
+        }
+        chunk_ids = [chunk_id for chunk_id, _ in manifest]
+        try:
+            future = self._mutate({name: self.seal_entry(entry, crypto)}, wait,
+                                  new_chunks=chunk_ids, crypto=crypto)
+        except Exception as e:
+            # The failed commit has already released the chunk references
+            logger.error(f"Failed to add file: {str(e)}")
+            raise
+        logger.debug(f"File entry added successfully: {name} ({len(manifest)} chunks)")
+        return future
+
     def get_entry(self, name: str) -> dict:
-        """Get an entry by name."""
+        """Get an entry by name, with its secrets decrypted.
+
+        The result is a fresh copy; nothing decrypted here is kept, so
+        callers should drop it once done.
+        """
         logger.debug(f"Getting entry: {name}")
-        return self.entries.get(name)
+        entry = self.entries.get(name)
+        if entry is None:
+            return None
+        return self.unseal_entry(entry)
+
+    def get_file(self, name: str, output_path: str, progress=None):
+        """Get and decrypt a file.
 
-    def get_file(self, name: str, output_path: str):
-        """Get and decrypt a file."""
+        progress works as for add_file; a cancelled or failed get removes
+        the partial output.
+        """
         logger.debug(f"Getting file: {name}")
         if not self.crypto.key:
             logger.error("Cannot get file: Master password not set")
@@ -206,42 +1173,248 @@ class DataManager:
             logger.error("File not found")
             raise ValueError("File not found")
         
+        output_opened = False
         try:
-            # Read encrypted file
-            with open(entry['encrypted_path'], 'rb') as f:
-                encrypted_data = f.read()
-            
-            # Decrypt the data
-            decrypted_data_b64 = self.crypto.decrypt_data(encrypted_data)
-            
-            # Convert from base64 back to binary
-            decrypted_data = base64.b64decode(decrypted_data_b64)
-            
-            # Write to output file
-            with open(output_path, 'wb') as f:
-                f.write(decrypted_data)
+            if 'chunks' in entry:
+                output_opened = True
+                with open(output_path, 'wb') as dst:
+                    self.chunk_store.write_file(entry['chunks'], dst, progress)
+            elif self.blob_format(entry['encrypted_path']) == BLOB_FORMAT_STREAM:
+                output_opened = True
+                self._read_blob(entry['encrypted_path'], lambda crypto: self._file_engine_for(
+                    crypto).decrypt_file(entry['encrypted_path'], output_path, progress))
+            else:
+                decrypted_data = self._read_blob(entry['encrypted_path'], lambda crypto:
+                                                 self._read_legacy_blob(entry['encrypted_path'], crypto))
+                output_opened = True
+                with open(output_path, 'wb') as dst:
+                    dst.write(decrypted_data)
+                if progress is not None:
+                    progress(len(decrypted_data))
                 
             logger.debug(f"File retrieved and decrypted successfully: {name}")
         except Exception as e:
             logger.error(f"Failed to get file: {str(e)}")
+            # Don't leave a partially written file behind
+            if output_opened and os.path.exists(output_path):
+                try:
+                    os.remove(output_path)
+                except OSError:
+                    pass
+            raise
+
+    def open_file(self, name: str):
+        """Open a stored file as a seekable, read-only binary stream.
+
+        Plaintext is never written to disk: chunked files and segmented
+        blobs are decrypted a chunk or segment at a time as they are read.
+        Base64-era blobs have no segments and are decrypted into memory up
+        front.
+        """
+        logger.debug(f"Opening file: {name}")
+        if not self.crypto.key:
+            logger.error("Cannot open file: Master password not set")
+            raise ValueError("Master password not set")
+
+        entry = self.entries.get(name)
+        if not entry or entry['type'] != 'file':
+            logger.error("File not found")
+            raise ValueError("File not found")
+
+        if 'chunks' in entry:
+            return self.chunk_store.open_file(entry['chunks'])
+        if self.blob_format(entry['encrypted_path']) == BLOB_FORMAT_STREAM:
+            return self._read_blob(entry['encrypted_path'], lambda crypto:
+                                   self._open_stream_blob(entry['encrypted_path'], crypto))
+        return io.BytesIO(self._read_blob(entry['encrypted_path'], lambda crypto:
+                                          self._read_legacy_blob(entry['encrypted_path'], crypto)))
+
+    def read_range(self, name: str, offset: int, length: int) -> bytes:
+        """Decrypt and return length bytes of a stored file starting at offset.
+
+        Only the segments covering the range are decrypted and authenticated.
+        Fewer bytes are returned if the range runs past the end of the file.
+        """
+        logger.debug(f"Reading range of {name}: offset={offset}, length={length}")
+        if offset < 0 or length < 0:
+            raise ValueError("Offset and length must not be negative")
+        with self.open_file(name) as f:
+            f.seek(offset)
+            return read_fully(f, length)
+
+    def blob_format(self, encrypted_path) -> str:
+        """Detect the on-disk format of a file blob from its header."""
+        with open(encrypted_path, 'rb') as f:
+            header = f.read(STREAM_HEADER.size)
+        if self.crypto.is_stream_blob(header):
+            return BLOB_FORMAT_STREAM
+        return BLOB_FORMAT_LEGACY_BASE64
+
+    def _read_legacy_blob(self, encrypted_path, crypto: CryptoManager = None) -> bytes:
+        """Decrypt a base64-era blob (one AES-GCM message over base64 text)."""
+        crypto = crypto or self.crypto
+        with mapped_file(encrypted_path) as encrypted_data:
+            decrypted_data = crypto.decrypt_bytes(encrypted_data)
+        # b64decode accepts the decrypted bytes directly, no str round trip
+        return base64.b64decode(decrypted_data)
+
+    def _read_blob(self, encrypted_path, read):
+        """Call read(crypto) with the key the blob is sealed with.
+
+        While a key rotation is under way a blob is read with the old key
+        until the migration has rewritten it. A reader that loses the race
+        with the rewrite, or finds a blob rewritten just before a crash
+        kept it from being journaled, falls back to the vault key.
+        """
+        source = self.migration.source_crypto(encrypted_path)
+        if source is None:
+            return read(self.crypto)
+        try:
+            return read(source)
+        except (InvalidTag, ValueError) as e:
+            logger.debug(f"Blob not readable with the migration source key: {str(e) or type(e).__name__}")
+            return read(self.crypto)
+
+    def _file_engine_for(self, crypto: CryptoManager) -> ParallelCryptoEngine:
+        """The parallel engine, set up the same way for another key if needed."""
+        if crypto is self.file_engine.crypto:
+            return self.file_engine
+        return ParallelCryptoEngine(crypto, self.file_engine.workers,
+                                    self.file_engine.max_inflight_bytes,
+                                    self.file_engine.segment_size)
+
+    @staticmethod
+    def _open_stream_blob(encrypted_path, crypto: CryptoManager):
+        """Open a segmented blob, authenticating its first segment up front.
+
+        Readers are lazy, so without this a blob sealed with another key
+        would only fail on the caller's first read.
+        """
+        reader = crypto.open_stream_blob(encrypted_path)
+        try:
+            reader.read(1)
+            reader.seek(0)
+        except Exception:
+            reader.close()
             raise
+        return reader
+
+    def upgrade_legacy_files(self, background: bool = True):
+        """Rewrite base64-era file blobs in the binary streaming format.
+
+        The rewrite runs on the migration engine: blobs are replaced
+        atomically under their existing names, so entries don't change and
+        get_file keeps working throughout, and progress survives a crash.
+        A key rotation still in progress is resumed instead, since it
+        rewrites every blob in the streaming format anyway. With background
+        set the migration runs on a daemon thread, which is returned;
+        otherwise the number of rewritten blobs is returned.
+        """
+        logger.debug("Upgrading legacy file blobs")
+        if not self.migration.active() and not self.migration.load():
+            self.migration.plan(self._blob_paths())
+        if background:
+            return self.migration.start()
+        return self.migration.run()
+
+    def _resume_migration(self):
+        """Pick up a migration interrupted by a crash or a lock, if any."""
+        try:
+            if self.migration.active() or self.migration.load():
+                self.migration.start()
+        except Exception as e:
+            logger.error(f"Failed to resume blob migration: {str(e)}")
+
+    def _blob_paths(self) -> list:
+        """Paths of every file blob the vault refers to."""
+        return [entry['encrypted_path'] for entry in list(self.entries.values())
+                if 'encrypted_path' in entry]
+
+    def _is_chunk(self, path) -> bool:
+        return Path(path).parent.parent == self.chunk_store.chunks_dir
+
+    def _blob_needs_rewrite(self, encrypted_path, source: Optional[CryptoManager]) -> bool:
+        """Whether a blob is still in an old format or sealed with the source key."""
+        if self._is_chunk(encrypted_path):
+            return self.chunk_store.needs_rewrite(encrypted_path, source)
+        stream = self.blob_format(encrypted_path) == BLOB_FORMAT_STREAM
+        if source is None:
+            return not stream
+        try:
+            if stream:
+                self._open_stream_blob(encrypted_path, source).close()
+            else:
+                self._read_legacy_blob(encrypted_path, source)
+        except (InvalidTag, ValueError):
+            # Already rewritten, but not journaled before a crash
+            return False
+        return True
+
+    def _rewrite_blob(self, encrypted_path, source: Optional[CryptoManager], dst):
+        """Write a blob to dst in the streaming format under the vault key."""
+        if self._is_chunk(encrypted_path):
+            return self.chunk_store.rewrite(encrypted_path, source, dst)
+        crypto = source or self.crypto
+        if self.blob_format(encrypted_path) == BLOB_FORMAT_STREAM:
+            # Buffered so every read but the last returns a whole segment
+            with crypto.open_stream_blob(encrypted_path) as reader:
+                self.crypto.encrypt_stream(io.BufferedReader(reader, SEGMENT_SIZE), dst)
+        else:
+            self.crypto.encrypt_stream(io.BytesIO(self._read_legacy_blob(encrypted_path, crypto)), dst)
 
     def get_all_entries(self) -> dict:
-        """Get all entries."""
+        """Get all entries' metadata; secrets stay sealed (see get_entry).
+
+        The result is a snapshot: background jobs commit from other
+        threads, so callers must not iterate the live entries.
+        """
         logger.debug("Getting all entries")
-        return self.entries
+        if self.store is not None:
+            # One query and one batched decrypt instead of a row at a time
+            return dict(self.store.items())
+        # Entries are replaced, never mutated in place, so a shallow copy
+        # is a consistent snapshot
+        with self._lock:
+            return dict(self.entries)
+
+    def update_entry(self, name: str, wait: bool = True, **fields):
+        """Change fields of an existing entry, e.g. update_entry(name, notes="...")."""
+        logger.debug(f"Updating entry: {name}")
+        entry = self._visible_entry(name)
+        if not entry:
+            logger.error("Entry not found")
+            raise ValueError("Entry not found")
+        crypto = self.crypto
+        updated = {**self.unseal_entry(entry, crypto), **fields}
+        future = self._mutate({name: self.seal_entry(updated, crypto)}, wait, crypto=crypto)
+        logger.debug("Entry updated successfully")
+        return future
+
+    def delete_entry(self, name: str, wait: bool = True):
+        """Delete an entry and its associated file if it's a file entry.
 
-    def delete_entry(self, name: str):
-        """Delete an entry and its associated file if it's a file entry."""
+        The blob is removed once the deletion is durable, so a crash leaves
+        an orphaned blob rather than an entry pointing at nothing.
+        """
         logger.debug(f"Deleting entry: {name}")
-        entry = self.entries.get(name)
-        if entry:
-            if entry['type'] == 'file':
-                try:
-                    os.remove(entry['encrypted_path'])
-                    logger.debug("Associated file deleted")
-                except Exception as e:
-                    logger.error(f"Failed to delete file: {str(e)}")
-            del self.entries[name]
-            self.save_data()
-            logger.debug("Entry deleted successfully") 
\ No newline at end of file
+        if not self._visible_entry(name):
+            return None
+        future = self._mutate({name: None}, wait)
+        logger.debug("Entry deleted successfully")
+        return future
+
+    def _visible_entry(self, name: str) -> Optional[dict]:
+        """An entry as this thread sees it, including its open batch."""
+        batch = self._current_batch()
+        if batch is not None and name in batch.changes:
+            return batch.changes[name]
+        return self.entries.get(name)
+
+    def _remove_blob(self, encrypted_path):
+        """Remove a file blob that no entry refers to any more."""
+        self.migration.discard(encrypted_path)
+        try:
+            os.remove(encrypted_path)
+            logger.debug("Associated file deleted")
+        except Exception as e:
+            logger.error(f"Failed to delete file: {str(e)}")
@@ -0,0 +1,69 @@
+import os
+import glob
+import shutil
+import logging
+import tempfile
+import unittest
+from unittest import mock
+from crypto import CryptoManager
+from data_manager import DataManager
+
+# Keep the test output readable
+logging.disable(logging.CRITICAL)
+
+# A file large enough to be stored as several chunks
+CHUNKED_FILE_SIZE = 512 * 1024
+
+class ChunkReferenceTest(unittest.TestCase):
+    """Chunks stay on disk exactly as long as an entry refers to them."""
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.data_dir, ignore_errors=True)
+        self.data_manager = DataManager(self.data_dir)
+        # A cheap KDF; calibrating would take about a second per test
+        self.data_manager.crypto.scrypt_n = 2 ** 10
+        with mock.patch.object(CryptoManager, 'calibrate_kdf'):
+            self.data_manager.set_master_password("password")
+        self.file_path = os.path.join(self.data_dir, 'source.bin')
+        with open(self.file_path, 'wb') as f:
+            f.write(os.urandom(CHUNKED_FILE_SIZE))
+
+    def chunk_files(self) -> int:
+        return len(glob.glob(os.path.join(self.data_dir, 'files', 'chunks', '*', '*')))
+
+    def assert_readable(self, name: str):
+        output_path = os.path.join(self.data_dir, 'output.bin')
+        self.data_manager.get_file(name, output_path)
+        with open(output_path, 'rb') as out, open(self.file_path, 'rb') as src:
+            self.assertEqual(out.read(), src.read())
+
+    def test_update_keeps_chunks(self):
+        self.data_manager.add_file("file", self.file_path)
+        stored = self.chunk_files()
+        self.assertGreater(stored, 0)
+        self.data_manager.update_entry("file", notes="changed")
+        self.assertEqual(self.chunk_files(), stored)
+        self.assert_readable("file")
+
+    def test_update_in_batch_keeps_chunks(self):
+        self.data_manager.add_file("file", self.file_path)
+        stored = self.chunk_files()
+        with self.data_manager.batch():
+            self.data_manager.update_entry("file", notes="changed")
+        self.assertEqual(self.chunk_files(), stored)
+        self.assert_readable("file")
+
+    def test_replaced_add_in_batch_releases_chunks(self):
+        with self.data_manager.batch():
+            self.data_manager.add_file("file", self.file_path)
+            self.data_manager.delete_entry("file")
+        self.assertEqual(self.chunk_files(), 0)
+        with self.data_manager.batch():
+            self.data_manager.add_file("file", self.file_path)
+            self.data_manager.add_file("file", self.file_path)
+        self.data_manager.delete_entry("file")
+        self.assertEqual(self.chunk_files(), 0)
+
+if __name__ == '__main__':
+    unittest.main()
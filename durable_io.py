@@ -0,0 +1,59 @@
+import os
+import logging
+from pathlib import Path
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+def fsync_directory(path):
+    """Flush a directory entry (new, renamed or removed files) to disk.
+
+    Directories cannot be opened for fsync on Windows; there the rename
+    itself is as durable as it gets, so this is a no-op.
+    """
+    if os.name == 'nt':
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def fsync_file(path):
+    """Flush an already written file's contents to disk."""
+    with open(path, 'rb+') as f:
+        os.fsync(f.fileno())
+
+def write_durable(path, data: bytes):
+    """Write data to path and fsync it, without replacing anything atomically."""
+    with open(path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+def replace_durable(temp_path, target_path):
+    """Atomically rename a fully written temp file over target_path."""
+    os.replace(temp_path, target_path)
+    fsync_directory(Path(target_path).parent)
+
+def atomic_write(path, data: bytes):
+    """Crash-safely replace path with data.
+
+    The data goes to a temp file next to path, is fsynced, renamed over path
+    and the directory is fsynced. After a crash path holds either the old or
+    the new contents, never a mix.
+    """
+    path = Path(path)
+    temp_path = path.with_name(path.name + '.tmp')
+    try:
+        write_durable(temp_path, data)
+        replace_durable(temp_path, path)
+    except Exception:
+        if temp_path.exists():
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+        raise
+    logger.debug(f"Atomically wrote {path.name} ({len(data)} bytes)")
@@ -0,0 +1,178 @@
+import sys
+import json
+import struct
+import logging
+from array import array
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+# Binary vault payload: header, a small JSON table of contents, then
+# length-prefixed sections. Legacy payloads are plain JSON and start with '{'.
+ENTRIES_MAGIC = b"DSEB"
+ENTRIES_VERSION = 1
+ENTRIES_HEADER = struct.Struct('>4sBI')  # magic, version, entry count
+SECTION_LENGTH = struct.Struct('>I')
+
+# Column encodings
+COLUMN_ENUM = 'enum'  # one byte per value, indexing the interned type table
+COLUMN_STR = 'str'    # UTF-8, NUL separated
+COLUMN_INT = 'int'    # little-endian signed 64-bit
+COLUMN_JSON = 'json'  # anything else, e.g. chunk manifests
+
+INT_MIN = -2**63
+INT_MAX = 2**63 - 1
+
+def _section(data: bytes) -> list:
+    """Length prefix and body of one section."""
+    return [SECTION_LENGTH.pack(len(data)), data]
+
+def _join_strings(values: list):
+    """NUL-joined UTF-8 of values, or None if a value contains a NUL."""
+    joined = '\x00'.join(values)
+    if joined.count('\x00') != len(values) - 1:
+        return None
+    return joined.encode('utf-8', 'surrogatepass')
+
+def _encode_column(key: str, values: list, types: dict) -> tuple:
+    """Pick the most compact encoding for one column; returns (kind, bytes)."""
+    kinds = set(map(type, values))
+    if kinds == {str}:
+        if key == 'type' and len(types) + len(set(values) - types.keys()) <= 256:
+            indexes = [types.setdefault(value, len(types)) for value in values]
+            return COLUMN_ENUM, bytes(indexes)
+        joined = _join_strings(values)
+        if joined is not None:
+            return COLUMN_STR, joined
+    elif kinds == {int} and INT_MIN <= min(values) and max(values) <= INT_MAX:
+        column = array('q', values)
+        if sys.byteorder != 'little':
+            column.byteswap()
+        return COLUMN_INT, column.tobytes()
+    return COLUMN_JSON, json.dumps(values).encode()
+
+def _decode_column(kind: str, data, types: list) -> list:
+    """Inverse of _encode_column."""
+    if kind == COLUMN_ENUM:
+        return list(map(types.__getitem__, data))
+    if kind == COLUMN_STR:
+        return str(data, 'utf-8', 'surrogatepass').split('\x00')
+    if kind == COLUMN_INT:
+        column = array('q')
+        column.frombytes(data)
+        if sys.byteorder != 'little':
+            column.byteswap()
+        return column.tolist()
+    if kind == COLUMN_JSON:
+        return json.loads(bytes(data))
+    raise ValueError(f"Unknown column encoding: {kind}")
+
+def pack_entries(entries: dict) -> bytes:
+    """Serialize vault entries into the binary payload format.
+
+    Entries are grouped by shape (their tuple of field names) and each
+    field of a shape is stored as one column, so the per-value work happens
+    in C: names and strings are NUL-joined and encoded once, integers are a
+    packed array and the entry type is a one-byte index into an interned
+    table.
+    """
+    shapes = {}
+    shape_ids = []
+    groups = []
+    for entry in entries.values():
+        keys = tuple(entry)
+        shape_id = shapes.get(keys)
+        if shape_id is None:
+            shape_id = shapes[keys] = len(shapes)
+            groups.append([])
+        shape_ids.append(shape_id)
+        groups[shape_id].append(entry)
+
+    types = {}
+    contents = {'shapes': []}
+    sections = []
+    for keys, group in zip(shapes, groups):
+        kinds = []
+        for key in keys:
+            kind, data = _encode_column(key, [entry[key] for entry in group], types)
+            kinds.append(kind)
+            sections += _section(data)
+        contents['shapes'].append({'keys': list(keys), 'count': len(group), 'kinds': kinds})
+    contents['types'] = list(types)
+    contents['shape_index'] = 'B' if len(shapes) <= 256 else 'I'
+
+    names = _join_strings(list(entries))
+    if names is None:
+        contents['names'] = COLUMN_JSON
+        names = json.dumps(list(entries)).encode()
+    else:
+        contents['names'] = COLUMN_STR
+    shape_index = array(contents['shape_index'], shape_ids)
+    if sys.byteorder != 'little':
+        shape_index.byteswap()
+
+    parts = [ENTRIES_HEADER.pack(ENTRIES_MAGIC, ENTRIES_VERSION, len(entries))]
+    parts += _section(json.dumps(contents).encode())
+    parts += _section(names)
+    parts += _section(shape_index.tobytes())
+    parts += sections
+    payload = b''.join(parts)
+    logger.debug(f"Packed {len(entries)} entries in {len(shapes)} shapes ({len(payload)} bytes)")
+    return payload
+
+def _dict_rows(keys: list, columns: list, count: int) -> list:
+    """count dicts built from one column of values per key."""
+    rows = [{} for _ in range(count)]
+    # Filling the dicts a column at a time beats building each from a zip
+    # of keys and values by about half
+    for key, column in zip(keys, columns):
+        for row, value in zip(rows, column):
+            row[key] = value
+    return rows
+
+def unpack_entries(data, make_rows=None) -> dict:
+    """Deserialize a payload from pack_entries, or a legacy JSON payload.
+
+    make_rows(keys, columns, count) builds the entry objects of one shape;
+    by default they are dicts. Legacy JSON payloads always give dicts.
+    """
+    if bytes(data[:len(ENTRIES_MAGIC)]) != ENTRIES_MAGIC:
+        return json.loads(data)
+    make_rows = make_rows or _dict_rows
+    _, version, count = ENTRIES_HEADER.unpack_from(data)
+    if version != ENTRIES_VERSION:
+        raise ValueError(f"Unsupported entries format version: {version}")
+
+    view = memoryview(data)
+    offset = ENTRIES_HEADER.size
+
+    def next_section():
+        nonlocal offset
+        (length,) = SECTION_LENGTH.unpack_from(view, offset)
+        start = offset + SECTION_LENGTH.size
+        offset = start + length
+        if offset > len(view):
+            raise ValueError("Truncated entries payload")
+        return view[start:offset]
+
+    contents = json.loads(bytes(next_section()))
+    names = _decode_column(contents['names'], next_section(), [])
+    shape_index = array(contents['shape_index'])
+    shape_index.frombytes(next_section())
+    if sys.byteorder != 'little':
+        shape_index.byteswap()
+
+    types = contents['types']
+    groups = []
+    for shape in contents['shapes']:
+        columns = [_decode_column(kind, next_section(), types) for kind in shape['kinds']]
+        if any(len(column) != shape['count'] for column in columns):
+            raise ValueError("Corrupt entries payload")
+        groups.append(iter(make_rows(shape['keys'], columns, shape['count'])))
+    if len(names) != count or len(shape_index) != count:
+        raise ValueError("Corrupt entries payload")
+    # Take each shape's entries in turn, back in vault order
+    entries = dict(zip(names, map(next, map(groups.__getitem__, shape_index))))
+    logger.debug(f"Unpacked {len(entries)} entries")
+    return entries
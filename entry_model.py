@@ -0,0 +1,132 @@
+import gc
+import sys
+import logging
+from collections import deque
+from collections.abc import Mapping
+from contextlib import contextmanager
+from itertools import repeat
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+# Entries of more distinct shapes than this stay plain dicts
+MAX_ENTRY_CLASSES = 256
+
+class Entry(Mapping):
+    """Compact, read-only vault entry.
+
+    Each entry shape (tuple of field names) gets a subclass with exactly
+    those fields as __slots__, so an entry is one small object instead of
+    a dict with its own hash table: a password entry takes 56 bytes rather
+    than 184. It reads like the dict it replaces (entry['type'],
+    entry.get('username'), 'chunks' in entry, dict(entry)). Entries are
+    replaced, never changed in place, so there is no setter.
+    """
+
+    __slots__ = ()
+    # Field names, in order, and as a set for lookups; set per subclass
+    _fields = ()
+    _field_set = frozenset()
+
+    def __getitem__(self, key):
+        if key in self._field_set:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        if key in self._field_set:
+            return getattr(self, key)
+        return default
+
+    def __contains__(self, key) -> bool:
+        return key in self._field_set
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __len__(self) -> int:
+        return len(self._fields)
+
+    def __repr__(self) -> str:
+        return f"Entry({dict(self)!r})"
+
+_classes = {}
+# Names a field cannot have without shadowing part of the Mapping interface
+_RESERVED = frozenset(dir(Entry))
+
+def entry_class(keys: tuple):
+    """The Entry subclass for one shape, or None if it can't have one."""
+    cls = _classes.get(keys)
+    if cls is not None or keys in _classes:
+        return cls
+    usable = (len(_classes) < MAX_ENTRY_CLASSES and len(set(keys)) == len(keys)
+              and all(type(key) is str and key.isidentifier() and not key.startswith('_')
+                      and key not in _RESERVED for key in keys))
+    cls = type('Entry', (Entry,), {
+        '__slots__': keys,
+        '_fields': keys,
+        '_field_set': frozenset(keys),
+    }) if usable else None
+    _classes[keys] = cls
+    return cls
+
+def _intern_type(value):
+    """Share the few distinct entry types between all entries."""
+    return sys.intern(value) if type(value) is str else value
+
+def make_entry(fields: Mapping):
+    """Compact copy of an entry dict; entries that can't be compacted stay dicts."""
+    if isinstance(fields, Entry):
+        return fields
+    keys = tuple(fields)
+    cls = entry_class(keys)
+    if cls is None:
+        return dict(fields)
+    entry = cls.__new__(cls)
+    for key, value in fields.items():
+        setattr(entry, key, _intern_type(value) if key == 'type' else value)
+    return entry
+
+def compact_entries(entries: Mapping) -> dict:
+    """Convert the dicts in a name -> entry mapping to Entry records."""
+    return {name: make_entry(entry) if type(entry) is dict else entry
+            for name, entry in entries.items()}
+
+def entry_rows(keys: list, columns: list, count: int) -> list:
+    """Build count entries from one column of values per key.
+
+    Used by entry_codec.unpack_entries: fields are filled a column at a
+    time through the slot descriptors, without an intermediate dict.
+    """
+    cls = entry_class(tuple(keys))
+    if cls is None:
+        rows = [{} for _ in range(count)]
+        for key, column in zip(keys, columns):
+            for row, value in zip(rows, column):
+                row[key] = value
+        return rows
+
+    rows = list(map(cls.__new__, repeat(cls, count)))
+    for key, column in zip(keys, columns):
+        if key == 'type':
+            column = list(map(_intern_type, column))
+        deque(map(cls.__dict__[key].__set__, rows, column), maxlen=0)
+    return rows
+
+@contextmanager
+def gc_paused():
+    """Pause the garbage collector for a bulk load of entries.
+
+    Unlike dicts of strings, entries are tracked by the garbage collector;
+    pausing it keeps a million allocations from triggering collections that
+    scan everything built so far. The switch is process-wide, so this
+    belongs in the single thread driving a load, not in its workers.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
@@ -1,12 +1,27 @@
-from PyQt6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QLineEdit, QTableWidget, QTableWidgetItem, QHeaderView, QFileDialog, QMessageBox, QFrame
-from PyQt6.QtGui import QFont, QColor, QIcon
+from PyQt6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QLineEdit, QTableWidget, QTableWidgetItem, QHeaderView, QFileDialog, QMessageBox, QFrame, QTextEdit
+from PyQt6.QtGui import QFont, QColor, QIcon, QPixmap
 from PyQt6.QtCore import Qt
+from jobs import JobManager, add_file_job, get_file_job, ingest_job
 import os
+import codecs
+
+# Only the start of a file is decrypted for a text/hex preview
+PREVIEW_TEXT_BYTES = 16 * 1024
+PREVIEW_HEX_BYTES = 512
+# Files listed by name when an import leaves some out
+FAILED_IMPORTS_SHOWN = 5
+# Images need all their bytes to render, so only small ones are previewed
+PREVIEW_IMAGE_MAX_BYTES = 16 * 1024 * 1024
+PREVIEW_IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp', '.svg'}
 
 class FilesWidget(QWidget):
-    def __init__(self, data_manager):
+    def __init__(self, data_manager, jobs=None):
         super().__init__()
         self.data_manager = data_manager
+        # File transfers run here so the window stays responsive
+        self.jobs = jobs or JobManager(parent=self)
+        # Files and folders dropped here are imported
+        self.setAcceptDrops(True)
         self.setup_ui()
         self.load_data()  # Load data after UI setup
 
@@ -44,6 +59,11 @@ class FilesWidget(QWidget):
         add_btn.clicked.connect(self.show_add_file_dialog)
         search_layout.addWidget(add_btn)
 
+        add_folder_btn = QPushButton("Add Folder")
+        add_folder_btn.setIcon(QIcon("icons/add.svg"))
+        add_folder_btn.clicked.connect(self.show_add_folder_dialog)
+        search_layout.addWidget(add_folder_btn)
+
         layout.addWidget(search_container)
 
         # Files table
@@ -75,6 +95,46 @@ class FilesWidget(QWidget):
         """)
         layout.addWidget(self.files_table)
 
+        # Preview pane
+        self.preview_container = QFrame()
+        self.preview_container.setStyleSheet("""
+            QFrame {
+                background: rgba(45, 45, 45, 0.3);
+                border-radius: 12px;
+                padding: 8px;
+            }
+            QTextEdit {
+                background: transparent;
+                border: none;
+                color: #E0E0E0;
+                font-family: Consolas, monospace;
+            }
+        """)
+        preview_layout = QVBoxLayout(self.preview_container)
+        preview_layout.setSpacing(8)
+
+        preview_header = QHBoxLayout()
+        self.preview_title = QLabel()
+        self.preview_title.setFont(QFont("Segoe UI", 11, QFont.Weight.Bold))
+        preview_header.addWidget(self.preview_title)
+        preview_header.addStretch()
+        close_preview_btn = QPushButton("Close")
+        close_preview_btn.clicked.connect(self.close_preview)
+        preview_header.addWidget(close_preview_btn)
+        preview_layout.addLayout(preview_header)
+
+        self.preview_image = QLabel()
+        self.preview_image.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        preview_layout.addWidget(self.preview_image)
+
+        self.preview_text = QTextEdit()
+        self.preview_text.setReadOnly(True)
+        preview_layout.addWidget(self.preview_text)
+
+        self.preview_container.setMaximumHeight(320)
+        self.preview_container.hide()
+        layout.addWidget(self.preview_container)
+
     def load_data(self):
         """Load file entries from DataManager"""
         self.files_table.setRowCount(0)
@@ -102,6 +162,12 @@ class FilesWidget(QWidget):
                 actions_layout.setContentsMargins(4, 4, 4, 4)
                 actions_layout.setSpacing(8)
                 
+                preview_btn = QPushButton()
+                preview_btn.setIcon(QIcon("icons/show.svg"))
+                preview_btn.setFixedSize(32, 32)
+                preview_btn.clicked.connect(lambda checked, n=name: self.preview_file(n))
+                actions_layout.addWidget(preview_btn)
+                
                 download_btn = QPushButton()
                 download_btn.setIcon(QIcon("icons/download.svg"))
                 download_btn.setFixedSize(32, 32)
@@ -139,12 +205,13 @@ class FilesWidget(QWidget):
             )
             
             if output_path:
-                self.data_manager.get_file(name, output_path)
-                QMessageBox.information(
+                # Progress and completion are shown in the job queue panel
+                job = get_file_job(self.jobs, self.data_manager, name, output_path)
+                job.signals.failed.connect(lambda error: QMessageBox.warning(
                     self,
-                    "Success",
-                    "File downloaded successfully!"
-                )
+                    "Error",
+                    f"Failed to download file: {error}"
+                ))
         except Exception as e:
             QMessageBox.warning(
                 self,
@@ -152,6 +219,64 @@ class FilesWidget(QWidget):
                 f"Failed to download file: {str(e)}"
             )
 
+    def preview_file(self, name):
+        """Show the start of a file in the preview pane without writing it to disk"""
+        try:
+            entry = self.data_manager.get_entry(name)
+            size = entry.get('size', 0)
+            extension = os.path.splitext(entry.get('original_name', name))[1].lower()
+            self.preview_title.setText(f"{name} ({self.format_size(size)})")
+
+            if extension in PREVIEW_IMAGE_EXTENSIONS and size <= PREVIEW_IMAGE_MAX_BYTES:
+                pixmap = QPixmap()
+                if pixmap.loadFromData(self.data_manager.read_range(name, 0, size)):
+                    self.preview_image.setPixmap(pixmap.scaled(
+                        480, 240,
+                        Qt.AspectRatioMode.KeepAspectRatio,
+                        Qt.TransformationMode.SmoothTransformation
+                    ))
+                    self.preview_image.show()
+                    self.preview_text.hide()
+                    self.preview_container.show()
+                    return
+
+            data = self.data_manager.read_range(name, 0, PREVIEW_TEXT_BYTES)
+            try:
+                # The range may end inside a multi-byte character
+                text = codecs.getincrementaldecoder('utf-8')().decode(data, final=False)
+                if '\x00' in text:
+                    raise UnicodeDecodeError('utf-8', data, 0, 1, "binary data")
+                if size > PREVIEW_TEXT_BYTES:
+                    text += "\n…"
+            except UnicodeDecodeError:
+                text = self.format_hex(data[:PREVIEW_HEX_BYTES])
+            self.preview_text.setPlainText(text)
+            self.preview_image.hide()
+            self.preview_text.show()
+            self.preview_container.show()
+        except Exception as e:
+            QMessageBox.warning(
+                self,
+                "Error",
+                f"Failed to preview file: {str(e)}"
+            )
+
+    def close_preview(self):
+        """Hide the preview pane and drop the previewed content"""
+        self.preview_image.clear()
+        self.preview_text.clear()
+        self.preview_container.hide()
+
+    def format_hex(self, data):
+        """Format bytes as a hex dump, 16 bytes per line"""
+        lines = []
+        for offset in range(0, len(data), 16):
+            chunk = data[offset:offset + 16]
+            hex_part = ' '.join(f"{b:02x}" for b in chunk)
+            text_part = ''.join(chr(b) if 32 <= b < 127 else '.' for b in chunk)
+            lines.append(f"{offset:08x}  {hex_part:<47}  {text_part}")
+        return '\n'.join(lines)
+
     def delete_file(self, name):
         """Delete a file entry"""
         reply = QMessageBox.question(
@@ -181,33 +306,81 @@ class FilesWidget(QWidget):
             self.files_table.setRowHidden(row, not show)
 
     def show_add_file_dialog(self):
-        """Show dialog to add a new file"""
-        file_path, _ = QFileDialog.getOpenFileName(
+        """Show dialog to add one or more files"""
+        file_paths, _ = QFileDialog.getOpenFileNames(
             self,
-            "Select File",
+            "Select Files",
             "",
             "All Files (*.*)"
         )
 
-        if file_path:
+        if len(file_paths) > 1:
+            self.import_paths(file_paths)
+        elif file_paths:
+            file_path = file_paths[0]
             try:
                 # Get file name from path
                 file_name = os.path.basename(file_path)
                 
-                # Add file to DataManager
-                self.data_manager.add_file(file_name, file_path)
-                
-                # Refresh files view
-                self.load_data()
-                
-                QMessageBox.information(
+                # Encrypt in the background; refresh once the file is in
+                job = add_file_job(self.jobs, self.data_manager, file_name, file_path)
+                job.signals.finished.connect(lambda _: self.load_data())
+                job.signals.failed.connect(lambda error: QMessageBox.warning(
                     self,
-                    "Success",
-                    f"File '{file_name}' added successfully!"
-                )
+                    "Error",
+                    f"Failed to add file '{file_name}': {error}"
+                ))
             except Exception as e:
                 QMessageBox.warning(
                     self,
                     "Error",
                     f"Failed to add file: {str(e)}"
-                ) 
\ No newline at end of file
+                ) 
+
+    def show_add_folder_dialog(self):
+        """Show dialog to import a folder with everything in it"""
+        folder = QFileDialog.getExistingDirectory(self, "Select Folder")
+        if folder:
+            self.import_paths([folder])
+
+    def import_paths(self, paths):
+        """Import files and folders in the background as one commit"""
+        job = ingest_job(self.jobs, self.data_manager, paths)
+        job.signals.finished.connect(self.show_import_result)
+        job.signals.failed.connect(lambda error: QMessageBox.warning(
+            self,
+            "Error",
+            f"Failed to import files: {error}"
+        ))
+
+    def show_import_result(self, stats):
+        """Refresh the list and report files the import had to leave out"""
+        self.load_data()
+        if stats.failed:
+            lines = [f"{os.path.basename(path)}: {error}"
+                     for path, error in stats.failed[:FAILED_IMPORTS_SHOWN]]
+            if len(stats.failed) > FAILED_IMPORTS_SHOWN:
+                lines.append(f"… and {len(stats.failed) - FAILED_IMPORTS_SHOWN} more")
+            QMessageBox.warning(
+                self,
+                "Import Incomplete",
+                f"Imported {stats.files_added} files ({stats.files_skipped} unchanged). "
+                f"{len(stats.failed)} could not be added:\n\n" + "\n".join(lines)
+            )
+
+    def dragEnterEvent(self, event):
+        """Accept files and folders dragged from the desktop"""
+        if event.mimeData().hasUrls() and any(url.isLocalFile() for url in event.mimeData().urls()):
+            event.acceptProposedAction()
+        else:
+            event.ignore()
+
+    def dragMoveEvent(self, event):
+        self.dragEnterEvent(event)
+
+    def dropEvent(self, event):
+        """Import the dropped files and folders"""
+        paths = [url.toLocalFile() for url in event.mimeData().urls() if url.isLocalFile()]
+        if paths:
+            event.acceptProposedAction()
+            self.import_paths(paths)
@@ -0,0 +1,298 @@
+import os
+import stat
+import time
+import queue
+import hashlib
+import logging
+import threading
+from data_manager import DataManager, VaultBatch
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+# Files waiting between the walker and the workers; bounds memory and lets
+# the walk run only a little ahead of the encryption
+INGEST_QUEUE_SIZE = 256
+# Each file's chunks are already encrypted on every core, so a few files
+# in flight are enough to keep the cores busy between small files
+INGEST_WORKERS = min(4, os.cpu_count() or 1)
+# Keyed content digest stored with ingested files to recognize them again
+DIGEST_LABEL = b"file-digest"
+DIGEST_READ_SIZE = 1024 * 1024
+
+def iter_files(paths):
+    """Yield (file_path, name) for files and, recursively, folders in paths.
+
+    A file is named after its base name and a file inside a folder after
+    its path from the folder, starting with the folder's own name, so
+    importing "photos" gives "photos/2023/img.jpg". Symbolic links to
+    folders are not followed.
+    """
+    for path in paths:
+        path = os.path.abspath(path)
+        if not os.path.isdir(path):
+            yield path, os.path.basename(path)
+            continue
+        parent = os.path.dirname(path)
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for file_name in sorted(files):
+                file_path = os.path.join(root, file_name)
+                yield file_path, os.path.relpath(file_path, parent).replace(os.sep, '/')
+
+class IngestStats:
+    """Counters of a running or finished ingest, updated from its threads."""
+
+    def __init__(self):
+        self.files_found = 0
+        self.bytes_found = 0
+        # Set once the walk is over, so files_found and bytes_found are final
+        self.walk_done = False
+        self.files_added = 0
+        self.files_skipped = 0
+        self.bytes_done = 0
+        # (file_path, error) of files that could not be added
+        self.failed = []
+        self.started = time.monotonic()
+        self.finished = None
+
+    def elapsed(self) -> float:
+        return (self.finished or time.monotonic()) - self.started
+
+    def throughput(self) -> float:
+        """Bytes processed per second, skipped files included."""
+        elapsed = self.elapsed()
+        return self.bytes_done / elapsed if elapsed > 0 else 0.0
+
+    def eta(self):
+        """Seconds left, or None until the walk is done and there is a rate."""
+        rate = self.throughput()
+        if not self.walk_done or not rate:
+            return None
+        return max(self.bytes_found - self.bytes_done, 0) / rate
+
+class FolderIngest:
+    """Import many files and folders into the vault as one commit.
+
+    A walker thread feeds regular files through a bounded queue to worker
+    threads, which stage each file with DataManager.stage_file (its chunks
+    encrypted in parallel). The staged entries are committed together once
+    everything is stored, so the vault gets one log write for the whole
+    import; if the import fails or is cancelled nothing is committed and
+    the stored chunks are released again.
+
+    Each ingested entry keeps the file's mtime and a keyed digest of its
+    content. A file whose entry already has the same size, mtime and
+    digest is skipped.
+    """
+
+    def __init__(self, data_manager: DataManager, workers: int = INGEST_WORKERS,
+                 queue_size: int = INGEST_QUEUE_SIZE):
+        self.data_manager = data_manager
+        self.workers = max(workers, 1)
+        self.queue_size = queue_size
+        self.stats = IngestStats()
+        # discovered(nbytes, final), if set, is called from the walker with
+        # the size of each file found, and with final set once it is done
+        self.discovered = None
+        self._lock = threading.Lock()
+
+    def run(self, paths, progress=None) -> IngestStats:
+        """Ingest paths; returns the stats once the commit is durable.
+
+        progress works as for DataManager.add_file: it is called from the
+        worker threads with the bytes of each chunk stored or file skipped,
+        and an exception raised from it cancels the whole import. Files
+        that can't be read are counted in stats.failed and left out.
+        """
+        if not self.data_manager.crypto.key:
+            logger.error("Cannot ingest files: Master password not set")
+            raise ValueError("Master password not set")
+        self.stats = IngestStats()
+        # The files are sealed with this key; see VaultBatch.crypto
+        crypto = self.data_manager.crypto
+        # A snapshot, since the vault may change while the workers compare
+        existing = self.data_manager.get_all_entries()
+        digest_key = self._digest_key()
+        work = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        staged = []
+        errors = []
+
+        def report(nbytes: int):
+            if progress is not None:
+                progress(nbytes)
+            with self._lock:
+                self.stats.bytes_done += nbytes
+
+        def walk():
+            try:
+                seen = set()
+                for file_path, name in iter_files(paths):
+                    if stop.is_set():
+                        break
+                    try:
+                        info = os.stat(file_path)
+                    except OSError as e:
+                        self._fail(file_path, e)
+                        continue
+                    if not stat.S_ISREG(info.st_mode):
+                        continue
+                    if name in seen:
+                        self._fail(file_path, ValueError(f"Another file is named {name}"))
+                        continue
+                    seen.add(name)
+                    with self._lock:
+                        self.stats.files_found += 1
+                        self.stats.bytes_found += info.st_size
+                    if self.discovered is not None:
+                        self.discovered(info.st_size, False)
+                    self._put(work, (file_path, name, info), stop)
+            except BaseException as e:
+                errors.append(e)
+                stop.set()
+            finally:
+                self.stats.walk_done = True
+                if self.discovered is not None:
+                    self.discovered(0, True)
+                for _ in range(self.workers):
+                    self._put(work, None, stop)
+
+        def ingest():
+            while not stop.is_set():
+                item = work.get()
+                if item is None:
+                    return
+                try:
+                    batch = self._ingest_file(*item, existing, digest_key, report)
+                except BaseException as e:
+                    # Raised by progress: the import is cancelled
+                    errors.append(e)
+                    stop.set()
+                    return
+                if batch is not None:
+                    with self._lock:
+                        staged.append(batch)
+
+        logger.debug(f"Ingesting {len(paths)} paths with {self.workers} workers")
+        threads = [threading.Thread(target=walk, name="ingest-walk", daemon=True)]
+        threads += [threading.Thread(target=ingest, name=f"ingest-{i}", daemon=True)
+                    for i in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if errors:
+            logger.debug(f"Ingest stopped, discarding {len(staged)} staged files")
+            for batch in staged:
+                self.data_manager.discard_batch(batch)
+            raise errors[0]
+        self.data_manager.commit_batch(self._merge(staged, crypto), wait=True)
+        self.stats.finished = time.monotonic()
+        logger.debug(f"Ingested {self.stats.files_added} files, skipped "
+                     f"{self.stats.files_skipped}, {len(self.stats.failed)} failed "
+                     f"in {self.stats.elapsed():.2f}s")
+        return self.stats
+
+    @staticmethod
+    def _put(work: queue.Queue, item, stop: threading.Event):
+        """Queue item, giving up once the workers have stopped taking items."""
+        while True:
+            try:
+                work.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                if stop.is_set():
+                    return
+
+    def _digest_key(self):
+        """Key of the content digests, or None on a legacy key schedule."""
+        try:
+            return self.data_manager.crypto.derive_subkey(DIGEST_LABEL)
+        except ValueError:
+            return None
+
+    @staticmethod
+    def new_digest(digest_key: bytes):
+        """Keyed BLAKE2b, so digests reveal nothing without the vault key."""
+        return hashlib.blake2b(key=digest_key, digest_size=32)
+
+    @classmethod
+    def file_digest(cls, file_path, digest_key: bytes) -> str:
+        """Digest of a whole file, as stage_file stores it."""
+        digest = cls.new_digest(digest_key)
+        with open(file_path, 'rb') as src:
+            while True:
+                block = src.read(DIGEST_READ_SIZE)
+                if not block:
+                    break
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _fail(self, file_path, error: Exception):
+        logger.error(f"Failed to ingest {file_path}: {str(error)}")
+        with self._lock:
+            self.stats.failed.append((file_path, str(error)))
+
+    def _ingest_file(self, file_path, name: str, info, existing: dict, digest_key,
+                     report):
+        """Stage one file, or return None if it is unchanged or can't be added.
+
+        Only exceptions raised from report, i.e. a cancellation, propagate.
+        """
+        previous = existing.get(name)
+        if previous is not None and previous['type'] != 'file':
+            self._fail(file_path, ValueError(f"Name in use by a {previous['type']} entry"))
+            report(info.st_size)
+            return None
+
+        reported = 0
+        cancelled = []
+
+        def count(nbytes: int):
+            nonlocal reported
+            try:
+                report(nbytes)
+            except BaseException as e:
+                cancelled.append(e)
+                raise
+            reported += nbytes
+
+        try:
+            # The content is only read up front if size and mtime say it
+            # may be unchanged; otherwise it is hashed while it is stored
+            unchanged = (digest_key is not None and previous is not None
+                         and previous.get('size') == info.st_size
+                         and previous.get('mtime') == info.st_mtime_ns
+                         and previous.get('digest') is not None
+                         and self.file_digest(file_path, digest_key) == previous['digest'])
+            batch = None if unchanged else self.data_manager.stage_file(
+                name, file_path, progress=count, fields={'mtime': info.st_mtime_ns},
+                digest=self.new_digest(digest_key) if digest_key is not None else None
+            )
+        except Exception as e:
+            if cancelled:
+                raise cancelled[0]
+            self._fail(file_path, e)
+            report(max(info.st_size - reported, 0))
+            return None
+        with self._lock:
+            if batch is None:
+                self.stats.files_skipped += 1
+            else:
+                self.stats.files_added += 1
+        if batch is None:
+            report(info.st_size)
+        return batch
+
+    @staticmethod
+    def _merge(batches: list, crypto) -> VaultBatch:
+        """Join staged batches into the single batch that is committed."""
+        merged = VaultBatch(crypto=crypto)
+        for batch in batches:
+            merged.changes.update(batch.changes)
+            merged.new_blobs.extend(batch.new_blobs)
+            merged.new_chunks.extend(batch.new_chunks)
+        return merged
@@ -0,0 +1,317 @@
+from PyQt6.QtWidgets import QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QProgressBar, QFrame
+from PyQt6.QtGui import QFont
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, QTimer, pyqtSignal
+import os
+import time
+import logging
+import threading
+from ingest import FolderIngest
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+# Job states
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+JOB_CANCELLED = 'cancelled'
+
+# File jobs already spread their segments and chunks over every core, so
+# only a couple run at once; the rest wait in the queue
+MAX_CONCURRENT_JOBS = 2
+# Progress is signalled at most this often (seconds), so a fast job can't
+# flood the GUI event loop
+PROGRESS_INTERVAL = 0.05
+# How long a finished job stays in the queue panel (milliseconds)
+FINISHED_JOB_LINGER_MS = 4000
+
+class JobCancelled(Exception):
+    """Raised from a job's progress callback once the job is cancelled."""
+
+class JobSignals(QObject):
+    """Signals of one job; emitted from the worker thread, delivered queued."""
+    started = pyqtSignal()
+    # Bytes done and total bytes; objects since files can exceed 2 GB
+    progress = pyqtSignal(object, object)
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+
+class Job(QRunnable):
+    """One unit of background work, such as adding or saving a file.
+
+    work(progress) does the work on a pool thread. It must pass progress
+    on to the DataManager call it makes: each call reports bytes done, and
+    raises JobCancelled once the job is cancelled, which DataManager treats
+    like any failure and cleans up after.
+    """
+
+    def __init__(self, title: str, work, total: int = 0, total_final: bool = True):
+        super().__init__()
+        # The manager keeps the job alive; Qt must not delete it under Python
+        self.setAutoDelete(False)
+        self.title = title
+        self.work = work
+        self.total = total
+        # False while the total is still growing, e.g. during a folder walk
+        self.total_final = total_final
+        self.done = 0
+        self.started_at = None
+        self.state = JOB_QUEUED
+        self.error = None
+        self.signals = JobSignals()
+        self._cancel = threading.Event()
+        self._last_progress = 0.0
+        # Work may report from several threads at once
+        self._progress_lock = threading.Lock()
+
+    def cancel(self):
+        """Ask the job to stop at its next progress report."""
+        self._cancel.set()
+
+    def is_cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def report(self, nbytes: int):
+        """Progress callback handed to work."""
+        if self._cancel.is_set():
+            raise JobCancelled()
+        with self._progress_lock:
+            self.done += nbytes
+            now = time.monotonic()
+            if now - self._last_progress < PROGRESS_INTERVAL:
+                return
+            self._last_progress = now
+            done, total = self.done, self.total
+        self.signals.progress.emit(done, total)
+
+    def add_total(self, nbytes: int, final: bool = False):
+        """Grow the total as work finds more to do; final once it is complete."""
+        with self._progress_lock:
+            self.total += nbytes
+            self.total_final = final
+
+    def run(self):
+        if self._cancel.is_set():
+            self._finish(JOB_CANCELLED)
+            return
+        self.state = JOB_RUNNING
+        self.started_at = time.monotonic()
+        self.signals.started.emit()
+        try:
+            result = self.work(self.report)
+        except JobCancelled:
+            logger.debug(f"Job cancelled: {self.title}")
+            self._finish(JOB_CANCELLED)
+            return
+        except Exception as e:
+            logger.error(f"Job failed: {self.title}: {str(e)}")
+            self.error = str(e)
+            self._finish(JOB_FAILED)
+            return
+        self.signals.progress.emit(self.done, self.total)
+        self._finish(JOB_DONE, result)
+
+    def _finish(self, state: str, result=None):
+        self.state = state
+        if state == JOB_DONE:
+            self.signals.finished.emit(result)
+        elif state == JOB_FAILED:
+            self.signals.failed.emit(self.error)
+        else:
+            self.signals.cancelled.emit()
+
+class JobManager(QObject):
+    """Queue of background jobs run on a dedicated QThreadPool."""
+    job_added = pyqtSignal(object)
+
+    def __init__(self, max_jobs: int = MAX_CONCURRENT_JOBS, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max_jobs)
+        self.jobs = []
+
+    def submit(self, title: str, work, total: int = 0) -> Job:
+        """Queue work(progress) and return its Job."""
+        return self.start(Job(title, work, total))
+
+    def start(self, job: Job) -> Job:
+        """Queue a Job built by the caller."""
+        self.jobs.append(job)
+        for signal in (job.signals.finished, job.signals.failed, job.signals.cancelled):
+            signal.connect(lambda *_, job=job: self._forget(job))
+        self.job_added.emit(job)
+        self.pool.start(job)
+        return job
+
+    def cancel(self, job: Job):
+        """Cancel a job; a queued one is dropped without running."""
+        job.cancel()
+        if job.state == JOB_QUEUED and self.pool.tryTake(job):
+            job._finish(JOB_CANCELLED)
+
+    def cancel_all(self):
+        for job in list(self.jobs):
+            self.cancel(job)
+
+    def wait(self, msecs: int = -1) -> bool:
+        """Block until every job has finished, e.g. before quitting."""
+        return self.pool.waitForDone(msecs)
+
+    def _forget(self, job: Job):
+        if job in self.jobs:
+            self.jobs.remove(job)
+
+def add_file_job(jobs: JobManager, data_manager, name: str, file_path: str) -> Job:
+    """Queue DataManager.add_file for one file."""
+    return jobs.submit(
+        f"Adding {name}",
+        lambda progress: data_manager.add_file(name, file_path, progress=progress),
+        os.path.getsize(file_path)
+    )
+
+def ingest_job(jobs: JobManager, data_manager, paths: list) -> Job:
+    """Queue a FolderIngest of files and folders; its result is the IngestStats."""
+    ingest = FolderIngest(data_manager)
+    title = (f"Importing {os.path.basename(os.path.normpath(paths[0]))}" if len(paths) == 1
+             else f"Importing {len(paths)} items")
+    job = Job(title, lambda progress: ingest.run(paths, progress), total_final=False)
+    ingest.discovered = job.add_total
+    return jobs.start(job)
+
+def get_file_job(jobs: JobManager, data_manager, name: str, output_path: str) -> Job:
+    """Queue DataManager.get_file for one file."""
+    entry = data_manager.get_entry(name)
+    size = entry.get('size', 0) if entry else 0
+    return jobs.submit(
+        f"Saving {name}",
+        lambda progress: data_manager.get_file(name, output_path, progress=progress),
+        size
+    )
+
+def format_size(size_bytes) -> str:
+    """Format a byte count in human-readable form"""
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size_bytes < 1024:
+            return f"{size_bytes:.1f} {unit}"
+        size_bytes /= 1024
+    return f"{size_bytes:.1f} TB"
+
+def format_duration(seconds: float) -> str:
+    """Format seconds as m:ss, or h:mm:ss from an hour on"""
+    minutes, seconds = divmod(int(seconds + 0.5), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes}:{seconds:02d}"
+
+class JobRow(QFrame):
+    """Title, progress bar and cancel button of one job."""
+
+    def __init__(self, job: Job, jobs: JobManager, parent=None):
+        super().__init__(parent)
+        self.job = job
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(8, 6, 8, 6)
+        layout.setSpacing(4)
+
+        header = QHBoxLayout()
+        self.title = QLabel(job.title)
+        self.title.setFont(QFont("Segoe UI", 9, QFont.Weight.Medium))
+        header.addWidget(self.title, 1)
+        self.cancel_btn = QPushButton("Cancel")
+        self.cancel_btn.clicked.connect(lambda: jobs.cancel(job))
+        header.addWidget(self.cancel_btn)
+        layout.addLayout(header)
+
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setFixedHeight(6)
+        self.progress_bar.setTextVisible(False)
+        # Progress is shown in per-mille, so byte counts never overflow the bar
+        self.progress_bar.setRange(0, 1000 if job.total else 0)
+        layout.addWidget(self.progress_bar)
+
+        self.status = QLabel("Queued")
+        self.status.setFont(QFont("Segoe UI", 8))
+        layout.addWidget(self.status)
+
+        job.signals.started.connect(lambda: self.status.setText("Running"))
+        job.signals.progress.connect(self.update_progress)
+        job.signals.finished.connect(lambda _: self.show_result("Done"))
+        job.signals.failed.connect(lambda error: self.show_result(f"Failed: {error}"))
+        job.signals.cancelled.connect(lambda: self.show_result("Cancelled"))
+
+    def update_progress(self, done, total):
+        """Show the fraction done, the throughput and, once known, the time left"""
+        if not total:
+            return
+        self.progress_bar.setRange(0, 1000)
+        self.progress_bar.setValue(min(done * 1000 // total, 1000))
+        text = f"{min(done * 100 // total, 100)}%"
+        elapsed = time.monotonic() - self.job.started_at if self.job.started_at else 0
+        if elapsed > 0 and done:
+            rate = done / elapsed
+            text += f" · {format_size(rate)}/s"
+            if self.job.total_final:
+                text += f" · {format_duration(max(total - done, 0) / rate)} left"
+        self.status.setText(text)
+
+    def show_result(self, text: str):
+        self.status.setText(text)
+        self.cancel_btn.hide()
+        self.progress_bar.setRange(0, 1000)
+        if self.job.state == JOB_DONE:
+            self.progress_bar.setValue(1000)
+
+class JobQueuePanel(QFrame):
+    """Running and queued jobs, one row each; hidden while there are none."""
+
+    def __init__(self, jobs: JobManager, parent=None):
+        super().__init__(parent)
+        self.jobs = jobs
+        self.setStyleSheet("""
+            QFrame {
+                background: rgba(45, 45, 45, 0.5);
+                border: none;
+                border-radius: 8px;
+            }
+            QLabel {
+                color: #E0E0E0;
+            }
+            QPushButton {
+                padding: 2px 8px;
+                text-align: center;
+                font-size: 11px;
+            }
+            QProgressBar {
+                background: #3D3D3D;
+                border: none;
+                border-radius: 3px;
+            }
+            QProgressBar::chunk {
+                background: #21D4FD;
+                border-radius: 3px;
+            }
+        """)
+        self.rows = QVBoxLayout(self)
+        self.rows.setContentsMargins(8, 8, 8, 8)
+        self.rows.setSpacing(6)
+        self.hide()
+        jobs.job_added.connect(self.add_job)
+
+    def add_job(self, job: Job):
+        row = JobRow(job, self.jobs, self)
+        self.rows.addWidget(row)
+        self.show()
+        for signal in (job.signals.finished, job.signals.failed, job.signals.cancelled):
+            signal.connect(lambda *_, row=row: QTimer.singleShot(
+                FINISHED_JOB_LINGER_MS, lambda: self.remove_row(row)
+            ))
+
+    def remove_row(self, row: JobRow):
+        self.rows.removeWidget(row)
+        row.deleteLater()
+        if not self.rows.count():
+            self.hide()
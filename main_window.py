@@ -1,8 +1,6 @@
 import sys
 import os
 import pyperclip
-import string
-import random
 from PyQt6.QtWidgets import QMainWindow, QWidget, QVBoxLayout, QHBoxLayout
 from PyQt6.QtWidgets import QPushButton, QLineEdit, QLabel, QTableWidget, QTableWidgetItem
 from PyQt6.QtWidgets import QMessageBox, QDialog, QSpinBox, QCheckBox, QMenu, QMenuBar
@@ -11,11 +9,12 @@ from PyQt6.QtWidgets import QListWidget, QListWidgetItem, QStackedWidget
 from PyQt6.QtCore import Qt, QTimer, QSize, QPropertyAnimation, QEasingCurve
 from PyQt6.QtGui import QAction, QIcon, QPalette, QColor, QFont, QFontDatabase
 from data_manager import DataManager
-from crypto import CryptoManager
+from password_generator import generate_password, generate_passphrase
 from dashboard import DashboardWidget
 from passwords_view import PasswordsWidget
 from files_view import FilesWidget
 from settings_view import SettingsWidget
+from jobs import JobManager, JobQueuePanel, add_file_job
 
 class PasswordGeneratorDialog(QDialog):
     def __init__(self, parent=None):
@@ -40,6 +39,15 @@ class PasswordGeneratorDialog(QDialog):
         self.symbols_check.setChecked(True)
         layout.addWidget(self.symbols_check)
 
+        # Look-alike characters checkbox
+        self.lookalikes_check = QCheckBox("Exclude Look-alike Characters")
+        layout.addWidget(self.lookalikes_check)
+
+        # Passphrase mode checkbox (length is the word count)
+        self.passphrase_check = QCheckBox("Passphrase (words)")
+        self.passphrase_check.toggled.connect(self.toggle_passphrase_mode)
+        layout.addWidget(self.passphrase_check)
+
         # Generated password
         self.password_edit = QLineEdit()
         self.password_edit.setReadOnly(True)
@@ -58,12 +66,26 @@ class PasswordGeneratorDialog(QDialog):
         self.setLayout(layout)
         self.generate_password()
 
+    def toggle_passphrase_mode(self, enabled):
+        if enabled:
+            self.length_spin.setRange(4, 12)
+            self.length_spin.setValue(6)
+        else:
+            self.length_spin.setRange(8, 64)
+            self.length_spin.setValue(16)
+        self.symbols_check.setEnabled(not enabled)
+        self.lookalikes_check.setEnabled(not enabled)
+        self.generate_password()
+
     def generate_password(self):
-        crypto = CryptoManager()
-        password = crypto.generate_password(
-            self.length_spin.value(),
-            self.symbols_check.isChecked()
-        )
+        if self.passphrase_check.isChecked():
+            password = generate_passphrase(self.length_spin.value())
+        else:
+            password = generate_password(
+                self.length_spin.value(),
+                self.symbols_check.isChecked(),
+                self.lookalikes_check.isChecked()
+            )
         self.password_edit.setText(password)
 
     def copy_password(self):
@@ -151,6 +173,8 @@ class MainWindow(QMainWindow):
         self.data_manager = data_manager
         self.clipboard_timer = QTimer()
         self.clipboard_timer.timeout.connect(self.clear_clipboard)
+        # Background file transfers, shared by every view
+        self.jobs = JobManager(parent=self)
         self.setup_ui()
         self.load_data()
         self.setup_styles()
@@ -221,6 +245,11 @@ class MainWindow(QMainWindow):
             self.nav_buttons.append(btn)
 
         sidebar_layout.addStretch()
+
+        # Running and queued file transfers
+        self.job_panel = JobQueuePanel(self.jobs)
+        sidebar_layout.addWidget(self.job_panel)
+        sidebar_layout.addSpacing(12)
         main_layout.addWidget(sidebar)
 
         # Create stack widget for different views
@@ -232,9 +261,9 @@ class MainWindow(QMainWindow):
         """)
 
         # Add views to stack
-        self.dashboard = DashboardWidget(self.data_manager)
+        self.dashboard = DashboardWidget(self.data_manager, jobs=self.jobs)
         self.passwords = PasswordsWidget(self.data_manager)
-        self.files = FilesWidget(self.data_manager)
+        self.files = FilesWidget(self.data_manager, jobs=self.jobs)
         self.settings = SettingsWidget()
 
         self.stack.addWidget(self.dashboard)
@@ -412,17 +441,14 @@ class MainWindow(QMainWindow):
                 # Get file name from path
                 file_name = os.path.basename(file_path)
                 
-                # Add file to DataManager
-                self.data_manager.add_file(file_name, file_path)
-                
-                # Refresh files view
-                self.files.load_data()
-                
-                QMessageBox.information(
+                # Encrypt in the background; refresh once the file is in
+                job = add_file_job(self.jobs, self.data_manager, file_name, file_path)
+                job.signals.finished.connect(lambda _: self.files.load_data())
+                job.signals.failed.connect(lambda error: QMessageBox.warning(
                     self,
-                    "Success",
-                    f"File '{file_name}' added successfully!"
-                )
+                    "Error",
+                    f"Failed to add file '{file_name}': {error}"
+                ))
             except Exception as e:
                 QMessageBox.warning(
                     self,
@@ -458,9 +484,7 @@ class MainWindow(QMainWindow):
 
     def generate_password(self):
         """Generate a secure random password"""
-        length = 16
-        chars = string.ascii_letters + string.digits + "!@#$%^&*"
-        return ''.join(random.choice(chars) for _ in range(length))
+        return generate_password(16)
 
     def clear_clipboard(self):
         pyperclip.copy("")
@@ -475,4 +499,10 @@ class MainWindow(QMainWindow):
             self.entries_table.setRowHidden(row, not show)
 
     def show_snackbar(self, message):
-        QMessageBox.information(self, "Info", message) 
\ No newline at end of file
+        QMessageBox.information(self, "Info", message)
+
+    def closeEvent(self, event):
+        # Cancelled jobs remove their partial blobs and outputs on the way out
+        self.jobs.cancel_all()
+        self.jobs.wait()
+        super().closeEvent(event) 
\ No newline at end of file
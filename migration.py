@@ -0,0 +1,237 @@
+import os
+import time
+import base64
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from crypto import CryptoManager
+from record_log import RecordLog
+from durable_io import replace_durable
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+# Journal record holding the migration plan; every other record is a blob
+PLAN_RECORD = 'plan'
+BLOB_RECORD_PREFIX = 'blob:'
+
+# Default cap on bytes rewritten per second, so a migration leaves disk
+# bandwidth to the foreground. None disables throttling.
+DEFAULT_MAX_BYTES_PER_SECOND = 64 * 1024 * 1024
+# Largest burst the throttle lets through without waiting
+THROTTLE_BURST = 8 * 1024 * 1024
+
+class Throttle:
+    """Token bucket limiting the rate of bytes written across threads."""
+
+    def __init__(self, bytes_per_second: int = None, burst: int = THROTTLE_BURST):
+        self.bytes_per_second = bytes_per_second
+        self.burst = burst
+        self._available = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, nbytes: int):
+        """Wait until nbytes may be written."""
+        if not self.bytes_per_second:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._available = min(
+                self._available + (now - self._updated) * self.bytes_per_second, self.burst
+            )
+            self._updated = now
+            self._available -= nbytes
+            wait = -self._available / self.bytes_per_second if self._available < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+class ThrottledWriter:
+    """Binary file wrapper whose writes are paced by a Throttle."""
+
+    def __init__(self, dst, throttle: Throttle):
+        self._dst = dst
+        self._throttle = throttle
+
+    def write(self, data) -> int:
+        self._throttle.consume(len(data))
+        return self._dst.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self._dst, name)
+
+class BlobMigration:
+    """Background rewrite of file blobs, resumable from an encrypted journal.
+
+    Chunk files are rewritten the same way during a key rotation; the
+    callbacks tell the two apart by path.
+
+    A migration is planned once: the blobs to rewrite and, for a key
+    rotation, the key they are currently sealed with go into the first
+    journal record. Workers then rewrite each blob to a temporary file,
+    swap it in atomically and journal it, so after a crash or a stop only
+    the blobs in flight are redone. Until a blob is journaled,
+    source_crypto returns the key it must be read with; readers that race
+    with the swap retry once (see DataManager._read_blob).
+
+    The journal is a RecordLog sealed with the vault key, so the source key
+    is never on disk in the clear. It is removed when the migration ends.
+    """
+
+    def __init__(self, journal_path, crypto: CryptoManager, rewrite, needs_rewrite,
+                 workers: int = None, max_bytes_per_second: int = DEFAULT_MAX_BYTES_PER_SECOND):
+        self.journal = RecordLog(journal_path, crypto)
+        # rewrite(path, source_crypto, dst) writes the migrated blob to dst;
+        # needs_rewrite(path, source_crypto) tells whether a blob is current
+        self.rewrite = rewrite
+        self.needs_rewrite = needs_rewrite
+        self.workers = workers or os.cpu_count() or 1
+        self.throttle = Throttle(max_bytes_per_second)
+        # Blobs still to migrate; guarded by _lock together with each swap
+        self._pending = set()
+        self._source = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def crypto(self) -> CryptoManager:
+        return self.journal.crypto
+
+    @crypto.setter
+    def crypto(self, crypto: CryptoManager):
+        self.journal.crypto = crypto
+
+    def active(self) -> bool:
+        """Whether blobs are left to migrate."""
+        return bool(self._pending)
+
+    def remaining(self) -> int:
+        """Number of blobs left to migrate."""
+        return len(self._pending)
+
+    def load(self) -> bool:
+        """Read the journal of an interrupted migration; True if one was found."""
+        records = {}
+        self.journal.replay(records)
+        plan = records.pop(PLAN_RECORD, None)
+        with self._lock:
+            if plan is None:
+                self._pending = set()
+                self._source = None
+                return False
+            done = {name[len(BLOB_RECORD_PREFIX):] for name in records}
+            self._pending = set(plan['blobs']) - done
+            self._source = self._source_from_plan(plan)
+        logger.debug(f"Migration journal loaded: {len(self._pending)} of "
+                     f"{len(plan['blobs'])} blobs left")
+        return True
+
+    def plan(self, paths, source_key: bytes = None):
+        """Journal a new migration of paths, replacing any unfinished one.
+
+        source_key is the key the blobs are sealed with now, if it is not
+        the vault key.
+        """
+        self.stop()
+        paths = sorted({str(path) for path in paths})
+        plan = {'blobs': paths,
+                'source_key': base64.b64encode(source_key).decode() if source_key else None}
+        self.journal.reset()
+        self.journal.append([(PLAN_RECORD, plan)])
+        with self._lock:
+            self._pending = set(paths)
+            self._source = self._source_from_plan(plan)
+        logger.debug(f"Planned migration of {len(paths)} blobs")
+
+    @staticmethod
+    def _source_from_plan(plan: dict):
+        if not plan.get('source_key'):
+            return None
+        source = CryptoManager()
+        source.key = base64.b64decode(plan['source_key'])
+        return source
+
+    def source_crypto(self, path):
+        """Crypto to read path with: the source key until it is migrated, else None."""
+        with self._lock:
+            if self._source is not None and str(path) in self._pending:
+                return self._source
+        return None
+
+    def discard(self, path):
+        """Drop a blob that is being deleted; a rewrite in flight is thrown away."""
+        with self._lock:
+            self._pending.discard(str(path))
+
+    def start(self) -> threading.Thread:
+        """Migrate the pending blobs on a daemon thread, which is returned."""
+        if self._thread is not None and self._thread.is_alive():
+            return self._thread
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="blob-migration", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self, wait: bool = True):
+        """Stop after the blobs in flight; the journal keeps the progress."""
+        self._stop.set()
+        thread = self._thread
+        if wait and thread is not threading.current_thread():
+            if thread is not None:
+                thread.join()
+            # Nothing is running any more, so a later run() may proceed
+            self._stop.clear()
+
+    def run(self) -> int:
+        """Migrate the pending blobs on the worker pool; returns blobs rewritten."""
+        with self._lock:
+            paths = sorted(self._pending)
+        logger.debug(f"Migrating {len(paths)} blobs with {self.workers} workers")
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            rewritten = sum(pool.map(self._migrate_quietly, paths))
+        if not self._stop.is_set() and not self._pending:
+            self.journal.reset()
+            with self._lock:
+                self._source = None
+            logger.debug("Blob migration complete")
+        logger.debug(f"Rewrote {rewritten} blobs, {len(self._pending)} left")
+        return rewritten
+
+    def _migrate_quietly(self, path: str) -> bool:
+        if self._stop.is_set():
+            return False
+        try:
+            return self._migrate(path)
+        except Exception as e:
+            # Left pending, so the next run retries it
+            logger.error(f"Failed to migrate blob {path}: {str(e)}")
+            return False
+
+    def _migrate(self, path: str) -> bool:
+        """Rewrite one blob and journal it."""
+        source = self.source_crypto(path)
+        encrypted_path = Path(path)
+        rewritten = False
+        if encrypted_path.exists() and self.needs_rewrite(encrypted_path, source):
+            temp_path = encrypted_path.with_name(encrypted_path.name + '.migrating')
+            try:
+                with open(temp_path, 'wb') as dst:
+                    self.rewrite(encrypted_path, source, ThrottledWriter(dst, self.throttle))
+                    dst.flush()
+                    os.fsync(dst.fileno())
+                with self._lock:
+                    # A blob deleted meanwhile must not be brought back
+                    if path in self._pending:
+                        replace_durable(temp_path, encrypted_path)
+                        self._pending.discard(path)
+                        rewritten = True
+            finally:
+                if temp_path.exists():
+                    os.remove(temp_path)
+        with self._lock:
+            self._pending.discard(path)
+        self.journal.append([(BLOB_RECORD_PREFIX + path, {})])
+        return rewritten
@@ -0,0 +1,251 @@
+import math
+import string
+import secrets
+import logging
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+LOWERCASE = string.ascii_lowercase
+UPPERCASE = string.ascii_uppercase
+DIGITS = string.digits
+SYMBOLS = "!@#$%^&*()_+-=[]{}|;:,.<>?"
+# Characters easily confused with one another in many fonts
+LOOKALIKES = "Il1|O0o"
+
+# Random bytes drawn from the OS per refill
+ENTROPY_CHUNK = 4096
+
+class PasswordPolicy:
+    """Character classes, length and exclusions for random passwords.
+
+    Every enabled class is required to appear at least once; passwords that
+    miss a class are rejected and redrawn, so the result is uniform over all
+    passwords satisfying the policy.
+    """
+
+    def __init__(self, length: int = 16, lowercase: bool = True, uppercase: bool = True,
+                 digits: bool = True, symbols: bool = True,
+                 exclude_lookalikes: bool = False, exclude: str = ""):
+        self.length = length
+        excluded = set(exclude) | (set(LOOKALIKES) if exclude_lookalikes else set())
+        self.classes = []
+        for enabled, chars in ((lowercase, LOWERCASE), (uppercase, UPPERCASE),
+                               (digits, DIGITS), (symbols, SYMBOLS)):
+            if enabled:
+                chars = ''.join(c for c in chars if c not in excluded)
+                if chars:
+                    self.classes.append(chars)
+        if not self.classes:
+            raise ValueError("Password policy allows no characters")
+        if length < len(self.classes):
+            raise ValueError(f"Length {length} is too short for {len(self.classes)} required character classes")
+        self.alphabet = ''.join(self.classes)
+
+    @property
+    def entropy_bits(self) -> float:
+        """Upper bound on entropy, ignoring the required-class rejections."""
+        return self.length * math.log2(len(self.alphabet))
+
+    def accepts(self, password: str) -> bool:
+        """Check that every required character class is present."""
+        return all(any(c in chars for c in password) for chars in self.classes)
+
+class PassphrasePolicy:
+    """Word count and formatting for diceware-style passphrases."""
+
+    def __init__(self, words: int = 6, separator: str = "-", capitalize: bool = False,
+                 include_digit: bool = False):
+        if words < 1:
+            raise ValueError("A passphrase needs at least one word")
+        self.words = words
+        self.separator = separator
+        self.capitalize = capitalize
+        self.include_digit = include_digit
+
+    @property
+    def entropy_bits(self) -> float:
+        bits = self.words * math.log2(len(WORDLIST))
+        if self.include_digit:
+            bits += math.log2(10)
+        return bits
+
+class PasswordGenerator:
+    """Generate passwords and passphrases from the OS CSPRNG.
+
+    Entropy is drawn from secrets.token_bytes in bulk. Bytes are mapped to
+    the alphabet with a translation table that also drops every byte at or
+    above the largest multiple of the alphabet size, which is rejection
+    sampling without per-character Python work and without modulo bias.
+    """
+
+    def __init__(self, chunk_size: int = ENTROPY_CHUNK):
+        self.chunk_size = chunk_size
+        self._tables = {}
+
+    def _table(self, alphabet: str):
+        """Translation table and rejected bytes for an alphabet, cached."""
+        if alphabet not in self._tables:
+            size = len(alphabet)
+            if not 0 < size <= 256:
+                raise ValueError("Alphabet must have between 1 and 256 characters")
+            limit = 256 - 256 % size
+            table = bytes(ord(alphabet[b % size]) if b < limit else 0 for b in range(256))
+            self._tables[alphabet] = (table, bytes(range(limit, 256)))
+        return self._tables[alphabet]
+
+    def random_chars(self, alphabet: str, count: int) -> str:
+        """Draw count characters uniformly from an ASCII alphabet."""
+        table, rejected = self._table(alphabet)
+        chunks = []
+        remaining = count
+        while remaining > 0:
+            # Ask for a little more than needed to cover rejected bytes
+            raw = secrets.token_bytes(max(self.chunk_size, remaining + remaining // 4))
+            accepted = raw.translate(table, rejected)[:remaining]
+            chunks.append(accepted)
+            remaining -= len(accepted)
+        return b"".join(chunks).decode("ascii")
+
+    def random_index(self, size: int) -> int:
+        """Draw an index in range(size) without bias."""
+        return secrets.randbelow(size)
+
+    def generate(self, policy: PasswordPolicy = None) -> str:
+        """Generate one password."""
+        return self.generate_batch(1, policy)[0]
+
+    def generate_batch(self, n: int, policy: PasswordPolicy = None) -> list:
+        """Generate n passwords, drawing the entropy for all of them at once."""
+        policy = policy or PasswordPolicy()
+        passwords = []
+        while len(passwords) < n:
+            needed = n - len(passwords)
+            chars = self.random_chars(policy.alphabet, needed * policy.length)
+            for i in range(0, len(chars), policy.length):
+                candidate = chars[i:i + policy.length]
+                if policy.accepts(candidate):
+                    passwords.append(candidate)
+        logger.debug(f"Generated {n} passwords")
+        return passwords
+
+    def generate_passphrase(self, policy: PassphrasePolicy = None) -> str:
+        """Generate one passphrase from the built-in wordlist."""
+        return self.generate_passphrase_batch(1, policy)[0]
+
+    def generate_passphrase_batch(self, n: int, policy: PassphrasePolicy = None) -> list:
+        """Generate n passphrases from the built-in wordlist."""
+        policy = policy or PassphrasePolicy()
+        passphrases = []
+        for _ in range(n):
+            words = [WORDLIST[self.random_index(len(WORDLIST))] for _ in range(policy.words)]
+            if policy.capitalize:
+                words = [word.capitalize() for word in words]
+            if policy.include_digit:
+                position = self.random_index(len(words))
+                words[position] += DIGITS[self.random_index(len(DIGITS))]
+            passphrases.append(policy.separator.join(words))
+        logger.debug(f"Generated {n} passphrases")
+        return passphrases
+
+_default_generator = PasswordGenerator()
+
+def generate_password(length: int = 16, include_symbols: bool = True,
+                      exclude_lookalikes: bool = False) -> str:
+    """Generate one password with letters, digits and optionally symbols."""
+    policy = PasswordPolicy(length, symbols=include_symbols,
+                            exclude_lookalikes=exclude_lookalikes)
+    return _default_generator.generate(policy)
+
+def generate_batch(n: int, policy: PasswordPolicy = None) -> list:
+    """Generate n passwords for the given policy (the default policy if None)."""
+    return _default_generator.generate_batch(n, policy)
+
+def generate_passphrase(words: int = 6, separator: str = "-", capitalize: bool = False,
+                        include_digit: bool = False) -> str:
+    """Generate one diceware-style passphrase."""
+    policy = PassphrasePolicy(words, separator, capitalize, include_digit)
+    return _default_generator.generate_passphrase(policy)
+
+# Compact wordlist for passphrases: 1024 short, distinct English words, so
+# each word adds exactly 10 bits of entropy.
+WORDLIST = tuple("""
+able acid acorn acre act actor adapt add adobe adult aero agent aging agree
+ahead aim air aisle alarm album alert algae alibi alien alike alley allow
+alloy aloe alpha also alter amber amend ample amuse angel anger angle ankle
+anvil apex apple apply apron arbor arch arena argue arise armor army aroma
+arrow art ash aside ask aspen asset atlas atom attic audio audit aunt auto
+avid avoid awake award axis bacon badge bagel baker balm banjo bank barn
+baron basil basin batch bath baton bay beach beam bean bear beard beast bed
+beech beef beet begin bell belt bench berry bike birch bird bison black
+blade blank blast blaze blend bless blimp blink bliss block bloom blue blunt
+blur board boat body bolt bonus book boost boot booth boss bowl box brain
+brake brand brass brave bread break brick bride brief brine brisk broad
+brook broom brush buddy buggy build bulb bunch bunny burst bush buyer cabin
+cable cadet cage cake calf calm camel camp canal candy canoe cape card cargo
+carol cart case cash catch cedar cello chain chair chalk champ chant chaos
+charm chart chase cheek cheer chef chess chest chick chief chili chime chin
+chip choir chord chunk cider city civic claim clam clap clash class clay
+clean clerk click cliff climb clock cloud clove clown club clue coach coast
+cobra cocoa coin comet comic coral cord core corn couch count court cover
+crab craft crane crash crate crawl cream creek crest crew crisp crop crowd
+crown crumb crush crust cube cup curl curry curve cycle daily dairy daisy
+dance dash data dawn deal debut decal decor decoy deer delta demo denim
+depot depth desk dial diary diet digit diner dingo dish ditch diver dock
+dodge dog doll dome donor door dough dove down dozen draft drama drape dream
+dress drift drill drink drive drum duck dune dust duty eager eagle early
+earth easel east echo edge eel eight elbow elder elk elm ember emu enjoy
+entry envoy epic equal era error essay ethic event exact exam exit extra
+fable face fact fair fairy faith fame fancy farm fault fawn feast fence fern
+ferry fever fiber field fifth fig film final finch fire first fish five flag
+flame flash flask fleet flint float flock flood floor flour flute foam focus
+fog folk food foot force fork fort forty forum fox frame fresh frog frost
+fruit fudge fuel funny fuse gala game gap gate gauge gaze gear gecko gem
+genie ghost giant gift glad glass glide globe glove glow glue goat gold golf
+good goose gorge gown grace grain grand grape graph grass gravy great green
+grid grill grin grip grove growl guard guava guess guest guide gulf gull gum
+guru habit hair half hall halo hand happy hare harp hat hatch haven hawk
+hazel head heap heart heat hedge hefty helix hemp herb hero heron hike hill
+hinge hippo hobby holly home honey honor hood hook hope horn horse hotel
+hound hour house hub human humor hunt husky hut hydro icon idea igloo image
+inch index ink inlet input iris iron ivory ivy jade jam jar jazz jeans jelly
+jewel jiffy job jog joke jolly joy judge juice jumbo jump jury kayak keel
+keen kelp key kick kid king kiosk kite kiwi knack knee knife knot koala
+label lace lake lamb lamp lane laser latch lava lawn layer leaf ledge lemon
+lens level lever light lilac lily lime linen lion list lobby local lodge
+logic lotus lucky lunar lunch lynx lyric macro magic major mango maple march
+mask mason match medal melon menu merit mesa metal meter micro mile mill
+mimic mint mist mixer moat mocha model modem moose moral moss motel motor
+mount mouse mouth movie mule mural muse music myth nacho nail name navy neck
+nerve nest net never night ninja noble noise nomad north notch note novel
+nurse nut oak oasis oat ocean odd offer olive omega onion onset opal open
+opera orbit order organ otter ounce outer oval oven owl owner pace pack page
+paint palm panda panel panic paper park party pasta patch path patio pause
+peach peak pearl pecan pedal pen penny perch piano pier pilot pine pink pint
+pipe pixel pizza plaid plain plan plank plant plate plaza plot plum plus
+poem poet point polar polka pond pony poppy porch port pouch power press
+price pride prism prize probe proof prose proud prune pulse puma pump punch
+pupil puppy quail quake quart queen quest quick quiet quill quilt quota
+quote radar radio raft rain rally ranch range rapid raven razor reach ready
+realm rebel reef relax relay relic rent reply rhino rhyme rice ridge rifle
+ring rinse rise river road robe robin robot rock rodeo roof room rope rose
+rotor round route royal ruby rug ruler rumba rumor rural rust saga sail
+salad salon salsa salt sand satin sauce sauna scale scarf scene scent scone
+scoop scout scrap sea seal seat seed sense seven shade shake shape share
+shark shelf shell shift shine ship shirt shore short shrub sign silk siren
+ski skill skirt sky slate sled sleep slice slide slope smile smoke snack
+snail snake sneak snow soap sock sofa soil solar solid solo sonar song sonic
+soup south space spade spark spear spice spike spine spoon sport spray squad
+squid stack staff stage stair stamp stand star steam steel stem step stick
+stone stool storm story stove straw sugar suit sun super surf swamp swan
+sweet swift swing sword syrup table taco tail tango tank tape taxi teal team
+tempo tent term test thorn three thumb tide tiger tiny title toast today
+token tonic tool topaz torch total totem tower town toy track trade trail
+train tram tray treat tree trend trial tribe trick trio trout truck trunk
+trust truth tulip tuna tutor twig twin twist ultra uncle union unit upper
+urban usher valid value valve vapor vase vault venue verb verse vest video
+view villa vine viper visit vista vivid vocal voice volt voter wafer wagon
+wand wave wax wick wind wing wire wise wish wolf wood wool word work worm
+wrap yard yarn zero zest zinc zone zoom
+""".split())
@@ -1,8 +1,8 @@
 from PyQt6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QLineEdit, QTableWidget, QTableWidgetItem, QHeaderView, QMessageBox, QFrame, QTextEdit
 from PyQt6.QtGui import QFont, QColor, QIcon
 from PyQt6.QtCore import Qt
-import string
-import random
+from password_generator import generate_password
+import pyperclip
 
 class PasswordsWidget(QWidget):
     def __init__(self, data_manager, parent=None):
@@ -96,9 +96,10 @@ class PasswordsWidget(QWidget):
                 username_item = QTableWidgetItem(data.get('username', ''))
                 self.entries_table.setItem(row, 1, username_item)
                 
-                # Password (hidden)
+                # Password (hidden); only the name is kept, the secret is
+                # decrypted when shown or copied
                 password_item = QTableWidgetItem("********")
-                password_item.setData(Qt.ItemDataRole.UserRole, data.get('password', ''))
+                password_item.setData(Qt.ItemDataRole.UserRole, name)
                 self.entries_table.setItem(row, 2, password_item)
                 
                 # Actions
@@ -113,6 +114,13 @@ class PasswordsWidget(QWidget):
                 show_btn.clicked.connect(lambda checked, r=row: self.toggle_password_visibility(r))
                 actions_layout.addWidget(show_btn)
                 
+                copy_btn = QPushButton()
+                copy_btn.setIcon(QIcon("icons/key.svg"))
+                copy_btn.setFixedSize(32, 32)
+                copy_btn.setToolTip("Copy password")
+                copy_btn.clicked.connect(lambda checked, n=name: self.copy_password(n))
+                actions_layout.addWidget(copy_btn)
+                
                 delete_btn = QPushButton()
                 delete_btn.setIcon(QIcon("icons/delete.svg"))
                 delete_btn.setFixedSize(32, 32)
@@ -129,10 +137,17 @@ class PasswordsWidget(QWidget):
         """Toggle password visibility for a row"""
         item = self.entries_table.item(row, 2)
         if item.text() == "********":
-            item.setText(item.data(Qt.ItemDataRole.UserRole))
+            entry = self.data_manager.get_entry(item.data(Qt.ItemDataRole.UserRole))
+            item.setText(entry.get('password', '') if entry else '')
         else:
             item.setText("********")
 
+    def copy_password(self, name):
+        """Copy an entry's password to the clipboard"""
+        entry = self.data_manager.get_entry(name)
+        if entry:
+            pyperclip.copy(entry.get('password', ''))
+
     def delete_entry(self, name):
         """Delete a password entry"""
         reply = QMessageBox.question(
@@ -269,6 +284,4 @@ class PasswordsWidget(QWidget):
 
     def generate_password(self):
         """Generate a secure random password"""
-        length = 16
-        chars = string.ascii_letters + string.digits + "!@#$%^&*"
-        return ''.join(random.choice(chars) for _ in range(length)) 
\ No newline at end of file
+        return generate_password(16) 
\ No newline at end of file
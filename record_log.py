@@ -0,0 +1,273 @@
+import os
+import json
+import time
+import struct
+import logging
+import threading
+from concurrent.futures import Future
+from pathlib import Path
+from crypto import CryptoManager
+from durable_io import fsync_directory
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+# Each record is a 4-byte big-endian length followed by that many bytes of
+# CryptoManager.encrypt_bytes output
+RECORD_LENGTH = struct.Struct('>I')
+
+OP_PUT = 'put'
+OP_DELETE = 'delete'
+
+# How long the group committer waits for more mutations before writing
+GROUP_COMMIT_WINDOW = 0.002
+# An idle group commit thread exits after this many seconds
+GROUP_COMMIT_IDLE = 5.0
+
+class RecordLog:
+    """Append-only log of individually encrypted vault mutations.
+
+    Every mutation is one record: a put carries the full new entry, a delete
+    only the name. Replaying the log in order over the last snapshot
+    reproduces the vault, and since each record is last-writer-wins for its
+    name, replaying records the snapshot already contains is harmless.
+
+    Compaction moves the live log aside (rotate), writes a snapshot and then
+    drops the rotated log (discard_rotated). Records appended meanwhile go
+    to a fresh live log, and a crash at any point leaves snapshot plus logs
+    that replay to the same state.
+    """
+
+    def __init__(self, path, crypto: CryptoManager):
+        self.path = Path(path)
+        self.rotated_path = self.path.with_name(self.path.name + '.compacting')
+        self.crypto = crypto
+        # Serializes appends with rotate/reset so a record never straddles
+        # a rotation
+        self._lock = threading.Lock()
+        # Length of the live log before an append whose partial frame could
+        # not be cut off again; no record is appended behind it until it is
+        self._torn_at = None
+
+    def append(self, changes: list):
+        """Durably append one encrypted record per (name, entry) change.
+
+        entry is the new entry for a put, or None for a delete. All records
+        are written with a single write call followed by one fsync. If the
+        write or fsync fails, the log is truncated back to where it was, so
+        no later record ends up behind a partial frame.
+        """
+        if not changes:
+            return
+        frames = []
+        for name, entry in changes:
+            if entry is None:
+                record = {'op': OP_DELETE, 'name': name}
+            else:
+                record = {'op': OP_PUT, 'name': name, 'entry': entry}
+            # default=dict serializes compact Entry records like the dicts they stand for
+            encrypted = self.crypto.encrypt_bytes(json.dumps(record, default=dict).encode())
+            frames.append(RECORD_LENGTH.pack(len(encrypted)))
+            frames.append(encrypted)
+        with self._lock:
+            self._repair()
+            created = not self.path.exists()
+            with open(self.path, 'ab') as f:
+                start = f.tell()
+                try:
+                    f.write(b''.join(frames))
+                    f.flush()
+                    os.fsync(f.fileno())
+                except BaseException:
+                    self._torn_at = start
+                    self._repair()
+                    raise
+            if created:
+                fsync_directory(self.path.parent)
+        logger.debug(f"Appended {len(changes)} records to log")
+
+    def _repair(self):
+        """Cut a failed append's partial frame off the live log.
+
+        Raises OSError while that is not possible, so the log takes no more
+        records until it is.
+        """
+        if self._torn_at is None:
+            return
+        try:
+            with open(self.path, 'r+b') as f:
+                f.truncate(self._torn_at)
+                os.fsync(f.fileno())
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"Failed to truncate log {self.path.name} "
+                         f"after a failed append: {str(e)}")
+            raise
+        self._torn_at = None
+
+    def replay(self, entries: dict, names: set = None) -> int:
+        """Apply the rotated log, then the live log, to entries in place.
+
+        Returns the number of records applied. The names the records touch
+        are added to names, if given.
+        """
+        applied = 0
+        for path in (self.rotated_path, self.path):
+            if path.exists():
+                applied += self._replay_file(path, entries, names)
+        logger.debug(f"Replayed {applied} log records")
+        return applied
+
+    def _replay_file(self, path: Path, entries: dict, names: set = None) -> int:
+        """Replay one log file, cutting off a torn tail.
+
+        A crash during append can leave a partial record at the end. The
+        file is truncated at the last good record so later appends are not
+        hidden behind it. An unreadable record with more records behind it
+        is not a torn append, so the file is left alone and ValueError is
+        raised instead of dropping records that were acknowledged.
+        """
+        applied = 0
+        valid_length = 0
+        with open(path, 'rb') as f:
+            data = f.read()
+        offset = 0
+        while offset < len(data):
+            if offset + RECORD_LENGTH.size > len(data):
+                break
+            (length,) = RECORD_LENGTH.unpack_from(data, offset)
+            end = offset + RECORD_LENGTH.size + length
+            if end > len(data):
+                break
+            try:
+                record = json.loads(self.crypto.decrypt_bytes(
+                    memoryview(data)[offset + RECORD_LENGTH.size:end]
+                ))
+            except Exception as e:
+                logger.error(f"Unreadable log record at offset {offset}: {str(e)}")
+                if end < len(data):
+                    raise ValueError(f"Log {path.name} is damaged at offset {offset}")
+                break
+            if record['op'] == OP_PUT:
+                entries[record['name']] = record['entry']
+            elif record['op'] == OP_DELETE:
+                entries.pop(record['name'], None)
+            if names is not None:
+                names.add(record['name'])
+            applied += 1
+            offset = valid_length = end
+
+        if valid_length < len(data):
+            logger.error(f"Truncating log {path.name} at {valid_length} of {len(data)} bytes")
+            with open(path, 'r+b') as f:
+                f.truncate(valid_length)
+        return applied
+
+    def size(self) -> int:
+        """Size of the live log in bytes."""
+        try:
+            return self.path.stat().st_size
+        except FileNotFoundError:
+            return 0
+
+    def rotate(self):
+        """Move the live log aside before a snapshot is taken.
+
+        If a rotated log is left over from an interrupted compaction, the
+        live log is appended to it instead, since the coming snapshot covers
+        both.
+        """
+        with self._lock:
+            self._repair()
+            if not self.path.exists():
+                return
+            if self.rotated_path.exists():
+                with open(self.path, 'rb') as src, open(self.rotated_path, 'ab') as dst:
+                    dst.write(src.read())
+                    dst.flush()
+                    os.fsync(dst.fileno())
+                os.remove(self.path)
+            else:
+                os.replace(self.path, self.rotated_path)
+            fsync_directory(self.path.parent)
+
+    def discard_rotated(self):
+        """Drop the rotated log once a snapshot covering it is in place."""
+        with self._lock:
+            try:
+                os.remove(self.rotated_path)
+            except FileNotFoundError:
+                pass
+
+    def reset(self):
+        """Remove both the live and the rotated log."""
+        with self._lock:
+            self._torn_at = None
+            for path in (self.path, self.rotated_path):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            fsync_directory(self.path.parent)
+
+class GroupCommitter:
+    """Merge log appends that arrive close together into one durable write.
+
+    submit returns a Future that resolves once the changes are on disk, so
+    callers can wait for durability or carry on. Batches are written in
+    submission order by a single background thread, which exits when idle.
+    """
+
+    def __init__(self, log: RecordLog, window: float = GROUP_COMMIT_WINDOW):
+        self.log = log
+        self.window = window
+        self._cond = threading.Condition()
+        self._pending = []
+        self._thread = None
+
+    def submit(self, changes: list) -> Future:
+        """Queue (name, entry) changes for the next group write."""
+        future = Future()
+        with self._cond:
+            self._pending.append((changes, future))
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="group-commit", daemon=True
+                )
+                self._thread.start()
+            self._cond.notify()
+        return future
+
+    def flush(self):
+        """Block until everything submitted so far is durable."""
+        self.submit([]).result()
+
+    def _run(self):
+        """Write queued batches until the queue stays empty."""
+        while True:
+            with self._cond:
+                if not self._pending:
+                    self._cond.wait(GROUP_COMMIT_IDLE)
+                    if not self._pending:
+                        self._thread = None
+                        return
+            # Give mutations arriving right behind the first one a chance
+            # to share its write and fsync
+            if self.window:
+                time.sleep(self.window)
+            with self._cond:
+                batch, self._pending = self._pending, []
+
+            changes = [change for batch_changes, _ in batch for change in batch_changes]
+            try:
+                self.log.append(changes)
+            except Exception as e:
+                logger.error(f"Group commit of {len(changes)} records failed: {str(e)}")
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for _, future in batch:
+                future.set_result(None)
+            logger.debug(f"Group committed {len(changes)} records from {len(batch)} writers")
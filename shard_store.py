@@ -0,0 +1,230 @@
+import os
+import json
+import hashlib
+import logging
+from itertools import repeat
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from crypto import CryptoManager, mapped_file
+from entry_codec import pack_entries, unpack_entries
+from durable_io import atomic_write, write_durable, fsync_directory
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+# Subkey for the keyed hash that assigns entry names to shards
+SHARD_KEY_LABEL = b"shard-names"
+
+SHARD_MANIFEST = 'manifest.enc'
+SHARD_FORMAT_VERSION = 1
+
+# Shard counts are powers of two, chosen so a shard holds about this many
+# entries. The count doubles as the vault grows and only shrinks once the
+# vault is down to a quarter, so it doesn't flap around a boundary.
+SHARD_TARGET_ENTRIES = 4096
+SHARD_MAX_COUNT = 4096
+
+class ShardedSnapshot:
+    """Vault snapshot spread over encrypted shard files by entry name.
+
+    Each entry lives in the shard picked by a keyed hash of its name, so
+    saving after a few mutations only rewrites the shards they touched.
+    Shards are sealed with their generation, index and count as associated
+    data, so they cannot be swapped or mixed with another layout. The
+    manifest records the current layout; resharding writes a complete new
+    generation and switches to it by replacing the manifest.
+    """
+
+    def __init__(self, shards_dir, crypto: CryptoManager, workers: int = None,
+                 make_rows=None):
+        self.shards_dir = Path(shards_dir)
+        self.manifest_path = self.shards_dir / SHARD_MANIFEST
+        self.crypto = crypto
+        self.workers = workers or os.cpu_count() or 1
+        self.target_entries = SHARD_TARGET_ENTRIES
+        # Entry object factory passed on to unpack_entries
+        self.make_rows = make_rows
+        # Current layout; a count of 0 means nothing has been written yet
+        self.generation = 0
+        self.count = 0
+        # Entry names per shard, kept to rewrite a shard without rehashing.
+        # Dicts rather than sets keep entries in vault order within a shard.
+        self.members = []
+        # Set while the last load failed: the shards on disk are then all
+        # that is left of the vault, so nothing may replace or sweep them
+        self._unreadable = False
+        self._key = None
+        self._key_source = None
+
+    def exists(self) -> bool:
+        """Whether a sharded snapshot has been written."""
+        return self.manifest_path.exists()
+
+    def shard_of(self, name: str, count: int = None) -> int:
+        """Index of the shard holding name."""
+        if self._key_source is not self.crypto.key:
+            self._key = self.crypto.derive_subkey(SHARD_KEY_LABEL)
+            self._key_source = self.crypto.key
+        digest = hashlib.blake2b(name.encode(), key=self._key, digest_size=8).digest()
+        return int.from_bytes(digest, 'big') & ((count or self.count) - 1)
+
+    def shard_count(self, entry_count: int) -> int:
+        """Shard count for a vault of entry_count entries."""
+        count = 1
+        while count * self.target_entries < entry_count and count < SHARD_MAX_COUNT:
+            count *= 2
+        if self.count and count < self.count and count > self.count // 4:
+            return self.count
+        return count
+
+    def load(self) -> dict:
+        """Decrypt every shard in parallel and return the merged entries.
+
+        Any shard that can't be read fails the whole load, and saving is
+        refused until a load succeeds.
+        """
+        self._unreadable = True
+        manifest = json.loads(self.crypto.decrypt_data(self.manifest_path.read_bytes()))
+        if manifest['version'] != SHARD_FORMAT_VERSION:
+            raise ValueError(f"Unsupported shard format version: {manifest['version']}")
+        self.generation = manifest['generation']
+        self.count = 0
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            shards = list(pool.map(self._read_shard, range(manifest['count']),
+                                   repeat(manifest['count'])))
+        self.count = manifest['count']
+        entries = {}
+        for shard in shards:
+            entries.update(shard)
+        self.members = [dict.fromkeys(shard) for shard in shards]
+        self._unreadable = False
+        self._remove_stale()
+        logger.debug(f"Loaded {len(entries)} entries from {self.count} shards")
+        return entries
+
+    def save(self, entries: dict, changed, full: bool = False) -> int:
+        """Write the shards holding the changed names; returns shards written.
+
+        entries is the complete snapshot. The whole layout is rewritten if
+        there is none yet, full is set or the vault has outgrown (or shrunk
+        well below) the current shard count.
+        """
+        if self._unreadable:
+            logger.error("Refusing to save over shards that failed to load")
+            raise ValueError("Shard snapshot failed to load")
+        count = self.shard_count(len(entries))
+        if full or not self.count or count != self.count:
+            return self._write_generation(entries, count)
+
+        touched = set()
+        for name in changed:
+            index = self.shard_of(name)
+            touched.add(index)
+            if name in entries:
+                self.members[index][name] = None
+            else:
+                self.members[index].pop(name, None)
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            list(pool.map(lambda index: self._write_shard(
+                self.generation, index, self.count,
+                {name: entries[name] for name in self.members[index]}, atomic_write
+            ), touched))
+        logger.debug(f"Rewrote {len(touched)} of {self.count} shards")
+        return len(touched)
+
+    def remove(self):
+        """Delete the sharded snapshot, e.g. after a move to SQLite."""
+        if not self.shards_dir.exists():
+            return
+        for path in self.shards_dir.iterdir():
+            os.remove(path)
+        os.rmdir(self.shards_dir)
+        fsync_directory(self.shards_dir.parent)
+        self.generation = 0
+        self.count = 0
+        self.members = []
+        self._unreadable = False
+
+    def replace_with(self, other: "ShardedSnapshot"):
+        """Move another snapshot's files into place of this one's.
+
+        Used for a snapshot written next to this one under a new key. Not
+        atomic: after a crash other's directory is left, and calling this
+        again finishes the swap.
+        """
+        self.remove()
+        os.replace(other.shards_dir, self.shards_dir)
+        fsync_directory(self.shards_dir.parent)
+        self.crypto = other.crypto
+        self.generation = other.generation
+        self.count = other.count
+        self.members = other.members
+
+    def _write_generation(self, entries: dict, count: int) -> int:
+        """Write a complete layout under a new generation and switch to it.
+
+        The new shards are not referenced until the manifest is replaced,
+        so they need no atomic rename; a crash before that leaves the old
+        generation in charge and the new files are swept up on next load.
+        """
+        generation = self.generation + 1
+        members = [{} for _ in range(count)]
+        for name in entries:
+            members[self.shard_of(name, count)][name] = None
+        self.shards_dir.mkdir(exist_ok=True)
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            list(pool.map(lambda index: self._write_shard(
+                generation, index, count,
+                {name: entries[name] for name in members[index]}, write_durable
+            ), range(count)))
+        fsync_directory(self.shards_dir)
+        manifest = {'version': SHARD_FORMAT_VERSION, 'generation': generation, 'count': count}
+        atomic_write(self.manifest_path, self.crypto.encrypt_data(json.dumps(manifest)))
+        self.generation = generation
+        self.count = count
+        self.members = members
+        self._remove_stale()
+        logger.debug(f"Wrote {len(entries)} entries as generation {generation} of {count} shards")
+        return count
+
+    def _shard_path(self, generation: int, index: int) -> Path:
+        return self.shards_dir / f"{generation:08x}-{index:04x}.enc"
+
+    @staticmethod
+    def _associated_data(generation: int, index: int, count: int) -> bytes:
+        return f"shard:{generation}:{index}:{count}".encode()
+
+    def _write_shard(self, generation: int, index: int, count: int, entries: dict, write):
+        """Pack, compress and seal one shard, then write it with write."""
+        payload = self.crypto.compress(pack_entries(entries))
+        sealed = self.crypto.encrypt_many(
+            [payload], self._associated_data(generation, index, count)
+        )[0]
+        write(self._shard_path(generation, index), sealed)
+
+    def _read_shard(self, index: int, count: int) -> dict:
+        """Decrypt and unpack one shard of the current generation.
+
+        The shard is decrypted straight from the mapped file into one
+        buffer, which unpack_entries reads without further copies.
+        """
+        with mapped_file(self._shard_path(self.generation, index)) as sealed:
+            payload = self.crypto.decrypt_bytes(
+                sealed, decompress=True,
+                associated_data=self._associated_data(self.generation, index, count)
+            )
+        return unpack_entries(payload, self.make_rows)
+
+    def _remove_stale(self):
+        """Delete shards of other generations and leftover temp files."""
+        prefix = f"{self.generation:08x}-"
+        removed = 0
+        for path in self.shards_dir.iterdir():
+            if path.name == SHARD_MANIFEST or (path.name.startswith(prefix) and path.suffix == '.enc'):
+                continue
+            os.remove(path)
+            removed += 1
+        if removed:
+            fsync_directory(self.shards_dir)
+            logger.debug(f"Removed {removed} stale shard files")
@@ -0,0 +1,223 @@
+import hmac
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections.abc import MutableMapping
+from pathlib import Path
+from typing import Optional
+from crypto import CryptoManager
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+# Subkey for the HMAC that keys rows by entry name
+NAME_MAC_LABEL = b"sqlite-name-mac"
+
+SCHEMA_VERSION = 1
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    name_mac BLOB PRIMARY KEY,
+    type TEXT NOT NULL,
+    size INTEGER,
+    created REAL NOT NULL,
+    modified REAL NOT NULL,
+    record BLOB NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entries_type ON entries(type);
+CREATE INDEX IF NOT EXISTS entries_size ON entries(size);
+CREATE INDEX IF NOT EXISTS entries_modified ON entries(modified);
+"""
+
+class SQLiteStore:
+    """Vault entries as individually encrypted SQLite rows.
+
+    Rows are keyed by an HMAC of the entry name, so a lookup touches and
+    decrypts a single row. The encrypted record holds the name as well as
+    the entry and is checked against the row key on read, so rows cannot be
+    swapped. Type, size and timestamps are kept in plaintext indexed columns
+    for queries that should not decrypt anything.
+    """
+
+    def __init__(self, path, crypto: CryptoManager):
+        self.path = Path(path)
+        self.crypto = crypto
+        # HMAC key, cached together with the encryption key it was derived under
+        self._mac_key = None
+        self._mac_key_source = None
+        # One connection shared by all threads, serialized here
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False,
+                                   isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=FULL")
+        version = self._db.execute("PRAGMA user_version").fetchone()[0]
+        if version > SCHEMA_VERSION:
+            self._db.close()
+            raise ValueError(f"Unsupported vault database version: {version}")
+        self._db.executescript(SCHEMA)
+        self._db.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+        logger.debug(f"Opened SQLite vault: {self.path.name}")
+
+    def name_mac(self, name: str) -> bytes:
+        """Row key for an entry name."""
+        if self._mac_key_source is not self.crypto.key:
+            self._mac_key = self.crypto.derive_subkey(NAME_MAC_LABEL)
+            self._mac_key_source = self.crypto.key
+        return hmac.new(self._mac_key, name.encode(), hashlib.sha256).digest()
+
+    def get(self, name: str) -> Optional[dict]:
+        """Decrypt and return one entry, or None if there is none."""
+        name_mac = self.name_mac(name)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT record FROM entries WHERE name_mac = ?", (name_mac,)
+            ).fetchone()
+        if row is None:
+            return None
+        found_name, entry = self._open_record(row[0])
+        if found_name != name:
+            raise ValueError("Vault row does not match its key")
+        return entry
+
+    def __contains__(self, name: str) -> bool:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT 1 FROM entries WHERE name_mac = ?", (self.name_mac(name),)
+            ).fetchone()
+        return row is not None
+
+    def count(self, entry_type: str = None) -> int:
+        """Number of entries, optionally of one type, without decrypting."""
+        query, params = self._where(entry_type)
+        with self._lock:
+            return self._db.execute(f"SELECT COUNT(*) FROM entries{query}", params).fetchone()[0]
+
+    def items(self, entry_type: str = None, min_size: int = None,
+              modified_since: float = None) -> list:
+        """Decrypt the (name, entry) pairs matching the indexed filters."""
+        query, params = self._where(entry_type, min_size, modified_since)
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT name_mac, record FROM entries{query}", params
+            ).fetchall()
+        records = self.crypto.decrypt_many([record for _, record in rows])
+        items = []
+        for (name_mac, _), plaintext in zip(rows, records):
+            name, entry = self._parse_record(plaintext)
+            if not hmac.compare_digest(self.name_mac(name), name_mac):
+                raise ValueError("Vault row does not match its key")
+            items.append((name, entry))
+        return items
+
+    def names(self, entry_type: str = None) -> list:
+        """Names of the entries, optionally of one type."""
+        return [name for name, _ in self.items(entry_type)]
+
+    def apply(self, changes: list):
+        """Write (name, entry) changes in one transaction; entry None deletes."""
+        if not changes:
+            return
+        now = time.time()
+        puts = [(name, entry) for name, entry in changes if entry is not None]
+        records = self.crypto.encrypt_many(
+            [json.dumps({'name': name, 'entry': entry}, default=dict).encode()
+             for name, entry in puts]
+        )
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                for (name, entry), record in zip(puts, records):
+                    self._db.execute(
+                        "INSERT INTO entries (name_mac, type, size, created, modified, record) "
+                        "VALUES (?, ?, ?, ?, ?, ?) "
+                        "ON CONFLICT(name_mac) DO UPDATE SET type = excluded.type, "
+                        "size = excluded.size, modified = excluded.modified, "
+                        "record = excluded.record",
+                        (self.name_mac(name), entry.get('type', ''), entry.get('size'),
+                         now, now, record)
+                    )
+                self._db.executemany(
+                    "DELETE FROM entries WHERE name_mac = ?",
+                    [(self.name_mac(name),) for name, entry in changes if entry is None]
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        logger.debug(f"Applied {len(changes)} changes to SQLite vault")
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._db.close()
+
+    def _open_record(self, record: bytes):
+        """Decrypt one record into (name, entry)."""
+        # decrypt_many reuses the cached AEAD context
+        return self._parse_record(self.crypto.decrypt_many([record])[0])
+
+    @staticmethod
+    def _parse_record(plaintext) -> tuple:
+        payload = json.loads(plaintext)
+        return payload['name'], payload['entry']
+
+    @staticmethod
+    def _where(entry_type: str = None, min_size: int = None,
+               modified_since: float = None) -> tuple:
+        """WHERE clause and parameters for the indexed filters."""
+        clauses, params = [], []
+        if entry_type is not None:
+            clauses.append("type = ?")
+            params.append(entry_type)
+        if min_size is not None:
+            clauses.append("size >= ?")
+            params.append(min_size)
+        if modified_since is not None:
+            clauses.append("modified >= ?")
+            params.append(modified_since)
+        if not clauses:
+            return "", params
+        return " WHERE " + " AND ".join(clauses), params
+
+class SQLiteEntries(MutableMapping):
+    """Dict-like view of a SQLiteStore standing in for DataManager.entries.
+
+    Lookups decrypt one row; iteration decrypts every record, so bulk reads
+    should use SQLiteStore.items instead.
+    """
+
+    def __init__(self, store: SQLiteStore):
+        self.store = store
+
+    def __getitem__(self, name: str) -> dict:
+        entry = self.store.get(name)
+        if entry is None:
+            raise KeyError(name)
+        return entry
+
+    def __setitem__(self, name: str, entry: dict):
+        self.store.apply([(name, entry)])
+
+    def __delitem__(self, name: str):
+        if name not in self.store:
+            raise KeyError(name)
+        self.store.apply([(name, None)])
+
+    def __contains__(self, name) -> bool:
+        return name in self.store
+
+    def __iter__(self):
+        return iter(self.store.names())
+
+    def __len__(self) -> int:
+        return self.store.count()
+
+    def items(self):
+        return self.store.items()
+
+    def values(self):
+        return [entry for _, entry in self.store.items()]